@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Throughput of the forked SO_REUSEPORT server from 1 to N worker processes.
+
+    usage: bench_workers.py [max workers] [seconds per step] [port]
+
+    Every step starts a fresh forked server and drives it with two load processes per worker, each keeping a number of
+    pipelined FC03 reads of 125 registers in flight. Load processes compete with the workers for cores, so run it on a
+    machine with at least twice as many cores as the largest worker count to see the actual scaling.
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modbus import server, slaves, store
+
+
+# [globals] ############################################################################################################
+
+HOST             = '127.0.0.1'
+CONNECTIONS      = 4    # per load process
+PIPELINE_DEPTH   = 8    # requests in flight per connection
+REGISTER_COUNT   = 125
+REQUEST          = struct.pack('>HHHBBHH', 1, 0, 6, 1, 3, 0, REGISTER_COUNT)
+RESPONSE_SIZE    = 9 + REGISTER_COUNT * 2
+
+
+# [start_server] #######################################################################################################
+
+def start_server(port, workers):
+
+    pid = os.fork()
+
+    if pid == 0:
+        registry = slaves.SlaveRegistry()
+        registry.add(1, store.DataStore())
+
+        try:
+            server.serve_forked(HOST, port, registry, 128, workers)
+        finally:
+            os._exit(0)
+
+    # wait for the listeners
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, port)).close()
+            break
+        except socket.error:
+            time.sleep(0.05)
+
+    return pid
+
+
+# [generate_load] ######################################################################################################
+
+def generate_load(port, seconds, results):
+
+    connections = []
+
+    for _ in range(CONNECTIONS):
+        client = socket.create_connection((HOST, port))
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client.sendall(REQUEST * PIPELINE_DEPTH)
+        connections.append(client)
+
+    pending   = dict((client, 0) for client in connections)
+    responses = 0
+    deadline  = time.time() + seconds
+
+    while time.time() < deadline:
+        readable, _, _ = select.select(connections, [], [], 0.1)
+
+        for client in readable:
+            received          = len(client.recv(65536)) + pending[client]
+            completed         = received / RESPONSE_SIZE
+            pending[client]   = received % RESPONSE_SIZE
+            responses        += completed
+
+            if completed:
+                client.sendall(REQUEST * completed)
+
+    for client in connections:
+        client.close()
+
+    results.put(responses)
+
+
+# [measure] ############################################################################################################
+
+def measure(port, workers, seconds):
+
+    server_pid = start_server(port, workers)
+    results    = multiprocessing.Queue()
+    loaders    = [multiprocessing.Process(target=generate_load, args=(port, seconds, results))
+                  for _ in range(2 * workers)]
+
+    for loader in loaders:
+        loader.start()
+
+    total = sum(results.get() for _ in loaders)
+
+    for loader in loaders:
+        loader.join()
+
+    os.kill(server_pid, signal.SIGTERM)
+    os.waitpid(server_pid, 0)
+
+    return total / float(seconds)
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    seconds     = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    port        = int(sys.argv[3]) if len(sys.argv) > 3 else 15020
+    baseline    = None
+
+    print 'cpus: %d, fc03 x %d registers, %d connections x %d in flight per load process' % (
+        multiprocessing.cpu_count(), REGISTER_COUNT, CONNECTIONS, PIPELINE_DEPTH)
+
+    for workers in range(1, max_workers + 1):
+        rate     = measure(port, workers, seconds)
+        baseline = baseline or rate
+
+        print 'workers: %2d  requests/s: %10.0f  speedup: %5.2fx' % (workers, rate, rate / baseline)
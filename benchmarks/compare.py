@@ -0,0 +1,70 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Compares two result files of run.py (or micro.py / loopback.py). Exits with status 1 when any benchmark got worse
+    than the threshold, in percent of the baseline value.
+
+    usage: compare.py BASELINE_FILE RESULT_FILE [--threshold PERCENT]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import json
+import sys
+
+
+# [compare] ############################################################################################################
+
+def compare(baseline, result, threshold):
+
+    """
+    Returns (name, baseline value, value, change in percent, regressed) for every benchmark present in both runs. A
+    positive change is always an improvement, whichever direction is better for the benchmark.
+    """
+
+    rows = []
+
+    for name in sorted(set(baseline) & set(result)):
+        before = baseline[name]['value']
+        after  = result[name]['value']
+
+        if before == 0:
+            continue
+
+        change = (after - before) / float(before) * 100
+
+        if baseline[name].get('better', 'lower') == 'lower':
+            change = -change
+
+        rows.append((name, before, after, change, change < -threshold))
+
+    return rows
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='compare two benchmark runs')
+    parser.add_argument('baseline')
+    parser.add_argument('result')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+
+    options   = parser.parse_args()
+    baseline  = json.load(open(options.baseline))['results']
+    result    = json.load(open(options.result))['results']
+    rows      = compare(baseline, result, options.threshold)
+    regressed = [row for row in rows if row[4]]
+
+    for name, before, after, change, is_regression in rows:
+        print '%-45s %14.3f %14.3f %+8.1f%% %s' % (name, before, after, change, 'REGRESSION' if is_regression else '')
+
+    for name in sorted(set(baseline) ^ set(result)):
+        print '%-45s only in %s' % (name, 'baseline' if name in baseline else 'result')
+
+    if regressed:
+        print '%d of %d benchmarks regressed by more than %.1f%%' % (len(regressed), len(rows), options.threshold)
+        sys.exit(1)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    End to end benchmarks over loopback: a modemu server in a child process driven by the load generator of client.py,
+    plus the resident memory a slave costs.
+
+    usage: loopback.py [--quick] [--output RESULT_FILE]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import json
+import os
+import resource
+import signal
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import client
+
+from modbus import globals as g, server, slaves, store
+
+
+# [globals] ############################################################################################################
+
+HOST         = '127.0.0.1'
+SLAVE_COUNT  = 64
+MEMORY_UNITS = 200
+
+SCENARIOS = [
+    # name, connections, pipeline, profile
+    ('fc03_125', 8, 8, {"requests": [{"functionCode": 3, "start": "0-9000", "count": 125, "unitIds": 1}]}),
+    ('fc01_2000', 8, 8, {"requests": [{"functionCode": 1, "start": "0-9000", "count": 2000, "unitIds": 1}]}),
+    ('fc16_123', 8, 8, {"requests": [{"functionCode": 16, "start": "0-9000", "count": 123, "unitIds": 1}]}),
+    ('mixed', 8, 4, json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                'client_profile.json'))))
+]
+
+
+# [start_server] #######################################################################################################
+
+def start_server():
+
+    """
+    Forks a server on an ephemeral port, returns its pid and port.
+    """
+
+    reader, writer = os.pipe()
+    pid            = os.fork()
+
+    if pid == 0:
+        os.close(reader)
+
+        try:
+            template = store.DataStore()
+            registry = slaves.SlaveRegistry()
+
+            template.set_registers(g.TABLE_ANALOG_INPUT_REGISTERS, 0, range(10000))
+
+            for unit_id in range(1, SLAVE_COUNT + 1):
+                registry.add(unit_id, store.DataStore(template=template))
+
+            modbus_server = server.Server(HOST, 0, registry, 128)
+            modbus_server.listen()
+
+            os.write(writer, str(modbus_server.socket_server.getsockname()[1]))
+            os.close(writer)
+
+            modbus_server.serve_forever()
+        finally:
+            os._exit(0)
+
+    os.close(writer)
+    port = int(os.read(reader, 16))
+    os.close(reader)
+
+    return pid, port
+
+
+# [resident_bytes] #####################################################################################################
+
+def resident_bytes():
+
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+# [measure_memory] #####################################################################################################
+
+def measure_memory():
+
+    """
+    Resident bytes per idle (never written, copy-on-write) slave and per written slave, measured in a child process.
+    """
+
+    reader, writer = os.pipe()
+    pid            = os.fork()
+
+    if pid == 0:
+        os.close(reader)
+
+        try:
+            template = store.DataStore()
+            template.set_registers(g.TABLE_ANALOG_INPUT_REGISTERS, 0, [1])
+
+            before = resident_bytes()
+            idle   = [store.DataStore(template=template) for _ in range(MEMORY_UNITS)]
+            middle = resident_bytes()
+
+            for data_store in idle:
+                data_store.set_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, 0, [1])
+
+            after = resident_bytes()
+
+            os.write(writer, json.dumps([(middle - before) / float(MEMORY_UNITS),
+                                         (after - middle) / float(MEMORY_UNITS)]))
+        finally:
+            os._exit(0)
+
+    os.close(writer)
+
+    data = ''
+
+    while True:
+        chunk = os.read(reader, 4096)
+
+        if not chunk:
+            break
+
+        data += chunk
+
+    os.close(reader)
+    os.waitpid(pid, 0)
+
+    return json.loads(data)
+
+
+# [run] ################################################################################################################
+
+def run(quick=False):
+
+    results = {}
+
+    for name, connections, pipeline, profile in SCENARIOS:
+        pid, port = start_server()
+
+        try:
+            options = argparse.Namespace(host=HOST, port=port, connections=connections, pipeline=pipeline,
+                                         processes=1, duration=1.0 if quick else 5.0, seed=1)
+            result  = client.run(options, profile)
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+        results['loopback.%s.requests_per_s' % name] = {
+            'value': result['requests_per_s'], 'unit': 'requests/s', 'better': 'higher'
+        }
+
+        for percentile in ('p50', 'p99', 'p999'):
+            results['loopback.%s.latency_%s' % (name, percentile)] = {
+                'value': result['latency_us'][percentile], 'unit': 'us', 'better': 'lower'
+            }
+
+    if os.path.exists('/proc/self/statm'):
+        idle, written = measure_memory()
+
+        results['memory.idle_slave_bytes']    = {'value': idle, 'unit': 'bytes', 'better': 'lower'}
+        results['memory.written_slave_bytes'] = {'value': written, 'unit': 'bytes', 'better': 'lower'}
+
+    return results
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='loopback end to end benchmarks')
+    parser.add_argument('--quick', action='store_true', help='short runs, for smoke testing only')
+    parser.add_argument('--output', help='write the results to this file as json')
+
+    options = parser.parse_args()
+    results = run(options.quick)
+
+    for name in sorted(results):
+        print '%-45s %14.3f %s' % (name, results[name]['value'], results[name]['unit'])
+
+    if options.output:
+        json.dump({'results': results}, open(options.output, 'w'), indent=2, sort_keys=True)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Micro benchmarks of the codec: Request parsing, every Response.create_pdu_fc0x and the byte_utils conversions,
+    across request sizes. Every result is the best per operation time out of a few repeats, in microseconds.
+
+    usage: micro.py [--quick] [--output RESULT_FILE]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modbus import byte_utils, globals as g, request, response, store
+
+
+# [globals] ############################################################################################################
+
+READ_SIZES     = {1: (1, 256, 2000), 2: (1, 256, 2000), 3: (1, 16, 125), 4: (1, 16, 125)}
+REPEAT         = 5
+TARGET_SECONDS = 0.2  # per repeat, iterations are calibrated to roughly this
+
+
+# [read_frame] #########################################################################################################
+
+def read_frame(function_code, start, count):
+
+    return struct.pack('>HHHBBHH', 1, 0, 6, 1, function_code, start, count)
+
+
+# [write_frames] #######################################################################################################
+
+def write_frames():
+
+    rng    = random.Random(1)
+    coils  = ''.join(chr(rng.randint(0, 255)) for _ in range(246))
+    values = ''.join(struct.pack('>H', rng.randint(0, 65535)) for _ in range(123))
+
+    return {
+        'fc05':      struct.pack('>HHHBBHH', 1, 0, 6, 1, 5, 100, 0xFF00),
+        'fc06':      struct.pack('>HHHBBHH', 1, 0, 6, 1, 6, 100, 0x1234),
+        'fc15_1968': struct.pack('>HHHBBHHB', 1, 0, 7 + 246, 1, 15, 3, 1968, 246) + coils,
+        'fc16_123':  struct.pack('>HHHBBHHB', 1, 0, 7 + 246, 1, 16, 100, 123, 246) + values
+    }
+
+
+# [measure] ############################################################################################################
+
+def measure(function, quick):
+
+    """
+    Best time of one call in microseconds.
+    """
+
+    target  = 0.01 if quick else TARGET_SECONDS
+    number  = 1
+    elapsed = timeit.timeit(function, number=number)
+
+    while elapsed < target / 10:
+        number  *= 10
+        elapsed  = timeit.timeit(function, number=number)
+
+    number = max(1, int(number * target / elapsed))
+
+    return min(timeit.repeat(function, number=number, repeat=2 if quick else REPEAT)) / number * 1e6
+
+
+# [run] ################################################################################################################
+
+def run(quick=False):
+
+    data_store = store.DataStore()
+    results    = {}
+    rng        = random.Random(1)
+
+    data_store.set_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 0, [rng.randint(0, 1) for _ in range(4096)])
+    data_store.set_bits(g.TABLE_DISCRETE_INPUT_CONTACTS, 0, [rng.randint(0, 1) for _ in range(4096)])
+    data_store.set_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, 0, [rng.randint(0, 65535) for _ in range(1024)])
+    data_store.set_registers(g.TABLE_ANALOG_INPUT_REGISTERS, 0, [rng.randint(0, 65535) for _ in range(1024)])
+
+    # reads - the unaligned start exercises the bit shifting path of fc01 / fc02
+    for function_code, sizes in sorted(READ_SIZES.items()):
+        for count in sizes:
+            frame = read_frame(function_code, 3, count)
+            req   = request.Request(frame)
+            name  = 'fc%02d_%d' % (function_code, count)
+
+            results['request.' + name]  = measure(lambda: request.Request(frame), quick)
+            results['response.' + name] = measure(lambda: response.Response(req, data_store).out(), quick)
+
+    # writes are applied to a scratch store, a response includes the store update
+    scratch = store.DataStore(bytearray(store.STORE_SIZE))
+
+    for name, frame in sorted(write_frames().items()):
+        req = request.Request(frame)
+
+        results['request.' + name]  = measure(lambda: request.Request(frame), quick)
+        results['response.' + name] = measure(lambda: response.Response(req, scratch).out(), quick)
+
+    results['byte_utils.to_u16']   = measure(lambda: byte_utils.to_u16('\x12\x34'), quick)
+    results['byte_utils.to_u8']    = measure(lambda: byte_utils.to_u8('\x12'), quick)
+    results['byte_utils.from_u16'] = measure(lambda: byte_utils.from_u16(0x1234), quick)
+    results['byte_utils.from_u8']  = measure(lambda: byte_utils.from_u8(0x12), quick)
+
+    for size in (1, 32, 250):
+        packed   = ''.join(chr(rng.randint(0, 255)) for _ in range(size))
+        unpacked = byte_utils.unpack_bits(packed)
+
+        results['byte_utils.unpack_bits_%d' % size] = measure(lambda: byte_utils.unpack_bits(packed), quick)
+        results['byte_utils.pack_bits_%d' % size]   = measure(lambda: byte_utils.pack_bits(unpacked), quick)
+
+    return dict(('micro.%s' % name, {'value': value, 'unit': 'us', 'better': 'lower'})
+                for name, value in results.items())
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='codec micro benchmarks')
+    parser.add_argument('--quick', action='store_true', help='short runs, for smoke testing only')
+    parser.add_argument('--output', help='write the results to this file as json')
+
+    options = parser.parse_args()
+    results = run(options.quick)
+
+    for name in sorted(results):
+        print '%-40s %10.3f %s' % (name, results[name]['value'], results[name]['unit'])
+
+    if options.output:
+        json.dump({'results': results}, open(options.output, 'w'), indent=2, sort_keys=True)
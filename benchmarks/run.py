@@ -0,0 +1,66 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Runs the micro, loopback and concurrent update benchmarks and writes one machine readable result file for
+    compare.py.
+
+    usage: run.py [--quick] [--skip-loopback] --output RESULT_FILE
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import loopback
+import micro
+import updates
+
+
+# [revision] ###########################################################################################################
+
+def revision():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='modemu benchmark suite')
+    parser.add_argument('--quick', action='store_true', help='short runs, for smoke testing only')
+    parser.add_argument('--skip-loopback', action='store_true', help='micro benchmarks only')
+    parser.add_argument('--output', required=True, help='write the results to this file as json')
+
+    options = parser.parse_args()
+    results = micro.run(options.quick)
+
+    if not options.skip_loopback:
+        results.update(loopback.run(options.quick))
+        results.update(updates.run(options.quick))
+
+    for name in sorted(results):
+        print '%-45s %14.3f %s' % (name, results[name]['value'], results[name]['unit'])
+
+    json.dump({
+        'meta'   : {
+            'time'    : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': revision(),
+            'python'  : sys.version.split()[0],
+            'machine' : platform.platform(),
+            'quick'   : options.quick
+        },
+        'results': results
+    }, open(options.output, 'w'), indent=2, sort_keys=True)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Read throughput while another process keeps updating the registers being read, the way an external simulator
+    feeds a forked server through its shared stores. Every update writes a block of registers all set to the same
+    counter value, every read covers exactly one block: a read returning mixed values saw part of an update and is
+    counted as torn.
+
+    usage: updates.py [--quick] [--rate REGISTERS_PER_SECOND] [--output RESULT_FILE]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import client
+
+from modbus import globals as g, server, slaves, store
+
+
+# [globals] ############################################################################################################
+
+HOST         = '127.0.0.1'
+BLOCK_SIZE   = 125   # registers per update and per read
+BLOCK_COUNT  = 64
+DEFAULT_RATE = 100000  # register values updated per second
+VERIFY_READS = 2000
+
+READ_FRAME = struct.Struct('>HHHBBHH')
+
+
+# [start_server] #######################################################################################################
+
+def start_server(registry):
+
+    """
+    Forks a server on an ephemeral port serving the shared stores of `registry`, returns its pid and port.
+    """
+
+    reader, writer = os.pipe()
+    pid            = os.fork()
+
+    if pid == 0:
+        os.close(reader)
+
+        try:
+            modbus_server = server.Server(HOST, 0, registry, 128)
+            modbus_server.listen()
+
+            os.write(writer, str(modbus_server.socket_server.getsockname()[1]))
+            os.close(writer)
+
+            modbus_server.serve_forever()
+        finally:
+            os._exit(0)
+
+    os.close(writer)
+    port = int(os.read(reader, 16))
+    os.close(reader)
+
+    return pid, port
+
+
+# [start_updater] ######################################################################################################
+
+def start_updater(registry, rate):
+
+    """
+    Forks a process writing `rate` register values per second, one block at a time, until it is sent SIGTERM - it then
+    reports the number of blocks written. Returns its pid and the read end of its report pipe.
+    """
+
+    reader, writer = os.pipe()
+    pid            = os.fork()
+
+    if pid == 0:
+        os.close(reader)
+
+        stopped  = []
+        interval = BLOCK_SIZE / float(rate)
+
+        # the write in progress is finished first, a store is never left in the middle of one
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+
+        try:
+            data_store = registry.get(1)
+            written    = 0
+            next_write = time.time()
+
+            while not stopped:
+                block = written % BLOCK_COUNT
+                data_store.set_registers(g.TABLE_ANALOG_INPUT_REGISTERS, block * BLOCK_SIZE,
+                                         array('H', [written & 0xFFFF]) * BLOCK_SIZE)
+                written    += 1
+                next_write += interval
+
+                delay = next_write - time.time()
+
+                if delay > 0:
+                    time.sleep(delay)
+
+            os.write(writer, str(written))
+        finally:
+            os._exit(0)
+
+    os.close(writer)
+
+    return pid, reader
+
+
+# [stop_updater] #######################################################################################################
+
+def stop_updater(pid, reader):
+
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+    written = int(os.read(reader, 32) or 0)
+    os.close(reader)
+
+    return written
+
+
+# [count_torn] #########################################################################################################
+
+def count_torn(port, reads):
+
+    """
+    Reads whole blocks one after the other, returns how many of them mixed the values of two updates.
+    """
+
+    connection = socket.create_connection((HOST, port))
+    torn       = 0
+    size       = 9 + BLOCK_SIZE * 2
+
+    try:
+        for index in range(reads):
+            block = index % BLOCK_COUNT
+            connection.sendall(READ_FRAME.pack(index & 0xFFFF, 0, 6, 1, g.FUNC_04_READ_INPUT_REGISTERS,
+                                               block * BLOCK_SIZE, BLOCK_SIZE))
+            data = ''
+
+            while len(data) < size:
+                chunk = connection.recv(size - len(data))
+
+                if not chunk:
+                    raise Exception('Server closed the connection')
+
+                data += chunk
+
+            if len(set(struct.unpack('>%dH' % BLOCK_SIZE, data[9:]))) > 1:
+                torn += 1
+    finally:
+        connection.close()
+
+    return torn
+
+
+# [measure] ############################################################################################################
+
+def measure(rate, duration):
+
+    """
+    Read throughput and torn reads, with an updater running unless `rate` is 0.
+    """
+
+    registry = slaves.SlaveRegistry()
+    registry.add(1, store.DataStore())
+    registry.share()
+
+    pid, port = start_server(registry)
+    updater   = start_updater(registry, rate) if rate else None
+    started   = time.time()
+
+    try:
+        profile = {"requests": [{"functionCode": g.FUNC_04_READ_INPUT_REGISTERS,
+                                 "start": "0-%d" % ((BLOCK_COUNT - 1) * BLOCK_SIZE), "count": BLOCK_SIZE,
+                                 "unitIds": 1}]}
+        options = argparse.Namespace(host=HOST, port=port, connections=8, pipeline=8, processes=1,
+                                     duration=duration, seed=1)
+        result  = client.run(options, profile)
+        torn    = count_torn(port, VERIFY_READS)
+    finally:
+        written = stop_updater(*updater) if updater is not None else 0
+
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    return result['requests_per_s'], torn, written * BLOCK_SIZE / (time.time() - started)
+
+
+# [run] ################################################################################################################
+
+def run(quick=False, rate=DEFAULT_RATE):
+
+    duration                      = 1.0 if quick else 5.0
+    idle_reads, _, _              = measure(0, duration)
+    updated_reads, torn, achieved = measure(rate, duration)
+
+    return {
+        'updates.reads_idle.requests_per_s'    : {'value': idle_reads, 'unit': 'requests/s', 'better': 'higher'},
+        'updates.reads_updating.requests_per_s': {'value': updated_reads, 'unit': 'requests/s', 'better': 'higher'},
+        'updates.register_updates_per_s'       : {'value': achieved, 'unit': 'registers/s', 'better': 'higher'},
+        'updates.torn_reads'                   : {'value': torn, 'unit': 'reads', 'better': 'lower'}
+    }
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='read throughput under concurrent updates')
+    parser.add_argument('--quick', action='store_true', help='short runs, for smoke testing only')
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE, help='register values updated per second')
+    parser.add_argument('--output', help='write the results to this file as json')
+
+    options = parser.parse_args()
+    results = run(options.quick, options.rate)
+
+    for name in sorted(results):
+        print '%-45s %14.3f %s' % (name, results[name]['value'], results[name]['unit'])
+
+    if options.output:
+        json.dump({'results': results}, open(options.output, 'w'), indent=2, sort_keys=True)
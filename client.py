@@ -1,23 +1,346 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
 
+"""
+    MODBUS/TCP load generator.
+
+    Opens a number of connections per process, keeps a number of pipelined requests in flight on each of them and
+    draws the requests from a profile mixing function codes, address ranges and unit ids. Reports throughput and
+    latency percentiles of every answered request.
+
+    usage: client.py [--host HOST] [--port PORT] [--connections N] [--pipeline M] [--processes P]
+                     [--duration SECONDS] [--profile client_profile.json] [--json RESULT_FILE]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import Queue
+import argparse
+import errno
+import json
+import multiprocessing
+import random
 import socket
+import struct
+import sys
+import time
+
+from modbus import codec, framer, histogram, server, slaves
+
+
+# [globals] ############################################################################################################
+
+DEFAULT_PROFILE = {
+    "requests": [
+        {"functionCode": 3, "start": 6000, "count": 6, "unitIds": 1}
+    ]
+}
+
+READ_FRAME       = struct.Struct('>HHHBBHH')     # mbap header, function code, start reference, count / value
+MULTIPLE_FRAME   = struct.Struct('>HHHBBHHB')    # mbap header, function code, start reference, count, byte count
+MASK_WRITE_FRAME = struct.Struct('>HHHBBHHH')    # mbap header, function code, reference, and mask, or mask
+READ_WRITE_FRAME = struct.Struct('>HHHBBHHHHB')  # mbap header, function code, read and write start / count, bytes
+
+FRAMES_PER_ENTRY = 64    # distinct frames pre-built per profile entry
+SCHEDULE_SIZE    = 4096  # weighted round robin of pre-built frames
+DRAIN_TIMEOUT    = 1.0   # seconds to wait for in flight requests at the end of the run
+RESULT_TIMEOUT   = 1.0   # seconds between two checks for load processes gone without reporting
+
+
+# [build_frame] ########################################################################################################
+
+def build_frame(rng, function_code, start, count, unit_id):
+
+    if function_code in (1, 2, 3, 4):
+        return bytearray(READ_FRAME.pack(0, 0, 6, unit_id, function_code, start, count))
+
+    if function_code == 5:
+        return bytearray(READ_FRAME.pack(0, 0, 6, unit_id, function_code, start, rng.choice((0x0000, 0xFF00))))
+
+    if function_code == 6:
+        return bytearray(READ_FRAME.pack(0, 0, 6, unit_id, function_code, start, rng.randint(0, 65535)))
+
+    if function_code == 22:
+        return bytearray(MASK_WRITE_FRAME.pack(0, 0, 8, unit_id, function_code, start, rng.randint(0, 65535),
+                                               rng.randint(0, 65535)))
+
+    if function_code == 23:
+        # reads `count` registers from `start` and writes as many, capped to a valid write count, in place
+        writes = min(count, 121)
+        data   = ''.join(struct.pack('>H', rng.randint(0, 65535)) for _ in range(writes))
+
+        return bytearray(READ_WRITE_FRAME.pack(0, 0, 11 + len(data), unit_id, function_code, start, count, start,
+                                               writes, len(data)) + data)
+
+    if function_code == 15:
+        data = ''.join(chr(rng.randint(0, 255)) for _ in range((count + 7) / 8))
+    elif function_code == 16:
+        data = ''.join(struct.pack('>H', rng.randint(0, 65535)) for _ in range(count))
+    else:
+        raise Exception('Not supported function code in profile: %d' % function_code)
+
+    return bytearray(MULTIPLE_FRAME.pack(0, 0, 7 + len(data), unit_id, function_code, start, count, len(data)) + data)
+
+
+# [build_schedule] #####################################################################################################
+
+def build_schedule(profile, seed):
+
+    """
+    Pre-builds every request frame so the send path only patches transaction ids. The start references of an entry
+    are written as the addresses of the config file: 100, "0-9000" or a list of both forms.
+    """
+
+    rng     = random.Random(seed)
+    entries = []
+
+    for entry in profile["requests"]:
+        count    = entry.get("count", 1)
+        unit_ids = slaves.parse_unit_ids(entry.get("unitIds", 1))
+        starts   = [(first, min(last, 65536 - count)) for first, last in slaves.parse_addresses(entry.get("start", 0))]
+        frames   = [build_frame(rng, entry["functionCode"], rng.randint(*rng.choice(starts)), count,
+                                rng.choice(unit_ids)) for _ in range(FRAMES_PER_ENTRY)]
+
+        entries.append((entry.get("weight", 1), frames))
+
+    total_weight = float(sum(weight for weight, _ in entries))
+    schedule     = []
+
+    for weight, frames in entries:
+        schedule.extend(rng.choice(frames) for _ in range(max(1, int(SCHEDULE_SIZE * weight / total_weight))))
+
+    rng.shuffle(schedule)
+
+    return schedule
+
+
+# [LoadConnection] #####################################################################################################
+
+class LoadConnection:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, host, port):
+
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(0)
+
+        self.fd             = self.socket.fileno()
+        self.framer         = framer.Framer()
+        self.in_flight      = {}  # transaction id -> send time
+        self.transaction_id = 0
+        self.out_buffer     = bytearray()
+        self.writing        = True
+
+
+# [generate_load] ######################################################################################################
+
+def generate_load(options, profile, seed, results):
+
+    """
+    Body of a load process, it always reports to `results`: a run cut short by an error (connection refused or closed
+    by the server) reports that single error and nothing else.
+    """
+
+    try:
+        result = drive_load(options, profile, seed)
+    except Exception as e:
+        sys.stderr.write('load process failed: %s\n' % e)
+        result = (0, 0, 1, 0.0, histogram.Histogram().dump())
+
+    results.put(result)
+
+
+# [drive_load] #########################################################################################################
+
+def drive_load(options, profile, seed):
+
+    schedule    = build_schedule(profile, seed)
+    position    = 0
+    poller      = server.Poller()
+    connections = {}
+    latencies   = histogram.Histogram()
+    responses   = 0
+    exceptions  = 0
+    errors      = 0
+
+    for _ in range(options.connections):
+        connection                 = LoadConnection(options.host, options.port)
+        connections[connection.fd] = connection
+        poller.register(connection.fd, server.EVENT_READ | server.EVENT_WRITE)
+
+    started  = time.time()
+    deadline = started + options.duration
+    sending  = True
+
+    while connections:
+        now = time.time()
+
+        if sending and now >= deadline:
+            sending = False
+        elif not sending and (now >= deadline + DRAIN_TIMEOUT or
+                              not any(connection.in_flight for connection in connections.values())):
+            break
+
+        for fd, events in poller.poll(0.1):
+            connection = connections[fd]
+
+            if events & server.EVENT_READ:
+                try:
+                    received = connection.framer.recv_into(connection.socket)
+                except socket.error as e:
+                    if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        raise
+                    received = -1
+
+                if received == 0:
+                    raise Exception('Connection closed by server')
+
+                received_at = time.time()
+
+                while True:
+                    frame = connection.framer.next_frame()
+
+                    if frame is None:
+                        break
+
+                    transaction_id, _, _, _ = codec.MBAP_HEADER.unpack_from(frame)
+                    function_code           = codec.FUNCTION_CODE.unpack_from(frame, codec.PDU_OFFSET)[0]
+                    sent_at                 = connection.in_flight.pop(transaction_id, None)
+
+                    if sent_at is None:
+                        errors += 1
+                        continue
+
+                    responses += 1
+                    latencies.record((received_at - sent_at) * 1e6)
+
+                    if function_code & codec.EXCEPTION_BIT:
+                        exceptions += 1
+
+            # top the pipeline up
+            if sending:
+                sent_at = time.time()
+
+                while len(connection.in_flight) < options.pipeline:
+                    frame    = schedule[position]
+                    position = (position + 1) % len(schedule)
+
+                    connection.transaction_id = (connection.transaction_id + 1) & 0xFFFF
+                    connection.in_flight[connection.transaction_id] = sent_at
+
+                    codec.TRANSACTION_ID.pack_into(frame, 0, connection.transaction_id)
+                    connection.out_buffer += frame
+
+            if connection.out_buffer:
+                try:
+                    sent = connection.socket.send(connection.out_buffer)
+                except socket.error as e:
+                    if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        raise
+                    sent = 0
+
+                del connection.out_buffer[:sent]
+
+            writing = len(connection.out_buffer) > 0
+
+            if writing != connection.writing:
+                connection.writing = writing
+                poller.modify(fd, server.EVENT_READ | server.EVENT_WRITE if writing else server.EVENT_READ)
+
+    elapsed = min(time.time(), deadline) - started
+
+    for connection in connections.values():
+        connection.socket.close()
+
+    return responses, exceptions, errors, elapsed, latencies.dump()
+
+
+# [run] ################################################################################################################
+
+def run(options, profile):
+
+    results   = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=generate_load, args=(options, profile, options.seed + i, results))
+                 for i in range(options.processes)]
+
+    for process in processes:
+        process.start()
+
+    responses  = 0
+    exceptions = 0
+    errors     = 0
+    elapsed    = 0.0
+    latencies  = histogram.Histogram()
+
+    for _ in processes:
+        try:
+            result = results.get(timeout=RESULT_TIMEOUT)
+        except Queue.Empty:
+            result = None
+
+        while result is None and any(process.is_alive() for process in processes):
+            try:
+                result = results.get(timeout=RESULT_TIMEOUT)
+            except Queue.Empty:
+                pass
+
+        if result is None:
+            # a load process died without reporting, killed by a signal for instance
+            errors += 1
+            continue
+
+        process_responses, process_exceptions, process_errors, process_elapsed, state = result
+
+        responses  += process_responses
+        exceptions += process_exceptions
+        errors     += process_errors
+        elapsed     = max(elapsed, process_elapsed)
+
+        latencies.merge(histogram.Histogram.load(state))
+
+    for process in processes:
+        process.join()
+
+    return {
+        'connections'   : options.connections * options.processes,
+        'pipeline'      : options.pipeline,
+        'duration'      : elapsed,
+        'responses'     : responses,
+        'exceptions'    : exceptions,
+        'errors'        : errors,
+        'requests_per_s': responses / elapsed if elapsed else 0.0,
+        'latency_us'    : latencies.to_dict()
+    }
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    parser = argparse.ArgumentParser(description='MODBUS/TCP load generator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1502)
+    parser.add_argument('--connections', type=int, default=8, help='connections per process')
+    parser.add_argument('--pipeline', type=int, default=4, help='requests in flight per connection')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--profile', help='json request mix, see client_profile.json')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the result to this file as json')
 
-s.connect(("192.168.1.66", 1502))
+    options = parser.parse_args()
+    profile = json.load(open(options.profile)) if options.profile else DEFAULT_PROFILE
+    result  = run(options, profile)
+    latency = result['latency_us']
 
-data = [
-    chr(0x00), chr(0x12),  # Transaction ID - Master increases with on every request
-    chr(0x00), chr(0x00),  # Protocol Identifier - 0 for MODBUS Standard Protocol
-    chr(0x00), chr(0x06),  # Message Length
-    chr(0x01),             # Unit ID
-    chr(0x03),             # Function Code
-    chr(0x17), chr(0x70),  # Start Reference
-    chr(0x00), chr(0x06)   # Register Count
-]
+    print 'connections: %d x %d in flight, %.1f s' % (result['connections'], result['pipeline'], result['duration'])
+    print 'requests   : %d (%.0f/s), exceptions: %d, errors: %d' % (
+        result['responses'], result['requests_per_s'], result['exceptions'], result['errors'])
+    print 'latency us : mean %.1f  p50 %.1f  p99 %.1f  p999 %.1f  max %.1f' % (
+        latency['mean'], latency['p50'], latency['p99'], latency['p999'], latency['max'])
 
-s.send(''.join(data))
-received_data = s.recv(1024)
-s.close
-print list(received_data)
+    if options.json:
+        json.dump(result, open(options.json, 'w'), indent=2, sort_keys=True)
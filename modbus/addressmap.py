@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import bisect
+
+import globals as g
+import store
+
+
+# [globals] ############################################################################################################
+
+# function code -> table its addresses refer to, fc23 reads and writes the holding registers
+FUNCTION_TABLES = {
+    g.FUNC_01_READ_COIL_STATUS             : g.TABLE_DISCRETE_OUTPUT_COILS,
+    g.FUNC_02_READ_INPUT_STATUS            : g.TABLE_DISCRETE_INPUT_CONTACTS,
+    g.FUNC_03_READ_HOLDING_REGISTERS       : g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    g.FUNC_04_READ_INPUT_REGISTERS         : g.TABLE_ANALOG_INPUT_REGISTERS,
+    g.FUNC_05_WRITE_SINGLE_COIL            : g.TABLE_DISCRETE_OUTPUT_COILS,
+    g.FUNC_06_WRITE_SINGLE_REGISTER        : g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    g.FUNC_15_WRITE_MULTIPLE_COILS         : g.TABLE_DISCRETE_OUTPUT_COILS,
+    g.FUNC_16_WRITE_MULTIPLE_REGISTERS     : g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    g.FUNC_22_MASK_WRITE_REGISTER          : g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS: g.TABLE_ANALOG_OUTPUT_REGISTERS
+}
+
+# function codes addressing a single coil or register, they carry no count
+SINGLE_ADDRESS = frozenset([g.FUNC_05_WRITE_SINGLE_COIL, g.FUNC_06_WRITE_SINGLE_REGISTER,
+                            g.FUNC_22_MASK_WRITE_REGISTER])
+
+WRITE_FUNCTIONS = frozenset([g.FUNC_05_WRITE_SINGLE_COIL, g.FUNC_06_WRITE_SINGLE_REGISTER,
+                             g.FUNC_15_WRITE_MULTIPLE_COILS, g.FUNC_16_WRITE_MULTIPLE_REGISTERS,
+                             g.FUNC_22_MASK_WRITE_REGISTER, g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS])
+
+
+# [AddressMap] #########################################################################################################
+
+class AddressMap:
+
+    """
+        Address windows a unit exposes, per table. A request touching a single address outside of them is refused
+        with exception 02 like a real device would, before the store is looked at. A table without any window is
+        mapped whole, as are the function codes without addresses (fc08, fc43).
+
+        Windows are kept sorted and merged as two parallel lists of first and past-the-end addresses, so checking a
+        range is one bisect - O(log n) in the number of windows, however many there are.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self):
+
+        self.starts = [None] * store.TABLE_COUNT  # None: the whole table is mapped
+        self.ends   = [None] * store.TABLE_COUNT
+
+    # [add] ------------------------------------------------------------------------------------------------------------
+
+    def add(self, table_id, first, last):
+
+        """
+        Maps `first` to `last` (inclusive) of `table_id`, merged with the windows it overlaps or touches.
+        """
+
+        windows = zip(self.starts[table_id] or [], self.ends[table_id] or [])
+        windows.append((first, last + 1))
+        windows.sort()
+
+        starts = []
+        ends   = []
+
+        for start, end in windows:
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        self.starts[table_id] = starts
+        self.ends[table_id]   = ends
+
+    # [contains] -------------------------------------------------------------------------------------------------------
+
+    def contains(self, table_id, start, count):
+
+        starts = self.starts[table_id]
+
+        if starts is None:
+            return True
+
+        index = bisect.bisect_right(starts, start) - 1
+
+        return index >= 0 and start + count <= self.ends[table_id][index]
+
+    # [check] ----------------------------------------------------------------------------------------------------------
+
+    def check(self, req):
+
+        """
+        Exception code `req` is to be refused with, None when everything it addresses is mapped.
+        """
+
+        table_id = FUNCTION_TABLES.get(req.function_code)
+
+        if table_id is None:
+            return None
+
+        count = 1 if req.function_code in SINGLE_ADDRESS else req.register_count
+
+        if not self.contains(table_id, req.start_reference, count):
+            return g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS
+
+        if (req.function_code == g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS and
+                not self.contains(table_id, req.write_reference, req.write_count)):
+            return g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS
+
+        return None
+
+
+# [written_range] ######################################################################################################
+
+def written_range(req):
+
+    """
+    (table id, start, end) of the values a write request changes, None for requests that write nothing.
+    """
+
+    function_code = req.function_code
+
+    if function_code not in WRITE_FUNCTIONS:
+        return None
+
+    if function_code == g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS:
+        start, count = req.write_reference, req.write_count
+    elif function_code in SINGLE_ADDRESS:
+        start, count = req.start_reference, 1
+    else:
+        start, count = req.start_reference, req.register_count
+
+    return FUNCTION_TABLES[function_code], start, min(start + count, store.TABLE_SIZE)
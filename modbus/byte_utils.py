@@ -1,6 +1,15 @@
 # -*- coding: utf-8 -*-
 
 
+# [globals] ############################################################################################################
+
+# byte -> 8 bytes of 0/1, LSB first
+BIT_UNPACK = [''.join(chr((value >> bit) & 1) for bit in range(8)) for value in range(256)]
+
+# 8 bytes of 0/1, LSB first -> byte
+BIT_PACK = dict((BIT_UNPACK[value], chr(value)) for value in range(256))
+
+
 # [to_u16] #############################################################################################################
 
 def to_u16(chars):
@@ -32,4 +41,28 @@ def from_u16(value):
 
 def from_u8(value):
 
-    return chr(value)
\ No newline at end of file
+    return chr(value)
+
+
+# [unpack_bits] ########################################################################################################
+
+def unpack_bits(packed):
+
+    """
+    Expands LSB first packed bits to one 0/1 byte per bit, a table lookup per byte.
+    """
+
+    return ''.join([BIT_UNPACK[value] for value in bytearray(packed)])
+
+
+# [pack_bits] ##########################################################################################################
+
+def pack_bits(unpacked):
+
+    """
+    Packs one 0/1 byte per bit (length a multiple of 8) LSB first, a table lookup per byte.
+    """
+
+    unpacked = str(unpacked)
+
+    return ''.join([BIT_PACK[unpacked[i:i + 8]] for i in range(0, len(unpacked), 8)])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+from collections import OrderedDict
+
+import codec
+import globals as g
+import response
+
+
+# [globals] ############################################################################################################
+
+READ_TABLES = {
+    g.FUNC_01_READ_COIL_STATUS      : g.TABLE_DISCRETE_OUTPUT_COILS,
+    g.FUNC_02_READ_INPUT_STATUS     : g.TABLE_DISCRETE_INPUT_CONTACTS,
+    g.FUNC_03_READ_HOLDING_REGISTERS: g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    g.FUNC_04_READ_INPUT_REGISTERS  : g.TABLE_ANALOG_INPUT_REGISTERS
+}
+
+
+# [ResponseCache] ######################################################################################################
+
+class ResponseCache:
+
+    """
+        Encoded read responses keyed by (unit id, function code, start reference, register count).
+
+        Masters keep polling the same windows, usually with nothing changed in between. An entry remembers the write
+        generation of its table and is served for as long as the table is still at that generation, only the
+        transaction id is patched into a copy of it. The least recently used entry is evicted once the cache is full.
+
+        Simulated values are written before the generation is looked at: a simulated window is evaluated once per tick,
+        so its responses are served from the cache for the rest of the tick.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, max_entries=4096):
+
+        self.max_entries = max_entries
+        self.entries     = OrderedDict()
+        self.hits        = 0
+        self.misses      = 0
+
+    # [response] -------------------------------------------------------------------------------------------------------
+
+    def response(self, req, data_store):
+
+        """
+        Returns the encoded response to a read request, from the cache when possible.
+        """
+
+        key      = (req.unit_id, req.function_code, req.start_reference, req.register_count)
+        table_id = READ_TABLES[req.function_code]
+
+        if data_store.simulation is not None and req.exception_code is None:
+            # simulated values are written before the generation is taken, they only move it once per tick
+            data_store.simulation.update(data_store, table_id, req.start_reference, req.register_count)
+
+        generation = data_store.generation(table_id)
+        entry      = self.entries.pop(key, None)
+
+        if entry is not None and entry[0] == generation:
+            self.entries[key] = entry  # re-inserted as the most recently used
+            self.hits        += 1
+
+            out = bytearray(entry[1])
+            codec.TRANSACTION_ID.pack_into(out, 0, req.transaction_id)
+
+            return out
+
+        self.misses += 1
+
+        out = response.Response(req, data_store).out()
+
+        # a response built while the table moved on is not cached, it may hold values older than the generation
+        if req.exception_code is None and data_store.generation(table_id) == generation:
+            self.entries[key] = (generation, str(out))
+
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return out
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+
+
+# [globals] ############################################################################################################
+
+MBAP_HEADER    = struct.Struct('>HHHB')  # transaction id, protocol identifier, message length, unit id
+TRANSACTION_ID = struct.Struct('>H')
+FUNCTION_CODE  = struct.Struct('>B')
+
+MBAP_HEADER_SIZE = MBAP_HEADER.size      # 7
+PDU_OFFSET       = MBAP_HEADER_SIZE      # function code
+
+# requests - unpacked right after the function code
+READ_REQUEST           = struct.Struct('>HH')     # start reference, register count
+WRITE_SINGLE_REQUEST   = struct.Struct('>HH')     # reference, data to be written
+WRITE_MULTIPLE_REQUEST = struct.Struct('>HHB')    # start reference, register count, byte count
+DIAGNOSTIC_REQUEST     = struct.Struct('>H')      # sub-function, followed by its data field
+MASK_WRITE_REQUEST     = struct.Struct('>HHH')    # reference, and mask, or mask
+READ_WRITE_REQUEST     = struct.Struct('>HHHHB')  # read start, read count, write start, write count, byte count
+DEVICE_ID_REQUEST      = struct.Struct('>BBB')    # mei type, read device id code, object id
+
+# responses - packed starting at the function code
+READ_RESPONSE           = struct.Struct('>BB')    # function code, byte count
+WRITE_SINGLE_RESPONSE   = struct.Struct('>BHH')   # function code, reference, data written
+WRITE_MULTIPLE_RESPONSE = struct.Struct('>BHH')   # function code, start reference, register count
+EXCEPTION_RESPONSE      = struct.Struct('>BB')    # function code with the error bit set, exception code
+DIAGNOSTIC_RESPONSE     = struct.Struct('>BH')    # function code, sub-function, followed by the data field
+MASK_WRITE_RESPONSE     = struct.Struct('>BHHH')  # function code, reference, and mask, or mask
+# function code, mei type, read device id code, conformity level, more follows, next object id, number of objects
+DEVICE_ID_RESPONSE      = struct.Struct('>BBBBBBB')
+DEVICE_ID_OBJECT        = struct.Struct('>BB')    # object id, object length, followed by the value
+
+EXCEPTION_BIT = 0x80
+MAX_PDU_SIZE  = 253
+
+# longest fc43 object value, one object alone always fits in a response
+MAX_DEVICE_ID_OBJECT_SIZE = MAX_PDU_SIZE - DEVICE_ID_RESPONSE.size - DEVICE_ID_OBJECT.size
+
+EXCEPTION_ADDRESSING = struct.Struct('>HH')  # transaction id, protocol identifier - patched into a template
+
+COMPILED = {}
+
+# (function code, exception code) -> complete exception response but for transaction id, protocol id and unit id,
+# built up front for every function code and the exception codes a request can be refused with (01 - 04)
+EXCEPTION_TEMPLATES = {}
+
+
+# [register_values] ####################################################################################################
+
+def register_values(count):
+
+    """
+    Returns a compiled struct for `count` big endian registers.
+    """
+
+    return compile_cached('>%dH' % count)
+
+
+# [byte_string] ########################################################################################################
+
+def byte_string(count):
+
+    """
+    Returns a compiled struct copying `count` raw bytes out of any buffer as a str.
+    """
+
+    return compile_cached('%ds' % count)
+
+
+# [compile_cached] #####################################################################################################
+
+def compile_cached(format):
+
+    compiled = COMPILED.get(format)
+
+    if compiled is None:
+        compiled = COMPILED[format] = struct.Struct(format)
+
+    return compiled
+
+
+# [exception_template] #################################################################################################
+
+def exception_template(function_code, exception_code):
+
+    """
+    Returns the exception response to `function_code` with `exception_code`, zeroed transaction id and unit id.
+    """
+
+    key      = (function_code, exception_code)
+    template = EXCEPTION_TEMPLATES.get(key)
+
+    if template is None:
+        template = EXCEPTION_TEMPLATES[key] = (MBAP_HEADER.pack(0, 0, EXCEPTION_RESPONSE.size + 1, 0) +
+                                               EXCEPTION_RESPONSE.pack(function_code | EXCEPTION_BIT, exception_code))
+
+    return template
+
+
+# [exception_response] #################################################################################################
+
+def exception_response(req, exception_code):
+
+    """
+    Exception response to `req` copied from its template, nothing of the request but its addressing is looked at.
+    """
+
+    buffer = bytearray(exception_template(req.function_code & 0x7F, exception_code))
+
+    EXCEPTION_ADDRESSING.pack_into(buffer, 0, req.transaction_id, req.protocol_identifier)
+    buffer[MBAP_HEADER_SIZE - 1] = req.unit_id
+
+    return buffer
+
+
+for _function_code in range(EXCEPTION_BIT):
+    for _exception_code in range(1, 5):
+        exception_template(_function_code, _exception_code)
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import collections
+import os
+import sys
+import threading
+import traceback
+
+import addressmap
+import codec
+import globals as g
+import server
+import slaves
+import store
+
+
+# [globals] ############################################################################################################
+
+DEFAULT_PORT            = 1502
+DEFAULT_NOTIFY_INTERVAL = 0.05  # seconds between two batches of write notifications
+
+BIT_TABLES = (g.TABLE_DISCRETE_OUTPUT_COILS, g.TABLE_DISCRETE_INPUT_CONTACTS)
+
+
+# [Subscription] #######################################################################################################
+
+class Subscription:
+
+    """
+        `callback` receives a list of (unit id, table id, start, values) - registers as an array('H'), bits as a
+        bytearray of 0 / 1 - for the ranges written by masters to the `unit_ids` and `table_ids` it is interested in,
+        None for all of them.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, callback, unit_ids=None, table_ids=None):
+
+        self.callback  = callback
+        self.unit_ids  = frozenset(unit_ids) if unit_ids is not None else None
+        self.table_ids = frozenset(table_ids) if table_ids is not None else None
+
+    # [wants] ----------------------------------------------------------------------------------------------------------
+
+    def wants(self, unit_id, table_id):
+
+        return ((self.unit_ids is None or unit_id in self.unit_ids) and
+                (self.table_ids is None or table_id in self.table_ids))
+
+
+# [EmbeddedServer] #####################################################################################################
+
+class EmbeddedServer(server.Server):
+
+    """
+        MODBUS/TCP server to be driven from Python, e.g. by a plant simulator:
+
+            modbus_server = EmbeddedServer(port=1502, unit_ids=[1, 2]).start()
+            modbus_server.subscribe(on_writes, table_ids=[g.TABLE_ANALOG_OUTPUT_REGISTERS])
+            modbus_server.set_range(1, g.TABLE_ANALOG_INPUT_REGISTERS, 0, values)
+            ...
+            modbus_server.stop()
+
+        `start` serves on a thread of its own, serve_forever serves on the calling thread instead.
+
+        set_range / get_range may be called from any thread while serving. Every store gets a buffer of its own and a
+        thread lock: a whole range is written as one copy under one lock, as are the writes of masters, and reads stay
+        lock free (see store.DataStore). Updates should come in ranges rather than value by value, the cost of a call
+        barely depends on its length.
+
+        Writes of masters are queued by the server thread as they are answered - one append per request. A notifier
+        thread wakes every `notify_interval` seconds, merges what was queued per unit, table and overlapping or adjacent
+        range, reads the current values of the merged ranges once and hands them to every interested subscriber in one
+        call. A range written over and over within an interval is notified once, with its latest values. Callbacks run
+        on the notifier thread, an exception in one is printed and the others are still called.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unit_ids=(1,), registry=None, backlog=5,
+                 notify_interval=DEFAULT_NOTIFY_INTERVAL, **options):
+
+        """
+        Serves a zeroed store for each of `unit_ids`, or the stores of `registry` when given - filled by
+        modemu.inject_config for instance. `options` are those of a server.Server.
+        """
+
+        if registry is None:
+            registry = slaves.SlaveRegistry()
+
+            for unit_id in unit_ids:
+                registry.add(unit_id, store.DataStore())
+
+        for unit_id in registry.unit_ids():
+            registry.add(unit_id, thread_safe(registry.get(unit_id)))
+
+        server.Server.__init__(self, host, port, registry, backlog, **options)
+
+        self.notify_interval = notify_interval
+        self.subscriptions   = []
+        self.written         = collections.deque()  # (unit id, table id, start, end) - appended and popped atomically
+        self.stopping        = threading.Event()
+        self.serving         = None
+        self.notifier        = None
+        self.batches         = 0
+        self.writes_notified = 0
+        self.ranges_notified = 0
+
+        self.wake_read_fd, self.wake_write_fd = os.pipe()
+
+    # [start] ----------------------------------------------------------------------------------------------------------
+
+    def start(self):
+
+        """
+        Listens on the calling thread, so a port in use raises right here, then serves in the background.
+        """
+
+        self.listen()
+
+        self.serving  = threading.Thread(target=self.serve_forever, name='modbus')
+        self.notifier = threading.Thread(target=self.notify_all, name='notifier')
+
+        for thread in (self.serving, self.notifier):
+            thread.daemon = True
+            thread.start()
+
+        return self
+
+    # [stop] -----------------------------------------------------------------------------------------------------------
+
+    def stop(self):
+
+        """
+        Stops serving, closes every connection and delivers the writes still queued.
+        """
+
+        self.running = False
+        os.write(self.wake_write_fd, '!')
+
+        if self.serving is not None:
+            self.serving.join()
+
+        self.stopping.set()
+
+        if self.notifier is not None:
+            self.notifier.join()
+
+        self.shutdown()
+
+        os.close(self.wake_read_fd)
+        os.close(self.wake_write_fd)
+
+    # [listen] ---------------------------------------------------------------------------------------------------------
+
+    def listen(self):
+
+        server.Server.listen(self)
+
+        self.poller.register(self.wake_read_fd, server.EVENT_READ)
+
+    # [handle_event] ---------------------------------------------------------------------------------------------------
+
+    def handle_event(self, fd, events):
+
+        if fd == self.wake_read_fd:
+            os.read(self.wake_read_fd, 4096)
+        else:
+            server.Server.handle_event(self, fd, events)
+
+    # [add_unit] -------------------------------------------------------------------------------------------------------
+
+    def add_unit(self, unit_id, data_store=None):
+
+        """
+        Serves `unit_id` from now on, from a zeroed store unless `data_store` is given.
+        """
+
+        self.registry.add(unit_id, thread_safe(data_store if data_store is not None else store.DataStore()))
+
+    # [set_range] ------------------------------------------------------------------------------------------------------
+
+    def set_range(self, unit_id, table_id, start, values):
+
+        """
+        Writes `values` from `start` on: register values 0 - 65535, any iterable, an array('H') is cheapest; bit values
+        are taken as true or false, a bytearray of 0 / 1 is cheapest. Masters see the whole range written or none of it.
+        """
+
+        if table_id in BIT_TABLES:
+            self.data_store(unit_id).set_bits(table_id, start, values)
+        else:
+            self.data_store(unit_id).set_registers(table_id, start, values)
+
+    # [get_range] ------------------------------------------------------------------------------------------------------
+
+    def get_range(self, unit_id, table_id, start, count):
+
+        """
+        Returns `count` values from `start` on, registers as an array('H'), bits as a bytearray of 0 / 1.
+        """
+
+        if table_id in BIT_TABLES:
+            return self.data_store(unit_id).get_bits(table_id, start, count)
+
+        return self.data_store(unit_id).get_registers(table_id, start, count)
+
+    # [data_store] -----------------------------------------------------------------------------------------------------
+
+    def data_store(self, unit_id):
+
+        data_store = self.registry.get(unit_id)
+
+        if data_store is None:
+            raise Exception('Unknown unit id: %d' % unit_id)
+
+        return data_store
+
+    # [subscribe] ------------------------------------------------------------------------------------------------------
+
+    def subscribe(self, callback, unit_ids=None, table_ids=None):
+
+        """
+        Calls `callback` with the ranges masters wrote to, see Subscription. Returns the subscription, to unsubscribe.
+        """
+
+        subscription       = Subscription(callback, unit_ids, table_ids)
+        self.subscriptions = self.subscriptions + [subscription]
+
+        return subscription
+
+    # [unsubscribe] ----------------------------------------------------------------------------------------------------
+
+    def unsubscribe(self, subscription):
+
+        self.subscriptions = [other for other in self.subscriptions if other is not subscription]
+
+    # [process] --------------------------------------------------------------------------------------------------------
+
+    def process(self, connection_id, frame):
+
+        req, out = server.Server.process(self, connection_id, frame)
+
+        if (self.subscriptions and req.function_code in addressmap.WRITE_FUNCTIONS and
+                not out[codec.PDU_OFFSET] & codec.EXCEPTION_BIT):
+            table_id, start, end = addressmap.written_range(req)
+            self.written.append((req.unit_id, table_id, start, end))
+
+        return req, out
+
+    # [notify_all] -----------------------------------------------------------------------------------------------------
+
+    def notify_all(self):
+
+        while not self.stopping.wait(self.notify_interval):
+            self.notify()
+
+        self.notify()
+
+    # [notify] ---------------------------------------------------------------------------------------------------------
+
+    def notify(self):
+
+        """
+        Delivers one batch: whatever was queued so far, merged.
+        """
+
+        count = len(self.written)
+
+        if count == 0:
+            return
+
+        written = {}
+
+        for _ in range(count):
+            unit_id, table_id, start, end = self.written.popleft()
+            written.setdefault((unit_id, table_id), []).append((start, end))
+
+        changes = []
+
+        for (unit_id, table_id), ranges in sorted(written.iteritems()):
+            if self.registry.get(unit_id) is None:
+                continue
+
+            for start, end in merge_ranges(ranges):
+                changes.append((unit_id, table_id, start, self.get_range(unit_id, table_id, start, end - start)))
+
+        for subscription in self.subscriptions:
+            selected = [change for change in changes if subscription.wants(change[0], change[1])]
+
+            if selected:
+                try:
+                    subscription.callback(selected)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+
+        self.batches         += 1
+        self.writes_notified += count
+        self.ranges_notified += len(changes)
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        snapshot             = server.Server.stats(self)
+        snapshot['embedded'] = {
+            'subscriptions'  : len(self.subscriptions),
+            'batches'        : self.batches,
+            'writes_notified': self.writes_notified,
+            'ranges_notified': self.ranges_notified,
+            'writes_queued'  : len(self.written)
+        }
+
+        return snapshot
+
+
+# [thread_safe] ########################################################################################################
+
+def thread_safe(data_store):
+
+    """
+    A copy of `data_store` with a buffer of its own and a thread lock, its simulation and address map carried over.
+    Copy-on-write stores detach outside of the lock, they must not be written from two threads.
+    """
+
+    if data_store.is_allocated() and data_store.lock is not None:
+        return data_store
+
+    safe             = store.DataStore(bytearray(data_store.view.tobytes()), lock=threading.Lock())
+    safe.simulation  = data_store.simulation
+    safe.address_map = data_store.address_map
+
+    return safe
+
+
+# [merge_ranges] #######################################################################################################
+
+def merge_ranges(ranges):
+
+    """
+    Sorted (start, end) ranges covering `ranges`, overlapping and adjacent ones merged.
+    """
+
+    merged = []
+
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
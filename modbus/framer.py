@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+
+
+# [globals] ############################################################################################################
+
+MBAP_HEADER_SIZE   = 6     # transaction id, protocol identifier and message length - unit id is counted by the length
+MAX_MESSAGE_LENGTH = 254   # unit id + 253 bytes of PDU
+MAX_ADU_SIZE       = MBAP_HEADER_SIZE + MAX_MESSAGE_LENGTH
+BUFFER_SIZE        = 8192
+
+MBAP_LENGTH = struct.Struct('>HH')  # protocol identifier, message length
+
+
+# [FramingError] #######################################################################################################
+
+class FramingError(Exception):
+    pass
+
+
+# [Framer] #############################################################################################################
+
+class Framer:
+
+    """
+        Incremental MODBUS/TCP framer.
+
+        Incoming bytes are received straight into a fixed bytearray. Complete ADUs are sliced out of it as memoryviews
+        by following the MBAP message length, so a single read may yield many requests while a partial frame simply
+        stays in place until the rest arrives. Unconsumed bytes are moved to the front of the buffer only when the free
+        tail gets too small to hold another ADU.
+
+        Returned frames reference the receive buffer and are valid until the next call to recv_into / feed.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, size=BUFFER_SIZE):
+
+        self.buffer = bytearray(size)
+        self.view   = memoryview(self.buffer)
+        self.start  = 0  # first unconsumed byte
+        self.end    = 0  # first free byte
+
+    # [recv_into] ------------------------------------------------------------------------------------------------------
+
+    def recv_into(self, client):
+
+        self.make_room()
+
+        received  = client.recv_into(self.view[self.end:])
+        self.end += received
+
+        return received
+
+    # [feed] -----------------------------------------------------------------------------------------------------------
+
+    def feed(self, data):
+
+        self.make_room()
+
+        if len(data) > len(self.buffer) - self.end:
+            raise FramingError('Receive buffer overflow')
+
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    # [pending] --------------------------------------------------------------------------------------------------------
+
+    def pending(self):
+
+        return self.end - self.start
+
+    # [next_frame] -----------------------------------------------------------------------------------------------------
+
+    def next_frame(self):
+
+        available = self.end - self.start
+
+        if available < MBAP_HEADER_SIZE:
+            return None
+
+        protocol_identifier, message_length = MBAP_LENGTH.unpack_from(self.buffer, self.start + 2)
+
+        if protocol_identifier != 0 or message_length < 2 or message_length > MAX_MESSAGE_LENGTH:
+            raise FramingError('Invalid MBAP header')
+
+        frame_size = MBAP_HEADER_SIZE + message_length
+
+        if available < frame_size:
+            return None
+
+        frame       = self.view[self.start:self.start + frame_size]
+        self.start += frame_size
+
+        return frame
+
+    # [make_room] ------------------------------------------------------------------------------------------------------
+
+    def make_room(self):
+
+        if self.start == self.end:
+            self.start = 0
+            self.end   = 0
+        elif len(self.buffer) - self.end < MAX_ADU_SIZE:
+            # only the trailing partial frame is moved, never the whole buffer
+            pending                = self.end - self.start
+            self.buffer[0:pending] = self.buffer[self.start:self.end]
+            self.start             = 0
+            self.end               = pending
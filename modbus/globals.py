@@ -3,11 +3,57 @@
 
 # [globals] ############################################################################################################
 
-FUNC_01_READ_COIL_STATUS         = 1
-FUNC_02_READ_INPUT_STATUS        = 2
-FUNC_03_READ_HOLDING_REGISTERS   = 3
-FUNC_04_READ_INPUT_REGISTERS     = 4
-FUNC_05_WRITE_SINGLE_COIL        = 5
-FUNC_06_WRITE_SINGLE_REGISTER    = 6
-FUNC_15_WRITE_MULTIPLE_COILS     = 15
-FUNC_16_WRITE_MULTIPLE_REGISTERS = 16
+FUNC_01_READ_COIL_STATUS                 = 1
+FUNC_02_READ_INPUT_STATUS                = 2
+FUNC_03_READ_HOLDING_REGISTERS           = 3
+FUNC_04_READ_INPUT_REGISTERS             = 4
+FUNC_05_WRITE_SINGLE_COIL                = 5
+FUNC_06_WRITE_SINGLE_REGISTER            = 6
+FUNC_08_DIAGNOSTICS                      = 8
+FUNC_15_WRITE_MULTIPLE_COILS             = 15
+FUNC_16_WRITE_MULTIPLE_REGISTERS         = 16
+FUNC_22_MASK_WRITE_REGISTER              = 22
+FUNC_23_READ_WRITE_MULTIPLE_REGISTERS    = 23
+FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT = 43
+
+EXCEPTION_01_ILLEGAL_FUNCTION                        = 1
+EXCEPTION_02_ILLEGAL_DATA_ADDRESS                    = 2
+EXCEPTION_03_ILLEGAL_DATA_VALUE                      = 3
+EXCEPTION_04_SLAVE_DEVICE_FAILURE                    = 4
+EXCEPTION_10_GATEWAY_PATH_UNAVAILABLE                = 10
+EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND = 11
+
+DIAG_00_RETURN_QUERY_DATA                    = 0
+DIAG_10_CLEAR_COUNTERS                       = 10
+DIAG_11_RETURN_BUS_MESSAGE_COUNT             = 11
+DIAG_12_RETURN_BUS_COMMUNICATION_ERROR_COUNT = 12
+DIAG_13_RETURN_BUS_EXCEPTION_ERROR_COUNT     = 13
+DIAG_14_RETURN_SLAVE_MESSAGE_COUNT           = 14
+DIAG_15_RETURN_SLAVE_NO_RESPONSE_COUNT       = 15
+DIAG_16_RETURN_SLAVE_NAK_COUNT               = 16
+DIAG_17_RETURN_SLAVE_BUSY_COUNT              = 17
+DIAG_18_RETURN_BUS_CHARACTER_OVERRUN_COUNT   = 18
+
+DIAG_ZERO_COUNTERS = (DIAG_15_RETURN_SLAVE_NO_RESPONSE_COUNT, DIAG_16_RETURN_SLAVE_NAK_COUNT,
+                      DIAG_17_RETURN_SLAVE_BUSY_COUNT, DIAG_18_RETURN_BUS_CHARACTER_OVERRUN_COUNT)
+
+MEI_14_READ_DEVICE_IDENTIFICATION = 14
+
+DEVICE_ID_01_BASIC    = 1  # stream access to the basic objects
+DEVICE_ID_02_REGULAR  = 2  # stream access to the basic and regular objects
+DEVICE_ID_03_EXTENDED = 3  # stream access to all objects
+DEVICE_ID_04_SPECIFIC = 4  # one specific object
+
+OBJECT_00_VENDOR_NAME           = 0x00
+OBJECT_01_PRODUCT_CODE          = 0x01
+OBJECT_02_MAJOR_MINOR_REVISION  = 0x02
+OBJECT_03_VENDOR_URL            = 0x03
+OBJECT_04_PRODUCT_NAME          = 0x04
+OBJECT_05_MODEL_NAME            = 0x05
+OBJECT_06_USER_APPLICATION_NAME = 0x06
+OBJECT_80_FIRST_EXTENDED        = 0x80
+
+TABLE_DISCRETE_OUTPUT_COILS   = 0
+TABLE_DISCRETE_INPUT_CONTACTS = 1
+TABLE_ANALOG_OUTPUT_REGISTERS = 2
+TABLE_ANALOG_INPUT_REGISTERS  = 3
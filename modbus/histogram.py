@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import math
+
+
+# [globals] ############################################################################################################
+
+PRECISION = 0.01                            # relative width of a bucket
+SCALE     = 1 / math.log(1 + PRECISION)
+
+
+# [Histogram] ##########################################################################################################
+
+class Histogram:
+
+    """
+        Latency histogram with logarithmic buckets, values are microseconds.
+
+        Buckets are 1% wide so any percentile is reported within 1% of the recorded value while memory stays bounded
+        (a few hundred buckets cover 1 us to hours). Histograms of several processes or stages can be merged.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self):
+
+        self.buckets = {}
+        self.count   = 0
+        self.total   = 0.0
+        self.maximum = 0.0
+
+    # [record] ---------------------------------------------------------------------------------------------------------
+
+    def record(self, value):
+
+        index = int(math.log(value) * SCALE) if value > 1 else 0
+
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count         += 1
+        self.total         += value
+
+        if value > self.maximum:
+            self.maximum = value
+
+    # [merge] ----------------------------------------------------------------------------------------------------------
+
+    def merge(self, other):
+
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        self.count  += other.count
+        self.total  += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    # [percentile] -----------------------------------------------------------------------------------------------------
+
+    def percentile(self, percent):
+
+        if self.count == 0:
+            return 0.0
+
+        rank   = math.ceil(self.count * percent / 100.0)
+        passed = 0
+
+        for index in sorted(self.buckets):
+            passed += self.buckets[index]
+
+            if passed >= rank:
+                return min(math.exp((index + 0.5) / SCALE), self.maximum)
+
+        return self.maximum
+
+    # [mean] -----------------------------------------------------------------------------------------------------------
+
+    def mean(self):
+
+        return self.total / self.count if self.count else 0.0
+
+    # [to_dict] --------------------------------------------------------------------------------------------------------
+
+    def to_dict(self):
+
+        return {
+            'count': self.count,
+            'mean' : self.mean(),
+            'p50'  : self.percentile(50),
+            'p99'  : self.percentile(99),
+            'p999' : self.percentile(99.9),
+            'max'  : self.maximum
+        }
+
+    # [dump] -----------------------------------------------------------------------------------------------------------
+
+    def dump(self):
+
+        """
+        Raw state for shipping between processes, see load.
+        """
+
+        return self.buckets, self.count, self.total, self.maximum
+
+    # [load] -----------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def load(state):
+
+        histogram = Histogram()
+        histogram.buckets, histogram.count, histogram.total, histogram.maximum = state
+
+        return histogram
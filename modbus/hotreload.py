@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import os
+import sys
+import threading
+import time
+
+import globals as g
+import slaves
+import store
+
+
+# [globals] ############################################################################################################
+
+CHUNK_SIZE = 256  # bytes compared at once, only chunks that differ are compared register by register
+
+BIT_TABLES = (g.TABLE_DISCRETE_OUTPUT_COILS, g.TABLE_DISCRETE_INPUT_CONTACTS)
+
+TABLE_SIZES = [store.BIT_TABLE_BYTES, store.BIT_TABLE_BYTES, store.REGISTER_TABLE_BYTES, store.REGISTER_TABLE_BYTES]
+
+
+# [Reloader] ###########################################################################################################
+
+class Reloader:
+
+    """
+        Hot reload of the register configuration, on request (SIGHUP) or when the config file at `path` changes - its
+        modification time is checked every `watch_interval` seconds, 0 leaves watching off.
+
+        `load` parses the config again and returns the register images of its units in a fresh slaves.SlaveRegistry,
+        along with {unit id: simulation} for the units whose simulation changed. The images are diffed against those
+        of the previous config, the baseline, and only what differs is written to the served `registry`: registers
+        whose config value changed, bits whose config value changed. Whatever masters wrote anywhere else is kept.
+        Units added to the config are added, units no longer in it are removed, address maps that changed are replaced.
+
+        Parsing and diffing run in a background thread, the server keeps serving meanwhile. The changes are then applied
+        by the server loop between two requests, one DataStore.patch per store - atomic on a shared store as well.
+        Units reading through a template image (a "slaves" entry never written to) are patched through the template
+        when they all change alike.
+
+        `forked` reloaders patch the shared images of serve_forked workers from their parent, in the foreground as the
+        parent serves nothing: a request only flags the reload, the parent's wait loop runs it. Workers hold their own
+        copy of the unit list, of the simulations and of the address maps, none of them can change without a restart:
+        such changes are reported as skipped - address maps differing from the served ones on every reload, until a
+        restart.
+
+        The baseline is a copy of the images the served stores were allocated with, templates are not copied.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, load, registry, path=None, watch_interval=0, forked=False, log=None):
+
+        self.load           = load
+        self.registry       = registry
+        self.baseline       = snapshot(registry)
+        self.path           = path
+        self.watch_interval = watch_interval
+        self.forked         = forked
+        self.log            = log if log is not None else sys.stderr
+        self.mtime          = self.modified()
+        self.next_watch     = time.time() + watch_interval if path is not None and watch_interval else None
+        self.thread         = None
+        self.again          = False  # requested while a reload was running
+        self.requested      = False  # forked, to be run by reload_requested
+        self.result         = None
+        self.read_fd, self.write_fd = os.pipe()  # wakes the server loop up once a reload is ready to be applied
+
+        self.reloads  = 0
+        self.failures = 0
+        self.last     = None
+
+    # [request] --------------------------------------------------------------------------------------------------------
+
+    def request(self):
+
+        """
+        Starts a reload, safe to call from a signal handler.
+        """
+
+        # a reload run from the handler could interrupt one under way and mix up their results
+        if self.forked:
+            self.requested = True
+            return
+
+        if self.thread is not None:
+            self.again = True
+            return
+
+        self.thread = threading.Thread(target=self.run, name='reload')
+        self.thread.daemon = True
+        self.thread.start()
+
+    # [reload_requested] -----------------------------------------------------------------------------------------------
+
+    def reload_requested(self):
+
+        """
+        Runs the reload requested of a forked reloader since the last call, if any. Not to be called from a signal
+        handler.
+        """
+
+        while self.requested:
+            self.requested = False
+            self.reload()
+
+    # [reload] ---------------------------------------------------------------------------------------------------------
+
+    def reload(self):
+
+        self.run(wake=False)
+        self.apply()
+
+    # [run] ------------------------------------------------------------------------------------------------------------
+
+    def run(self, wake=True):
+
+        """
+        Parses and diffs, nothing served is touched.
+        """
+
+        started = time.time()
+
+        try:
+            images, simulations = self.load()
+            changes             = diff(self.baseline, images)
+            self.result         = (started, time.time(), images, simulations, changes)
+        except Exception as e:
+            self.result = (started, e)
+
+        if wake:
+            os.write(self.write_fd, '!')
+
+    # [apply] ----------------------------------------------------------------------------------------------------------
+
+    def apply(self):
+
+        """
+        Writes the changes of the reload that was parsed last, to be called from the server loop once `read_fd` is
+        readable.
+        """
+
+        if self.thread is not None:
+            os.read(self.read_fd, 4096)
+            self.thread.join()
+            self.thread = None
+
+        result      = self.result
+        self.result = None
+
+        if len(result) == 2:
+            self.failures += 1
+            self.log.write('reload failed: %s\n' % result[1])
+        else:
+            self.apply_result(*result)
+
+        if self.again:
+            self.again = False
+            self.request()
+
+    # [apply_result] ---------------------------------------------------------------------------------------------------
+
+    def apply_result(self, started, parsed, images, simulations, changes):
+
+        applying     = time.time()
+        skipped      = 0
+        address_maps = changed_address_maps(self.registry, images)
+
+        if self.forked:
+            skipped = len(changes['added']) + len(changes['removed']) + len(simulations) + len(address_maps)
+        else:
+            # removed first, units leaving a template must not keep it from being patched for the others
+            for unit_id in changes['removed']:
+                self.registry.add(unit_id, None)
+
+            for unit_id in changes['added']:
+                # served units write to a copy of their own, the images stay the baseline of the next reload
+                data_store             = store.DataStore(template=source(images.get(unit_id)))
+                data_store.address_map = images.get(unit_id).address_map
+
+                self.registry.add(unit_id, data_store)
+
+            for unit_id, unit_simulation in simulations.iteritems():
+                data_store = self.registry.get(unit_id)
+
+                if data_store is not None:
+                    data_store.simulation = unit_simulation
+
+            for unit_id in address_maps:
+                self.registry.get(unit_id).address_map = images.get(unit_id).address_map
+
+        patches = self.patch_units(changes['patches'])
+
+        self.baseline = images
+        self.reloads += 1
+        self.last     = {
+            'registers_changed'    : changes['registers'],
+            'bits_changed'         : changes['bits'],
+            'units_patched'        : patches,
+            'units_added'          : len(changes['added']),
+            'units_removed'        : len(changes['removed']),
+            'simulations_replaced' : 0 if self.forked else len(simulations),
+            'address_maps_replaced': 0 if self.forked else len(address_maps),
+            'skipped'              : skipped,
+            'parse_ms'             : round((parsed - started) * 1000, 3),
+            'apply_ms'             : round((time.time() - applying) * 1000, 3)
+        }
+
+        self.log.write('reload: %(registers_changed)d registers and %(bits_changed)d bits changed in '
+                       '%(units_patched)d units, %(units_added)d added, %(units_removed)d removed, '
+                       '%(simulations_replaced)d simulations and %(address_maps_replaced)d address maps replaced, '
+                       '%(skipped)d skipped - parsed in %(parse_ms).1f ms, applied in %(apply_ms).3f ms\n' % self.last)
+
+    # [patch_units] ----------------------------------------------------------------------------------------------------
+
+    def patch_units(self, unit_patches):
+
+        """
+        Applies {unit id: patches}, a template is patched once for all its units when they all change alike. Returns
+        the number of units patched.
+        """
+
+        templates = {}  # id of a template -> ids of the patch lists of the units reading through it
+
+        for unit_id in self.registry.unit_ids():
+            data_store = self.registry.get(unit_id)
+
+            if data_store.template is not None:
+                templates.setdefault(id(data_store.template), set()).add(id(unit_patches.get(unit_id)))
+
+        patched = set()
+        units   = 0
+
+        for unit_id, patches in unit_patches.iteritems():
+            data_store = self.registry.get(unit_id)
+
+            if data_store is None or not patches:
+                continue
+
+            target = data_store
+            units += 1
+
+            if data_store.template is not None and data_store.template is not store.ZERO_STORE and \
+                    len(templates[id(data_store.template)]) == 1:
+                target = data_store.template
+
+            if id(target) not in patched:
+                patched.add(id(target))
+                target.patch(patches)
+
+        return units
+
+    # [tick] -----------------------------------------------------------------------------------------------------------
+
+    def tick(self, now):
+
+        if self.next_watch is None or now < self.next_watch:
+            return
+
+        self.next_watch = now + self.watch_interval
+        mtime           = self.modified()
+
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.request()
+
+    # [modified] -------------------------------------------------------------------------------------------------------
+
+    def modified(self):
+
+        try:
+            return os.stat(self.path).st_mtime if self.path is not None else None
+        except OSError:
+            return None
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        return {'reloads': self.reloads, 'failures': self.failures, 'last': self.last}
+
+
+# [changed_address_maps] ###############################################################################################
+
+def changed_address_maps(registry, images):
+
+    """
+    Ids of the units served by `registry` whose address map differs from the one of their new image.
+    """
+
+    changed = []
+
+    for unit_id in registry.unit_ids():
+        image = images.get(unit_id)
+
+        if image is not None and windows(registry.get(unit_id).address_map) != windows(image.address_map):
+            changed.append(unit_id)
+
+    return changed
+
+
+# [windows] ############################################################################################################
+
+def windows(address_map):
+
+    return (address_map.starts, address_map.ends) if address_map is not None else None
+
+
+# [source] #############################################################################################################
+
+def source(data_store):
+
+    """
+    The store holding the image `data_store` reads, its template while it has not been written to.
+    """
+
+    return data_store.template if data_store.template is not None else data_store
+
+
+# [snapshot] ###########################################################################################################
+
+def snapshot(registry):
+
+    """
+    A copy of the images of `registry`, units reading through a template keep reading through it.
+    """
+
+    copies   = {}
+    baseline = slaves.SlaveRegistry()
+
+    for unit_id in registry.unit_ids():
+        image = source(registry.get(unit_id))
+
+        if image.template is None and id(image) not in copies and image is not store.ZERO_STORE:
+            copies[id(image)] = store.DataStore(bytearray(image.view.tobytes()))
+
+        baseline.add(unit_id, copies.get(id(image), image))
+
+    return baseline
+
+
+# [diff] ###############################################################################################################
+
+def diff(baseline, images):
+
+    """
+    What changed from the `baseline` images to the new `images`: {'patches': {unit id: patches}, 'added': [unit id],
+    'removed': [unit id], 'registers': count, 'bits': count}. Units sharing the same pair of images share one patch
+    list, every pair is diffed once.
+    """
+
+    old_units = set(baseline.unit_ids())
+    new_units = set(images.unit_ids())
+    pairs     = {}
+    changes   = {
+        'patches'  : {},
+        'added'    : sorted(new_units - old_units),
+        'removed'  : sorted(old_units - new_units),
+        'registers': 0,
+        'bits'     : 0
+    }
+
+    for unit_id in sorted(old_units & new_units):
+        old_image = source(baseline.get(unit_id))
+        new_image = source(images.get(unit_id))
+        key       = (id(old_image), id(new_image))
+
+        if key not in pairs:
+            pairs[key] = diff_images(old_image, new_image)
+
+        patches, registers, bits = pairs[key]
+
+        if patches:
+            changes['patches'][unit_id]  = patches
+            changes['registers']        += registers
+            changes['bits']             += bits
+
+    return changes
+
+
+# [diff_images] ########################################################################################################
+
+def diff_images(old_image, new_image):
+
+    """
+    Patches turning `old_image` into `new_image`, see DataStore.patch, with the number of registers and bits changed.
+    Equal tables are skipped with a single comparison, then equal chunks, only differing chunks are walked.
+    """
+
+    patches   = []
+    registers = 0
+    bits      = 0
+
+    for table_id in range(store.TABLE_COUNT):
+        offset = store.TABLE_OFFSETS[table_id]
+        size   = TABLE_SIZES[table_id]
+        old    = old_image.view[offset:offset + size].tobytes()
+        new    = new_image.view[offset:offset + size].tobytes()
+
+        if old == new:
+            continue
+
+        step = 1 if table_id in BIT_TABLES else 2
+        runs = []  # [first byte, end byte]
+
+        for chunk in range(0, size, CHUNK_SIZE):
+            if old[chunk:chunk + CHUNK_SIZE] == new[chunk:chunk + CHUNK_SIZE]:
+                continue
+
+            for position in range(chunk, chunk + CHUNK_SIZE, step):
+                if old[position:position + step] == new[position:position + step]:
+                    continue
+
+                if runs and runs[-1][1] == position:
+                    runs[-1][1] += step
+                else:
+                    runs.append([position, position + step])
+
+        for first, end in runs:
+            if step == 1:
+                mask  = bytearray(ord(a) ^ ord(b) for a, b in zip(old[first:end], new[first:end]))
+                bits += sum(bin(value).count('1') for value in mask)
+                patches.append((table_id, first, new[first:end], str(mask)))
+            else:
+                registers += (end - first) / 2
+                patches.append((table_id, first / 2, new[first:end], None))
+
+    return patches, registers, bits
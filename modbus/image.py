@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import ctypes
+import mmap
+import struct
+
+import slaves
+import store
+
+
+# [globals] ############################################################################################################
+
+MAGIC     = 'MBIM'
+VERSION   = 1
+HEADER    = struct.Struct('>4sHH')                        # magic, version, image count
+UNIT_MAP  = struct.Struct('>%dH' % slaves.UNIT_ID_COUNT)  # image index of every unit id
+NO_IMAGE  = 0xFFFF
+PAGE_SIZE = mmap.PAGESIZE
+
+
+# [images_offset] ######################################################################################################
+
+def images_offset():
+
+    # images start page aligned, each one is a whole number of pages long
+    return (HEADER.size + UNIT_MAP.size + PAGE_SIZE - 1) / PAGE_SIZE * PAGE_SIZE
+
+
+# [save] ###############################################################################################################
+
+def save(registry, path):
+
+    """
+    Writes the register image of every unit to `path`. Units reading through the same template image (units of one
+    "slaves" entry never written to) share one image in the file and share it again once loaded.
+    """
+
+    images    = []  # distinct views, in file order
+    image_ids = {}  # id of the underlying store -> index in images
+    unit_map  = [NO_IMAGE] * slaves.UNIT_ID_COUNT
+
+    for unit_id in registry.unit_ids():
+        data_store = registry.get(unit_id)
+        source     = data_store.template if data_store.template is not None else data_store
+        index      = image_ids.get(id(source))
+
+        if index is None:
+            index = image_ids[id(source)] = len(images)
+            images.append(source.view)
+
+        unit_map[unit_id] = index
+
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(images)))
+        output.write(UNIT_MAP.pack(*unit_map))
+        output.write('\x00' * (images_offset() - output.tell()))
+
+        for view in images:
+            output.write(view.tobytes())
+
+
+# [load] ###############################################################################################################
+
+def load(path, registry):
+
+    """
+    Maps an image written by save and adds its units to `registry`, a single mmap however many units there are.
+
+    The mapping is private: pages are read in as they are touched and a write only copies the page it lands on, the
+    file itself is never modified.
+    """
+
+    with open(path, 'rb') as image:
+        mapped = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, version, image_count = HEADER.unpack_from(mapped, 0)
+
+    if magic != MAGIC or version != VERSION:
+        raise Exception('Not a register image: %s' % path)
+
+    if len(mapped) < images_offset() + image_count * store.STORE_SIZE:
+        raise Exception('Truncated register image: %s' % path)
+
+    unit_map = UNIT_MAP.unpack_from(mapped, HEADER.size)
+    images   = [store.DataStore((ctypes.c_char * store.STORE_SIZE).from_buffer(
+        mapped, images_offset() + index * store.STORE_SIZE)) for index in range(image_count)]
+    shared   = [unit_map.count(index) > 1 for index in range(image_count)]
+
+    for unit_id, index in enumerate(unit_map):
+        if index == NO_IMAGE:
+            continue
+
+        # units sharing an image read through it until they are written to, as they did when it was saved
+        registry.add(unit_id, store.DataStore(template=images[index]) if shared[index] else images[index])
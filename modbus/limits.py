@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+# [globals] ############################################################################################################
+
+MIN_CHECK_INTERVAL = 0.05  # seconds, between two scans for idle connections and expired read deadlines
+EVICT_INTERVAL     = 10.0  # seconds, between two scans for buckets of clients gone
+
+
+# [TokenBucket] ########################################################################################################
+
+class TokenBucket:
+
+    """
+        `rate` tokens per second, at most `burst` saved up. A request always takes its token, the balance may go
+        negative and the time until it is back to zero is how long the client has to wait before its next request.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, rate, burst, now):
+
+        self.rate    = float(rate)
+        self.burst   = float(burst)
+        self.tokens  = self.burst
+        self.updated = now
+
+    # [take] -----------------------------------------------------------------------------------------------------------
+
+    def take(self, now):
+
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    # [full] -----------------------------------------------------------------------------------------------------------
+
+    def full(self, now):
+
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+# [Limits] #############################################################################################################
+
+class Limits:
+
+    """
+        Connection limits of one server process, 0 disables a limit.
+
+        `max_connections` and `max_connections_per_ip` are checked on accept, a connection over the limit is closed
+        right away. `idle_timeout` closes connections without a request for that many seconds, `read_deadline` those
+        whose partial frame did not complete within that many seconds (slowloris). `request_rate` requests per second
+        (bursts of `request_burst`) are served per client ip, all its connections together: a client over its rate is
+        not read from until its bucket allows the next request, the kernel buffers and then tcp flow control hold it
+        back, other clients are not affected. A client keeps its bucket when it closes its connections, reconnecting
+        gets it no fresh burst: buckets are dropped only once their client is gone and they refilled to full.
+
+        Every limit counts what it refused or closed.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, max_connections=0, max_connections_per_ip=0, idle_timeout=0, read_deadline=0, request_rate=0,
+                 request_burst=0):
+
+        self.max_connections        = max_connections
+        self.max_connections_per_ip = max_connections_per_ip
+        self.idle_timeout           = idle_timeout
+        self.read_deadline          = read_deadline
+        self.request_rate           = request_rate
+        self.request_burst          = request_burst or max(1, request_rate)
+        self.check_interval         = None
+        self.connections_per_ip     = {}
+        self.buckets                = {}  # ip -> TokenBucket, until the ip has no connections and its bucket is full
+        self.evict_at               = 0
+
+        timeouts = [timeout for timeout in (idle_timeout, read_deadline) if timeout]
+
+        if timeouts:
+            self.check_interval = max(MIN_CHECK_INTERVAL, min(timeouts) / 4.0)
+
+        self.rejected_connections        = 0
+        self.rejected_connections_per_ip = 0
+        self.closed_idle                 = 0
+        self.closed_read_deadline        = 0
+        self.throttled                   = 0  # times a client was held back
+
+    # [admit] ----------------------------------------------------------------------------------------------------------
+
+    def admit(self, ip, open_connections):
+
+        """
+        Whether a new connection from `ip` may be served, it is counted against the limits if so.
+        """
+
+        if self.max_connections and open_connections >= self.max_connections:
+            self.rejected_connections += 1
+            return False
+
+        count = self.connections_per_ip.get(ip, 0)
+
+        if self.max_connections_per_ip and count >= self.max_connections_per_ip:
+            self.rejected_connections_per_ip += 1
+            return False
+
+        self.connections_per_ip[ip] = count + 1
+
+        return True
+
+    # [release] --------------------------------------------------------------------------------------------------------
+
+    def release(self, ip, now):
+
+        count = self.connections_per_ip.get(ip, 0) - 1
+
+        if count > 0:
+            self.connections_per_ip[ip] = count
+        else:
+            self.connections_per_ip.pop(ip, None)
+
+        if self.buckets and now >= self.evict_at:
+            self.evict(now)
+
+    # [evict] ----------------------------------------------------------------------------------------------------------
+
+    def evict(self, now):
+
+        """
+        Drops the buckets of clients without connections that refilled to full, a new one would be no different.
+        """
+
+        for ip, bucket in self.buckets.items():
+            if ip not in self.connections_per_ip and bucket.full(now):
+                del self.buckets[ip]
+
+        self.evict_at = now + EVICT_INTERVAL
+
+    # [take] -----------------------------------------------------------------------------------------------------------
+
+    def take(self, ip, now):
+
+        """
+        Charges a request to `ip`, returns how many seconds its connections have to wait before the next one.
+        """
+
+        bucket = self.buckets.get(ip)
+
+        if bucket is None:
+            bucket = self.buckets[ip] = TokenBucket(self.request_rate, self.request_burst, now)
+
+        wait = bucket.take(now)
+
+        if wait:
+            self.throttled += 1
+
+        return wait
+
+    # [expired] --------------------------------------------------------------------------------------------------------
+
+    def expired(self, connection, now):
+
+        """
+        Whether `connection` is to be closed: idle for too long or stuck in a partial frame past the read deadline.
+        """
+
+        if connection.paused:
+            return False
+
+        if connection.framer.pending():
+            if self.read_deadline and now - connection.frame_started > self.read_deadline:
+                self.closed_read_deadline += 1
+                return True
+        elif self.idle_timeout and now - connection.last_activity > self.idle_timeout:
+            self.closed_idle += 1
+            return True
+
+        return False
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        return {
+            'max_connections'            : self.max_connections,
+            'max_connections_per_ip'     : self.max_connections_per_ip,
+            'idle_timeout'               : self.idle_timeout,
+            'read_deadline'              : self.read_deadline,
+            'request_rate'               : self.request_rate,
+            'request_burst'              : self.request_burst,
+            'clients'                    : len(self.connections_per_ip),
+            'rejected_connections'       : self.rejected_connections,
+            'rejected_connections_per_ip': self.rejected_connections_per_ip,
+            'closed_idle'                : self.closed_idle,
+            'closed_read_deadline'       : self.closed_read_deadline,
+            'throttled'                  : self.throttled
+        }
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import os
+import time
+
+import globals as g
+import histogram
+
+
+# [globals] ############################################################################################################
+
+STAGES = ('parse', 'dispatch', 'encode')
+
+
+# [Metrics] ############################################################################################################
+
+class Metrics:
+
+    """
+        Counters, stage latencies and connection gauges of one server process.
+
+        Requests, errors (exception responses) and bytes are counted per function code and per unit id in plain list
+        slots, a request costs a few increments. The parse, dispatch and encode stages are only timed on one request
+        out of `sample_every` as reading the clock costs more than all of the counting. Forked workers count on their
+        own, every snapshot carries the pid of its process.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, sample_every=16):
+
+        self.sample_every = sample_every
+        self.countdown    = sample_every
+
+        # connection gauges, not reset by clear
+        self.connections_open     = 0
+        self.connections_peak     = 0
+        self.connections_accepted = 0
+        self.connections_closed   = 0
+
+        self.clear()
+
+    # [clear] ----------------------------------------------------------------------------------------------------------
+
+    def clear(self):
+
+        self.function_requests  = [0] * 256
+        self.function_errors    = [0] * 256
+        self.function_bytes_in  = [0] * 256
+        self.function_bytes_out = [0] * 256
+        self.unit_requests      = [0] * 256
+        self.unit_errors        = [0] * 256
+        self.unit_bytes_in      = [0] * 256
+        self.unit_bytes_out     = [0] * 256
+        self.framing_errors     = 0
+        self.stages             = dict((stage, histogram.Histogram()) for stage in STAGES)
+
+    # [count] ----------------------------------------------------------------------------------------------------------
+
+    def count(self, unit_id, function_code, bytes_in, bytes_out, error):
+
+        self.function_requests[function_code]  += 1
+        self.function_bytes_in[function_code]  += bytes_in
+        self.function_bytes_out[function_code] += bytes_out
+        self.unit_requests[unit_id]            += 1
+        self.unit_bytes_in[unit_id]            += bytes_in
+        self.unit_bytes_out[unit_id]           += bytes_out
+
+        if error:
+            self.function_errors[function_code] += 1
+            self.unit_errors[unit_id]           += 1
+
+    # [timed] ----------------------------------------------------------------------------------------------------------
+
+    def timed(self):
+
+        """
+        True once every `sample_every` calls, the caller times the stages of that request.
+        """
+
+        self.countdown -= 1
+
+        if self.countdown > 0 or not self.sample_every:
+            return False
+
+        self.countdown = self.sample_every
+
+        return True
+
+    # [record_stages] --------------------------------------------------------------------------------------------------
+
+    def record_stages(self, parse, dispatch, encode):
+
+        """
+        Stage durations in seconds.
+        """
+
+        self.stages['parse'].record(parse * 1e6)
+        self.stages['dispatch'].record(dispatch * 1e6)
+        self.stages['encode'].record(encode * 1e6)
+
+    # [connection_opened] ----------------------------------------------------------------------------------------------
+
+    def connection_opened(self):
+
+        self.connections_open     += 1
+        self.connections_accepted += 1
+        self.connections_peak      = max(self.connections_peak, self.connections_open)
+
+    # [connection_closed] ----------------------------------------------------------------------------------------------
+
+    def connection_closed(self):
+
+        self.connections_open   -= 1
+        self.connections_closed += 1
+
+    # [diagnostic_counter] ---------------------------------------------------------------------------------------------
+
+    def diagnostic_counter(self, sub_function, unit_id):
+
+        """
+        Value of a fc08 counter, the bus counters cover every unit served by this process. Returns None for a
+        sub-function that is not a counter.
+        """
+
+        if sub_function == g.DIAG_11_RETURN_BUS_MESSAGE_COUNT:
+            value = sum(self.function_requests)
+        elif sub_function == g.DIAG_12_RETURN_BUS_COMMUNICATION_ERROR_COUNT:
+            value = self.framing_errors
+        elif sub_function == g.DIAG_13_RETURN_BUS_EXCEPTION_ERROR_COUNT:
+            value = sum(self.function_errors)
+        elif sub_function == g.DIAG_14_RETURN_SLAVE_MESSAGE_COUNT:
+            value = self.unit_requests[unit_id]
+        elif sub_function in g.DIAG_ZERO_COUNTERS:
+            # every request is answered, no nak, busy or overrun conditions exist here
+            value = 0
+        else:
+            return None
+
+        return value & 0xFFFF  # the counters are 16 bits on the wire
+
+    # [snapshot] -------------------------------------------------------------------------------------------------------
+
+    def snapshot(self):
+
+        """
+        Everything as a json serializable dict, function codes and unit ids without any traffic are left out.
+        """
+
+        return {
+            'pid'           : os.getpid(),
+            'time'          : time.time(),
+            'connections'   : {
+                'open'    : self.connections_open,
+                'peak'    : self.connections_peak,
+                'accepted': self.connections_accepted,
+                'closed'  : self.connections_closed
+            },
+            'framing_errors': self.framing_errors,
+            'function_codes': self.table(self.function_requests, self.function_errors, self.function_bytes_in,
+                                         self.function_bytes_out),
+            'units'         : self.table(self.unit_requests, self.unit_errors, self.unit_bytes_in,
+                                         self.unit_bytes_out),
+            'stages_us'     : dict((stage, self.stages[stage].to_dict()) for stage in STAGES)
+        }
+
+    # [table] ----------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def table(requests, errors, bytes_in, bytes_out):
+
+        return dict((str(key), {
+            'requests' : requests[key],
+            'errors'   : errors[key],
+            'bytes_in' : bytes_in[key],
+            'bytes_out': bytes_out[key]
+        }) for key in range(256) if requests[key])
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+
+
+# [globals] ############################################################################################################
+
+# data type -> struct format, packed big endian
+DATA_TYPES = {
+    "uint16" : 'H',
+    "int16"  : 'h',
+    "uint32" : 'I',
+    "int32"  : 'i',
+    "uint64" : 'Q',
+    "int64"  : 'q',
+    "float32": 'f',
+    "float64": 'd'
+}
+
+ORDERS = ("big", "little")
+
+
+# [PointType] ##########################################################################################################
+
+class PointType:
+
+    """
+        A data type laid over consecutive registers, e.g. a float32 over two registers.
+
+        Values are packed big endian, high word first ("ABCD"), then reordered: a little `byte_order` swaps the two
+        bytes of every register ("BADC"), a little `word_order` reverses the registers of every point ("CDAB"), both
+        give "DCBA". Points are encoded once when they are set, reading them stays the plain slice copy of any register
+        read.
+
+        Integer types round and clamp what they are given, so generators producing floats can feed any type.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, data_type, byte_order="big", word_order="big"):
+
+        if data_type not in DATA_TYPES:
+            raise Exception('Unknown data type: %s' % data_type)
+
+        if byte_order not in ORDERS or word_order not in ORDERS:
+            raise Exception('Byte and word order should be big or little')
+
+        self.data_type  = data_type
+        self.format     = DATA_TYPES[data_type]
+        self.size       = struct.calcsize(self.format)
+        self.registers  = self.size / 2
+        self.swap_bytes = byte_order == "little"
+        self.swap_words = word_order == "little" and self.registers > 1
+        self.limits     = None
+
+        if self.format not in 'fd':
+            bits        = self.size * 8
+            self.limits = (-(1 << bits - 1), (1 << bits - 1) - 1) if self.format.islower() else (0, (1 << bits) - 1)
+
+    # [encode] ---------------------------------------------------------------------------------------------------------
+
+    def encode(self, values):
+
+        """
+        Wire encoding of consecutive points holding `values`, packed by a single struct call however many they are.
+        """
+
+        if self.limits is not None:
+            low, high = self.limits
+            values    = [min(max(int(round(value)) if isinstance(value, float) else int(value), low), high)
+                         for value in values]
+
+        return self.reorder(bytearray(struct.pack('>%d%s' % (len(values), self.format), *values)))
+
+    # [decode] ---------------------------------------------------------------------------------------------------------
+
+    def decode(self, data):
+
+        data = self.reorder(bytearray(data))
+
+        return list(struct.unpack('>%d%s' % (len(data) / self.size, self.format), str(data)))
+
+    # [reorder] --------------------------------------------------------------------------------------------------------
+
+    def reorder(self, data):
+
+        """
+        Switches `data` between big endian and the configured order, in place - the reordering is its own inverse.
+        Extended slices move one byte position of every point at once.
+        """
+
+        if self.swap_bytes:
+            data[0::2], data[1::2] = data[1::2], data[0::2]
+
+        if self.swap_words:
+            source = bytes(data)
+            size   = self.size
+
+            for word in range(self.registers):
+                target = 2 * word
+                mirror = size - 2 - target
+
+                data[target::size]     = source[mirror::size]
+                data[target + 1::size] = source[mirror + 1::size]
+
+        return data
+
+
+# [create_point_type] ##################################################################################################
+
+def create_point_type(spec):
+
+    """
+    PointType of a config entry carrying "dataType" and optionally "byteOrder" and "wordOrder", None without a type.
+    """
+
+    if "dataType" not in spec:
+        return None
+
+    return PointType(spec["dataType"], spec.get("byteOrder", "big"), spec.get("wordOrder", "big"))
+
+
+# [set_points] #########################################################################################################
+
+def set_points(data_store, table_id, address, point_type, values):
+
+    """
+    Sets consecutive points from `address` on, a single write to the store - atomic on a shared store.
+    """
+
+    data_store.set_register_bytes(table_id, address, point_type.encode(values))
+
+
+# [get_points] #########################################################################################################
+
+def get_points(data_store, table_id, address, point_type, count):
+
+    return point_type.decode(data_store.register_bytes(table_id, address, count * point_type.registers))
+
+
+# [set_scattered_points] ###############################################################################################
+
+def set_scattered_points(data_store, table_id, point_type, items):
+
+    """
+    Sets points of one type anywhere in a table out of (address, value) pairs, one write per run of adjacent points.
+    """
+
+    registers = point_type.registers
+    runs      = []
+
+    for address, value in sorted(items):
+        if runs and runs[-1][0] + len(runs[-1][1]) * registers == address:
+            runs[-1][1].append(value)
+        else:
+            runs.append((address, [value]))
+
+    for address, values in runs:
+        set_points(data_store, table_id, address, point_type, values)
@@ -0,0 +1,765 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import errno
+import socket
+import time
+
+from array import array
+from collections import deque
+
+import addressmap
+import byte_utils
+import cache
+import codec
+import framer
+import globals as g
+import request
+import response
+import rtu
+import server
+import slaves
+import store
+
+
+# [globals] ############################################################################################################
+
+DEFAULT_CONNECTIONS = 2
+DEFAULT_TTL         = 0.5  # seconds a value read upstream is served from the cache, 0 only merges concurrent reads
+DEFAULT_TIMEOUT     = 1.0  # seconds an upstream request may take before its clients get an exception 0B
+CONNECT_TIMEOUT     = 1.0
+RECONNECT_DELAY     = 1.0  # seconds without a connection attempt after one failed
+MAX_OUTSTANDING     = 16   # requests pipelined on one upstream connection, the next ones wait for room
+
+# read function code -> most values a single request may carry
+MAX_READ_COUNTS = {
+    g.FUNC_01_READ_COIL_STATUS      : request.MAX_READ_COILS,
+    g.FUNC_02_READ_INPUT_STATUS     : request.MAX_READ_COILS,
+    g.FUNC_03_READ_HOLDING_REGISTERS: request.MAX_READ_REGISTERS,
+    g.FUNC_04_READ_INPUT_REGISTERS  : request.MAX_READ_REGISTERS
+}
+
+REGISTER_READS = (g.FUNC_03_READ_HOLDING_REGISTERS, g.FUNC_04_READ_INPUT_REGISTERS)
+
+# writable table -> read function code its values are cached under
+CACHED_READS = {
+    g.TABLE_DISCRETE_OUTPUT_COILS  : g.FUNC_01_READ_COIL_STATUS,
+    g.TABLE_ANALOG_OUTPUT_REGISTERS: g.FUNC_03_READ_HOLDING_REGISTERS
+}
+
+
+# [Slot] ###############################################################################################################
+
+class Slot:
+
+    """
+        A request of a downstream connection. Responses are sent in the order the requests came in, whatever order
+        they are answered in.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, connection, frame, req):
+
+        self.connection = connection
+        self.frame      = frame  # a copy, the framer reuses its buffer
+        self.req        = req
+        self.out        = None
+
+
+# [Waiter] #############################################################################################################
+
+class Waiter:
+
+    """
+        A read that missed the cache, answered from it once the upstream reads covering it are back.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, slot):
+
+        self.slot           = slot
+        self.key            = (slot.req.unit_id, slot.req.function_code)
+        self.start          = slot.req.start_reference
+        self.end            = slot.req.start_reference + slot.req.register_count
+        self.fetches        = 0      # upstream reads still to come back
+        self.solo           = False  # read on its own, a merged read covering it was refused
+        self.retry          = False
+        self.exception_code = None
+
+
+# [Fetch] ##############################################################################################################
+
+class Fetch:
+
+    """
+        One upstream read of `start` to `end` (excluded), serving every waiter overlapping it.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, key, start, end, waiters):
+
+        self.key     = key  # unit id, function code
+        self.start   = start
+        self.end     = end
+        self.waiters = waiters
+        self.sent    = time.time()
+
+    # [adu] ------------------------------------------------------------------------------------------------------------
+
+    def adu(self, transaction_id):
+
+        return codec.MBAP_HEADER.pack(transaction_id, 0, 6, self.key[0]) + \
+            codec.FUNCTION_CODE.pack(self.key[1]) + codec.READ_REQUEST.pack(self.start, self.end - self.start)
+
+
+# [Forward] ############################################################################################################
+
+class Forward:
+
+    """
+        A request passed through as is - writes and anything else but fc01 - fc04. `written` is the (table id, start,
+        end) range a successful write invalidates in the cache, None when it writes nothing.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, slot, written):
+
+        self.slot    = slot
+        self.written = written
+
+    # [adu] ------------------------------------------------------------------------------------------------------------
+
+    def adu(self, transaction_id):
+
+        adu = bytearray(self.slot.frame)
+        codec.TRANSACTION_ID.pack_into(adu, 0, transaction_id)
+
+        return adu
+
+
+# [Upstream] ###########################################################################################################
+
+class Upstream:
+
+    """
+        A pooled connection to the upstream slave. Requests are pipelined under transaction ids of its own and matched
+        back to what they were sent for.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, upstream_socket, connect_deadline=None):
+
+        self.socket           = upstream_socket
+        self.fd               = upstream_socket.fileno()
+        self.framer           = framer.Framer()
+        self.out_buffer       = bytearray()
+        self.writing          = False
+        self.outstanding      = {}  # transaction id -> (fetch or forward, deadline)
+        self.transaction_id   = 0
+        self.connect_deadline = connect_deadline  # set until the connection is established
+
+    # [send] -----------------------------------------------------------------------------------------------------------
+
+    def send(self, exchange, deadline):
+
+        self.transaction_id = (self.transaction_id + 1) & 0xFFFF
+
+        self.outstanding[self.transaction_id] = (exchange, deadline)
+        self.out_buffer                      += exchange.adu(self.transaction_id)
+
+
+# [ProxyServer] ########################################################################################################
+
+class ProxyServer(server.Server):
+
+    """
+        Caching proxy in front of a real MODBUS/TCP slave, for masters polling the same device over and over.
+
+        Reads (fc01 - fc04) are answered from a cache of the upstream values, kept in one store.DataStore per unit id
+        along with the time every single value was read at. Values older than `ttl` seconds are read again: the misses
+        of one poll round are merged per unit and function code - overlapping and adjacent ranges become one upstream
+        read, split at the largest count a request may carry - and a miss already covered by a read on its way joins
+        it. A merged read refused by the slave is retried as the separate reads it was made of, so every client gets
+        the answer it would have got on its own.
+
+        Everything else is passed through untouched but for the transaction id. A successful write invalidates the range
+        it wrote to, the next read of it goes upstream.
+
+        Upstream requests are pipelined over at most `connections` connections, opened as needed. Clients get an
+        exception 0A when the slave can not be connected to, 0B when it does not answer within `timeout` seconds.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, host, port, upstream_host, upstream_port=502, backlog=5, connections=DEFAULT_CONNECTIONS,
+                 ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT, **options):
+
+        """
+        `options` are those of a server.Server.
+        """
+
+        server.Server.__init__(self, host, port, slaves.SlaveRegistry(), backlog, **options)
+
+        self.upstream_address = (upstream_host, upstream_port)
+        self.max_upstreams    = max(1, connections)
+        self.ttl              = ttl
+        self.timeout          = timeout
+        self.upstreams        = {}       # fd -> Upstream
+        self.reconnect_at     = 0
+        self.queued           = deque()  # fetches and forwards waiting for room on an upstream connection
+        self.sending          = set()    # upstream connections with requests to send
+        self.flushing         = set()    # downstream connections with responses to send
+        self.slots            = {}       # downstream connection id -> deque of its unanswered Slots
+        self.stores           = {}       # unit id -> DataStore of the cached values
+        self.fetched          = {}       # key -> array of the time every value was read at
+        self.invalidated      = {}       # key -> time of the last write to it
+        self.waiting          = {}       # key -> Waiters to be read upstream
+        self.in_flight        = {}       # key -> Fetches on their way
+
+        self.hits              = 0
+        self.misses            = 0
+        self.upstream_reads    = 0
+        self.passed_through    = 0
+        self.upstream_timeouts = 0
+        self.upstream_errors   = 0  # failed connection attempts and connections lost
+
+    # [respond] --------------------------------------------------------------------------------------------------------
+
+    def respond(self, connection, frame):
+
+        frame = memoryview(frame).tobytes()
+        slot  = Slot(connection, frame, request.Request(frame))
+
+        self.slots.setdefault(connection.id, deque()).append(slot)
+
+        # malformed requests no device accepts are refused here, whether a function is supported is upstream's call
+        if slot.req.exception_code not in (None, g.EXCEPTION_01_ILLEGAL_FUNCTION):
+            self.complete(slot, codec.exception_response(slot.req, slot.req.exception_code))
+        elif slot.req.function_code in cache.READ_TABLES:
+            self.read(slot)
+        else:
+            self.passed_through += 1
+            self.send(Forward(slot, addressmap.written_range(slot.req)))
+
+    # [read] -----------------------------------------------------------------------------------------------------------
+
+    def read(self, slot):
+
+        req   = slot.req
+        start = req.start_reference
+        count = req.register_count
+
+        waiter  = Waiter(slot)
+        fetched = self.fetched.get(waiter.key)
+
+        if fetched is not None and min(fetched[start:start + count]) > time.time() - self.ttl:
+            self.hits += 1
+            self.complete(slot, response.Response(req, self.stores[req.unit_id]).out())
+            return
+
+        self.misses += 1
+
+        for fetch in self.in_flight.get(waiter.key, ()):
+            if fetch.start <= waiter.start and waiter.end <= fetch.end:
+                waiter.fetches = 1
+                fetch.waiters.append(waiter)
+                return
+
+        self.waiting.setdefault(waiter.key, []).append(waiter)
+
+    # [fetch_waiting] --------------------------------------------------------------------------------------------------
+
+    def fetch_waiting(self):
+
+        """
+        Reads upstream what the waiters of this poll round are missing, as few reads as the ranges allow.
+        """
+
+        waiting      = self.waiting
+        self.waiting = {}
+
+        for key, waiters in waiting.iteritems():
+            runs = []  # [start, end, waiters]
+
+            for waiter in sorted(waiters, key=lambda waiter: waiter.start):
+                if waiter.solo:
+                    runs.append([waiter.start, waiter.end, [waiter]])
+                    continue
+
+                if runs and waiter.start <= runs[-1][1] and not runs[-1][2][0].solo:
+                    runs[-1][1] = max(runs[-1][1], waiter.end)
+                    runs[-1][2].append(waiter)
+                else:
+                    runs.append([waiter.start, waiter.end, [waiter]])
+
+            limit = MAX_READ_COUNTS[key[1]]
+
+            for start, end, run in runs:
+                for first in range(start, end, limit):
+                    last  = min(first + limit, end)
+                    fetch = Fetch(key, first, last, [waiter for waiter in run if waiter.start < last and
+                                                     waiter.end > first])
+
+                    for waiter in fetch.waiters:
+                        waiter.fetches += 1
+
+                    self.in_flight.setdefault(key, []).append(fetch)
+                    self.upstream_reads += 1
+                    self.send(fetch)
+
+    # [send] -----------------------------------------------------------------------------------------------------------
+
+    def send(self, exchange):
+
+        upstream = min(self.upstreams.values(), key=lambda upstream: len(upstream.outstanding)) \
+            if self.upstreams else None
+
+        # another connection is opened rather than queueing behind a busy one
+        if upstream is None or upstream.outstanding and len(self.upstreams) < self.max_upstreams:
+            upstream = self.connect() or upstream
+
+        if upstream is None:
+            self.fail(exchange, g.EXCEPTION_10_GATEWAY_PATH_UNAVAILABLE)
+            return
+
+        if len(upstream.outstanding) >= MAX_OUTSTANDING:
+            self.queued.append(exchange)
+            return
+
+        upstream.send(exchange, time.time() + self.timeout)
+        self.sending.add(upstream)
+
+    # [send_queued] ----------------------------------------------------------------------------------------------------
+
+    def send_queued(self):
+
+        room = (self.max_upstreams - len(self.upstreams)) * MAX_OUTSTANDING + \
+            sum(MAX_OUTSTANDING - len(upstream.outstanding) for upstream in self.upstreams.values())
+
+        for _ in range(min(room, len(self.queued))):
+            self.send(self.queued.popleft())
+
+    # [connect] --------------------------------------------------------------------------------------------------------
+
+    def connect(self):
+
+        """
+        Opens another upstream connection without waiting for it: requests sent on it are buffered until it is
+        established, which finish_connect learns from the socket turning writable.
+        """
+
+        now = time.time()
+
+        if now < self.reconnect_at:
+            return None
+
+        upstream_socket = None
+
+        try:
+            family, socket_type, protocol, _, address = socket.getaddrinfo(self.upstream_address[0],
+                                                                            self.upstream_address[1], 0,
+                                                                            socket.SOCK_STREAM)[0]
+            upstream_socket = socket.socket(family, socket_type, protocol)
+            upstream_socket.setblocking(0)
+            upstream_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            error = upstream_socket.connect_ex(address)
+        except socket.error as e:
+            error = e.errno or errno.EHOSTUNREACH
+
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EINTR):
+            if upstream_socket is not None:
+                upstream_socket.close()
+
+            self.upstream_errors += 1
+            self.reconnect_at     = now + RECONNECT_DELAY
+            return None
+
+        upstream         = Upstream(upstream_socket, now + CONNECT_TIMEOUT)
+        upstream.writing = True
+
+        self.upstreams[upstream.fd] = upstream
+        self.poller.register(upstream.fd, server.EVENT_READ | server.EVENT_WRITE)
+
+        return upstream
+
+    # [finish_connect] -------------------------------------------------------------------------------------------------
+
+    def finish_connect(self, upstream):
+
+        error = upstream.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+        if error in (errno.EINPROGRESS, errno.EALREADY):
+            return
+
+        if error:
+            self.reconnect_at = time.time() + RECONNECT_DELAY
+            self.drop(upstream, g.EXCEPTION_10_GATEWAY_PATH_UNAVAILABLE)
+            return
+
+        upstream.connect_deadline = None
+
+        self.write_upstream(upstream)
+
+    # [handle_event] ---------------------------------------------------------------------------------------------------
+
+    def handle_event(self, fd, events):
+
+        upstream = self.upstreams.get(fd)
+
+        if upstream is None:
+            server.Server.handle_event(self, fd, events)
+            return
+
+        if upstream.connect_deadline is not None:
+            self.finish_connect(upstream)
+
+            if upstream.connect_deadline is not None or fd not in self.upstreams:
+                return
+
+        if events & server.EVENT_READ and fd in self.upstreams:
+            self.read_upstream(upstream)
+
+        if events & server.EVENT_WRITE and fd in self.upstreams:
+            self.write_upstream(upstream)
+
+    # [read_upstream] --------------------------------------------------------------------------------------------------
+
+    def read_upstream(self, upstream):
+
+        try:
+            received = upstream.framer.recv_into(upstream.socket)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+
+            received = 0
+
+        if not received:
+            self.drop(upstream)
+            return
+
+        while True:
+            try:
+                frame = upstream.framer.next_frame()
+            except framer.FramingError:
+                self.drop(upstream)
+                return
+
+            if frame is None:
+                break
+
+            entry = upstream.outstanding.pop(codec.TRANSACTION_ID.unpack_from(frame, 0)[0], None)
+
+            # an answer coming after its timeout has nobody waiting for it anymore
+            if entry is None:
+                continue
+
+            if isinstance(entry[0], Fetch):
+                self.answer_fetch(entry[0], frame)
+            else:
+                self.answer_forward(entry[0], frame)
+
+        self.send_queued()
+
+    # [answer_fetch] ---------------------------------------------------------------------------------------------------
+
+    def answer_fetch(self, fetch, frame):
+
+        unit_id, function_code = fetch.key
+        count                  = fetch.end - fetch.start
+        byte_count             = count * 2 if function_code in REGISTER_READS else (count + 7) / 8
+        answered               = codec.FUNCTION_CODE.unpack_from(frame, codec.PDU_OFFSET)[0]
+
+        self.in_flight[fetch.key].remove(fetch)
+
+        # frames hold a function code at least, an exception code or a byte count may still be missing
+        if len(frame) < codec.PDU_OFFSET + codec.READ_RESPONSE.size:
+            self.fail_fetch(fetch, g.EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND)
+            return
+
+        field = codec.READ_RESPONSE.unpack_from(frame, codec.PDU_OFFSET)[1]
+
+        if answered == function_code | codec.EXCEPTION_BIT:
+            self.fail_fetch(fetch, field, retry=True)
+            return
+
+        if answered != function_code or field != byte_count or len(frame) != codec.PDU_OFFSET + 2 + byte_count:
+            self.fail_fetch(fetch, g.EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND)
+            return
+
+        data       = frame[codec.PDU_OFFSET + 2:].tobytes()
+        table_id   = cache.READ_TABLES[function_code]
+        data_store = self.stores.get(unit_id)
+
+        if data_store is None:
+            data_store = self.stores[unit_id] = store.DataStore()
+
+        if function_code in REGISTER_READS:
+            data_store.set_register_bytes(table_id, fetch.start, data)
+        else:
+            data_store.set_bits(table_id, fetch.start, bytearray(byte_utils.unpack_bits(data)[:count]))
+
+        # values read while a write to them was under way are served to those who asked, not cached
+        if fetch.sent >= self.invalidated.get(fetch.key, 0):
+            fetched = self.fetched.get(fetch.key)
+
+            if fetched is None:
+                fetched = self.fetched[fetch.key] = array('d', [0.0]) * store.TABLE_SIZE
+
+            fetched[fetch.start:fetch.end] = array('d', [fetch.sent]) * count
+
+        for waiter in fetch.waiters:
+            waiter.fetches -= 1
+
+            if not waiter.fetches:
+                self.settle(waiter)
+
+    # [fail_fetch] -----------------------------------------------------------------------------------------------------
+
+    def fail_fetch(self, fetch, exception_code, retry=False):
+
+        """
+        Answers the waiters of `fetch` with `exception_code`. With `retry`, waiters that were merged into a larger read
+        are read again on their own instead.
+        """
+
+        for waiter in fetch.waiters:
+            waiter.fetches -= 1
+            merged          = len(fetch.waiters) > 1 or (fetch.start, fetch.end) != (waiter.start, waiter.end)
+
+            if retry and merged and not waiter.solo:
+                waiter.retry = True
+            else:
+                waiter.exception_code = exception_code
+
+            if not waiter.fetches:
+                self.settle(waiter)
+
+    # [settle] ---------------------------------------------------------------------------------------------------------
+
+    def settle(self, waiter):
+
+        """
+        Answers a waiter once all the reads it was waiting for are back.
+        """
+
+        req = waiter.slot.req
+
+        if waiter.exception_code is not None:
+            self.complete(waiter.slot, codec.exception_response(req, waiter.exception_code))
+        elif waiter.retry:
+            waiter.retry = False
+            waiter.solo  = True
+            self.waiting.setdefault(waiter.key, []).append(waiter)
+        else:
+            self.complete(waiter.slot, response.Response(req, self.stores[req.unit_id]).out())
+
+    # [answer_forward] -------------------------------------------------------------------------------------------------
+
+    def answer_forward(self, forward, frame):
+
+        out = bytearray(frame)
+        codec.TRANSACTION_ID.pack_into(out, 0, forward.slot.req.transaction_id)
+
+        if forward.written is not None and not out[codec.PDU_OFFSET] & codec.EXCEPTION_BIT:
+            table_id, start, end = forward.written
+            self.invalidate((forward.slot.req.unit_id, CACHED_READS[table_id]), start, end)
+
+        self.complete(forward.slot, out)
+
+    # [invalidate] -----------------------------------------------------------------------------------------------------
+
+    def invalidate(self, key, start, end):
+
+        self.invalidated[key] = time.time()
+        fetched               = self.fetched.get(key)
+
+        if fetched is not None:
+            fetched[start:end] = array('d', [0.0]) * (end - start)
+
+    # [fail] -----------------------------------------------------------------------------------------------------------
+
+    def fail(self, exchange, exception_code):
+
+        if isinstance(exchange, Fetch):
+            self.in_flight[exchange.key].remove(exchange)
+            self.fail_fetch(exchange, exception_code)
+        else:
+            self.complete(exchange.slot, codec.exception_response(exchange.slot.req, exception_code))
+
+    # [complete] -------------------------------------------------------------------------------------------------------
+
+    def complete(self, slot, out):
+
+        """
+        Sets the response of `slot`, then queues every response of its connection that is no longer waiting for an
+        earlier one.
+        """
+
+        slot.out   = out
+        req        = slot.req
+        connection = slot.connection
+
+        self.metrics.count(req.unit_id, req.function_code, len(slot.frame), len(out),
+                           out[codec.PDU_OFFSET] & codec.EXCEPTION_BIT)
+
+        if self.wire_log is not None:
+            self.wire_log.log(connection.id, req, slot.frame, out)
+
+        queue = self.slots.get(connection.id)
+
+        # the client is gone
+        if queue is None:
+            return
+
+        while queue and queue[0].out is not None:
+            answered = queue.popleft()
+
+            if not connection.rtu:
+                connection.out_buffer += answered.out
+            elif answered.req.unit_id != rtu.BROADCAST_UNIT_ID:  # broadcasts are never answered
+                connection.out_buffer += rtu.to_rtu(answered.out)
+
+        self.flushing.add(connection)
+
+    # [tick] -----------------------------------------------------------------------------------------------------------
+
+    def tick(self, now):
+
+        server.Server.tick(self, now)
+
+        for upstream in self.upstreams.values():
+            if upstream.connect_deadline is not None and upstream.connect_deadline <= now:
+                self.reconnect_at = now + RECONNECT_DELAY
+                self.drop(upstream, g.EXCEPTION_10_GATEWAY_PATH_UNAVAILABLE)
+                continue
+
+            for transaction_id, (exchange, deadline) in upstream.outstanding.items():
+                if deadline <= now:
+                    del upstream.outstanding[transaction_id]
+
+                    self.upstream_timeouts += 1
+                    self.fail(exchange, g.EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND)
+
+        if self.queued:
+            self.send_queued()
+
+        if self.waiting:
+            self.fetch_waiting()
+
+        # requests of the whole poll round go out together
+        while self.sending:
+            upstream = self.sending.pop()
+
+            if upstream.fd in self.upstreams:
+                self.write_upstream(upstream)
+
+        while self.flushing:
+            connection = self.flushing.pop()
+
+            if connection.out_buffer and self.connections.get(connection.fd) is connection:
+                self.handle_write(connection)
+
+    # [next_tick] ------------------------------------------------------------------------------------------------------
+
+    def next_tick(self):
+
+        if self.waiting or self.sending:
+            return time.time()
+
+        deadlines = [deadline for upstream in self.upstreams.values()
+                     for _, deadline in upstream.outstanding.itervalues()]
+        deadlines.extend(upstream.connect_deadline for upstream in self.upstreams.values()
+                         if upstream.connect_deadline is not None)
+
+        if server.Server.next_tick(self) is not None:
+            deadlines.append(server.Server.next_tick(self))
+
+        return min(deadlines) if deadlines else None
+
+    # [write_upstream] -------------------------------------------------------------------------------------------------
+
+    def write_upstream(self, upstream):
+
+        # requests wait in the buffer until the connection is established
+        if upstream.connect_deadline is not None:
+            return
+
+        try:
+            sent = upstream.socket.send(upstream.out_buffer)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                sent = 0
+            else:
+                self.drop(upstream)
+                return
+
+        del upstream.out_buffer[:sent]
+
+        writing = len(upstream.out_buffer) > 0
+
+        if writing != upstream.writing:
+            upstream.writing = writing
+            self.poller.modify(upstream.fd, server.EVENT_READ | (server.EVENT_WRITE if writing else 0))
+
+    # [drop] -----------------------------------------------------------------------------------------------------------
+
+    def drop(self, upstream, exception_code=g.EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND):
+
+        """
+        Closes a broken upstream connection, whatever was sent on it is answered with `exception_code`: 0B by default,
+        0A when the connection could not be established.
+        """
+
+        self.upstreams.pop(upstream.fd, None)
+        self.sending.discard(upstream)
+        self.upstream_errors += 1
+
+        try:
+            self.poller.unregister(upstream.fd)
+        except (IOError, OSError, ValueError):
+            pass
+
+        upstream.socket.close()
+
+        for exchange, _ in upstream.outstanding.values():
+            self.fail(exchange, exception_code)
+
+        upstream.outstanding.clear()
+
+    # [close] ----------------------------------------------------------------------------------------------------------
+
+    def close(self, connection):
+
+        self.slots.pop(connection.id, None)
+        self.flushing.discard(connection)
+
+        server.Server.close(self, connection)
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        snapshot          = server.Server.stats(self)
+        snapshot['proxy'] = {
+            'upstream'         : '%s:%d' % self.upstream_address,
+            'connections'      : len(self.upstreams),
+            'ttl'              : self.ttl,
+            'hits'             : self.hits,
+            'misses'           : self.misses,
+            'upstream_reads'   : self.upstream_reads,
+            'passed_through'   : self.passed_through,
+            'queued'           : len(self.queued),
+            'upstream_timeouts': self.upstream_timeouts,
+            'upstream_errors'  : self.upstream_errors
+        }
+
+        return snapshot
@@ -3,10 +3,49 @@
 
 # [dependencies] #######################################################################################################
 
+import sys
+
+from array import array
+
 import byte_utils
+import codec
 import globals as g
 
 
+# [globals] ############################################################################################################
+
+ADDRESS_SPACE           = 65536
+MAX_READ_COILS          = 2000  # 0x07D0 - fc01 / fc02
+MAX_WRITE_COILS         = 1968  # 0x07B0
+MAX_WRITE_REGISTERS     = 123   # 0x007B
+MAX_READ_REGISTERS      = 125   # 0x007D
+MAX_READ_WRITE_WRITES   = 121   # 0x0079 - fc23 write count
+WRITE_MULTIPLE_OVERHEAD = 7     # unit id, function code, start reference, register count, byte count
+READ_WRITE_OVERHEAD     = 11    # unit id, function code, read start, read count, write start, write count, byte count
+DIAGNOSTIC_OVERHEAD     = 4     # unit id, function code, sub-function
+
+# function code -> shortest message length a request can be parsed from, unknown function codes are not in it
+MIN_MESSAGE_LENGTHS = {
+    g.FUNC_01_READ_COIL_STATUS                : 6,
+    g.FUNC_02_READ_INPUT_STATUS               : 6,
+    g.FUNC_03_READ_HOLDING_REGISTERS          : 6,
+    g.FUNC_04_READ_INPUT_REGISTERS            : 6,
+    g.FUNC_05_WRITE_SINGLE_COIL               : 6,
+    g.FUNC_06_WRITE_SINGLE_REGISTER           : 6,
+    g.FUNC_08_DIAGNOSTICS                     : DIAGNOSTIC_OVERHEAD,
+    g.FUNC_15_WRITE_MULTIPLE_COILS            : WRITE_MULTIPLE_OVERHEAD,
+    g.FUNC_16_WRITE_MULTIPLE_REGISTERS        : WRITE_MULTIPLE_OVERHEAD,
+    g.FUNC_22_MASK_WRITE_REGISTER             : 8,
+    g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS   : READ_WRITE_OVERHEAD,
+    g.FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT: 5
+}
+
+# fc08 sub-functions taking a 0x0000 data field, clearing or returning a counter
+DIAGNOSTIC_COUNTERS = frozenset(range(g.DIAG_10_CLEAR_COUNTERS, g.DIAG_18_RETURN_BUS_CHARACTER_OVERRUN_COUNT + 1))
+
+BYTE_SWAP = sys.byteorder == 'little'
+
+
 # [Request] ############################################################################################################
 
 class Request:
@@ -104,6 +143,21 @@ class Request:
 
         ----------------
 
+        Sample "Diagnostics - Return Bus Message Count (fc08 - fc0x08)" Request:
+        00:31 00:00 00:06 01 08 00:0B 00:00
+
+        MBAP (MODBUS Application Header) Header:
+            00:31 : Transaction ID - increased by Master on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            08    : Function Code
+            00 0B : Sub-function
+            00 00 : Data
+
+        ----------------
+
         Sample "Write Multiple Coils (fc15 - fc0x0F)" Request:
         00:19 00:00 00:08 01 0F 0F:A0 00:03 01 05
 
@@ -136,96 +190,262 @@ class Request:
             04    : Byte Count
             01 F4 : Data 01
             03 E8 : Data 02
+
+        ----------------
+
+        Sample "Mask Write Register (fc22 - fc0x16)" Request:
+        00:23 00:00 00:08 01 16 00:04 00:F2 00:25
+
+        MBAP (MODBUS Application Header) Header:
+            00:23 : Transaction ID - increased by Master on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:08 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            16    : Function Code
+            00 04 : Reference
+            00 F2 : And Mask
+            00 25 : Or Mask
+
+        ----------------
+
+        Sample "Read/Write Multiple Registers (fc23 - fc0x17)" Request:
+        00:24 00:00 00:0F 01 17 00:03 00:06 00:0E 00:02 04 00:FF 00:FF
+
+        MBAP (MODBUS Application Header) Header:
+            00:24 : Transaction ID - increased by Master on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:0F : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            17    : Function Code
+            00 03 : Read Start Reference
+            00 06 : Read Register Count
+            00 0E : Write Start Reference
+            00 02 : Write Register Count
+            04    : Byte Count
+            00 FF : Data 01
+            00 FF : Data 02
+
+        ----------------
+
+        Sample "Read Device Identification (fc43 - fc0x2B / 0x0E)" Request:
+        00:25 00:00 00:05 01 2B 0E 01 00
+
+        MBAP (MODBUS Application Header) Header:
+            00:25 : Transaction ID - increased by Master on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:05 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            2B    : Function Code
+            0E    : MEI Type
+            01    : Read Device ID Code (01 basic, 02 regular, 03 extended, 04 one specific object)
+            00    : Object ID
     """
 
     # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-    def __init__(self, data):
+    def __init__(self, data, offset=0):
 
-        data_bytes = list(data)
+        """
+        `data` may be any buffer (str, bytearray, memoryview), fields are unpacked in place without copying it.
+        Whatever a well framed request holds, parsing it does not raise: unknown function codes are flagged with
+        exception 01, requests too short for their function code with exception 03.
+        """
 
         self.transaction_id      = None  # 0 - 2
         self.protocol_identifier = None  # 2 - 4
         self.message_length      = None  # 4 - 6
         self.unit_id             = None  # 6
-        self.function_code       = byte_utils.to_u8(data_bytes[7])  # 7
+        self.function_code       = codec.FUNCTION_CODE.unpack_from(data, offset + codec.PDU_OFFSET)[0]  # 7
         self.start_reference     = None  # 8 - 10
         self.register_count      = None  # 10 - 12
         self.data_to_be_written  = []
+        self.data_bytes          = None  # raw data field of fc08 / fc15 / fc16, as sent
+        self.sub_function        = None  # fc08
+        self.write_reference     = None  # fc23, the read part uses start_reference / register_count
+        self.write_count         = None  # fc23
+        self.and_mask            = None  # fc22
+        self.or_mask             = None  # fc22
+        self.mei_type            = None  # fc43
+        self.device_id_code      = None  # fc43
+        self.object_id           = None  # fc43
         self.byte_count          = None
+        self.exception_code      = None  # set when the request is well framed but can not be served
 
-        self.read_mbap_header(data_bytes)
+        self.read_mbap_header(data, offset)
 
-        if self.function_code == g.FUNC_01_READ_COIL_STATUS:
-            self.read_pdu_for_all_read_functions(data_bytes)
-        elif self.function_code == g.FUNC_02_READ_INPUT_STATUS:
-            self.read_pdu_for_all_read_functions(data_bytes)
+        pdu_offset = offset + codec.PDU_OFFSET + 1
+        min_length = MIN_MESSAGE_LENGTHS.get(self.function_code)
+
+        if min_length is None:
+            self.exception_code = g.EXCEPTION_01_ILLEGAL_FUNCTION
+        elif self.message_length < min_length:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
         elif self.function_code == g.FUNC_03_READ_HOLDING_REGISTERS:
-            self.read_pdu_for_all_read_functions(data_bytes)
+            self.read_pdu_for_all_read_functions(data, pdu_offset)
         elif self.function_code == g.FUNC_04_READ_INPUT_REGISTERS:
-            self.read_pdu_for_all_read_functions(data_bytes)
+            self.read_pdu_for_all_read_functions(data, pdu_offset)
+        elif self.function_code == g.FUNC_01_READ_COIL_STATUS:
+            self.read_pdu_for_all_read_functions(data, pdu_offset)
+        elif self.function_code == g.FUNC_02_READ_INPUT_STATUS:
+            self.read_pdu_for_all_read_functions(data, pdu_offset)
         elif self.function_code == g.FUNC_05_WRITE_SINGLE_COIL:
-            self.read_pdu_for_fc05(data_bytes)
+            self.read_pdu_for_fc05(data, pdu_offset)
         elif self.function_code == g.FUNC_06_WRITE_SINGLE_REGISTER:
-            self.read_pdu_for_fc06(data_bytes)
+            self.read_pdu_for_fc06(data, pdu_offset)
+        elif self.function_code == g.FUNC_08_DIAGNOSTICS:
+            self.read_pdu_for_fc08(data, pdu_offset)
         elif self.function_code == g.FUNC_15_WRITE_MULTIPLE_COILS:
-            self.read_pdu_for_fc15(data_bytes)
+            self.read_pdu_for_fc15(data, pdu_offset)
         elif self.function_code == g.FUNC_16_WRITE_MULTIPLE_REGISTERS:
-            self.read_pdu_for_fc16(data_bytes)
-        else:
-            raise Exception('Not implemented function')
+            self.read_pdu_for_fc16(data, pdu_offset)
+        elif self.function_code == g.FUNC_22_MASK_WRITE_REGISTER:
+            self.read_pdu_for_fc22(data, pdu_offset)
+        elif self.function_code == g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS:
+            self.read_pdu_for_fc23(data, pdu_offset)
+        elif self.function_code == g.FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT:
+            self.read_pdu_for_fc43(data, pdu_offset)
 
     # [read_mbap_header] -----------------------------------------------------------------------------------------------
 
-    def read_mbap_header(self, data_bytes):
-        self.transaction_id      = byte_utils.to_u16(data_bytes[0:2])
-        self.protocol_identifier = byte_utils.to_u16(data_bytes[2:4])
-        self.message_length      = byte_utils.to_u16(data_bytes[4:6])
-        self.unit_id             = byte_utils.to_u8(data_bytes[6])
+    def read_mbap_header(self, data, offset):
+        self.transaction_id, self.protocol_identifier, self.message_length, self.unit_id = \
+            codec.MBAP_HEADER.unpack_from(data, offset)
 
     # [read_pdu_for_all_read_functions] --------------------------------------------------------------------------------
 
-    def read_pdu_for_all_read_functions(self, data_bytes):
-        self.start_reference = byte_utils.to_u16(data_bytes[8:10])
-        self.register_count  = byte_utils.to_u16(data_bytes[10:12])
+    def read_pdu_for_all_read_functions(self, data, offset):
+        self.start_reference, self.register_count = codec.READ_REQUEST.unpack_from(data, offset)
+
+        if self.function_code in (g.FUNC_01_READ_COIL_STATUS, g.FUNC_02_READ_INPUT_STATUS):
+            max_count = MAX_READ_COILS
+        else:
+            max_count = MAX_READ_REGISTERS
+
+        if self.register_count < 1 or self.register_count > max_count:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
+        elif self.start_reference + self.register_count > ADDRESS_SPACE:
+            self.exception_code = g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS
 
     # [read_pdu_for_fc05] ----------------------------------------------------------------------------------------------
 
-    def read_pdu_for_fc05(self, data_bytes):
-        self.start_reference = byte_utils.to_u16(data_bytes[8:10])
-        incoming_data        = byte_utils.to_u16(data_bytes[10:12])
-        mapped_value         = 0
+    def read_pdu_for_fc05(self, data, offset):
+        self.start_reference, incoming_data = codec.WRITE_SINGLE_REQUEST.unpack_from(data, offset)
+        mapped_value                        = 0
 
         if incoming_data == 0xFF00:
             mapped_value = 1
+        elif incoming_data != 0x0000:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
 
         self.data_to_be_written = [mapped_value]
 
     # [read_pdu_for_fc06] ----------------------------------------------------------------------------------------------
 
-    def read_pdu_for_fc06(self, data_bytes):
-        self.start_reference    = byte_utils.to_u16(data_bytes[8:10])
-        self.data_to_be_written = [byte_utils.to_u16(data_bytes[10:12])]
+    def read_pdu_for_fc06(self, data, offset):
+        self.start_reference, value = codec.WRITE_SINGLE_REQUEST.unpack_from(data, offset)
+        self.data_to_be_written     = [value]
+
+    # [read_pdu_for_fc08] ----------------------------------------------------------------------------------------------
+
+    def read_pdu_for_fc08(self, data, offset):
+        data_size = self.message_length - DIAGNOSTIC_OVERHEAD
+
+        if data_size < 0:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
+            return
 
-        print self.data_to_be_written
+        self.sub_function = codec.DIAGNOSTIC_REQUEST.unpack_from(data, offset)[0]
+        self.data_bytes   = codec.byte_string(data_size).unpack_from(data, offset + codec.DIAGNOSTIC_REQUEST.size)[0]
+
+        if self.sub_function == g.DIAG_00_RETURN_QUERY_DATA:
+            return
+
+        if self.sub_function not in DIAGNOSTIC_COUNTERS:
+            self.exception_code = g.EXCEPTION_01_ILLEGAL_FUNCTION
+        elif self.data_bytes != '\x00\x00':
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
 
     # [read_pdu_for_fc15] ----------------------------------------------------------------------------------------------
 
-    def read_pdu_for_fc15(self, data_bytes):
-        self.start_reference    = byte_utils.to_u16(data_bytes[8:10])
-        self.register_count     = byte_utils.to_u16(data_bytes[10:12])
-        self.byte_count         = byte_utils.to_u16(data_bytes[12:13])
+    def read_pdu_for_fc15(self, data, offset):
+        self.start_reference, self.register_count, self.byte_count = \
+            codec.WRITE_MULTIPLE_REQUEST.unpack_from(data, offset)
 
-        # TODO: bit vector to data list
+        if not self.check_write_multiple(MAX_WRITE_COILS, (self.register_count + 7) / 8):
+            return
+
+        self.data_bytes         = codec.byte_string(self.byte_count).unpack_from(
+            data, offset + codec.WRITE_MULTIPLE_REQUEST.size)[0]
+        self.data_to_be_written = bytearray(byte_utils.unpack_bits(self.data_bytes)[:self.register_count])
 
     # [read_pdu_for_fc16] ----------------------------------------------------------------------------------------------
 
-    def read_pdu_for_fc16(self, data_bytes):
-        self.start_reference    = byte_utils.to_u16(data_bytes[8:10])
-        self.register_count     = byte_utils.to_u16(data_bytes[10:12])
-        self.byte_count         = byte_utils.to_u8(data_bytes[12:13])
-        self.data_to_be_written = []
+    def read_pdu_for_fc16(self, data, offset):
+        self.start_reference, self.register_count, self.byte_count = \
+            codec.WRITE_MULTIPLE_REQUEST.unpack_from(data, offset)
+
+        if not self.check_write_multiple(MAX_WRITE_REGISTERS, self.register_count * 2):
+            return
+
+        self.data_bytes         = codec.byte_string(self.byte_count).unpack_from(
+            data, offset + codec.WRITE_MULTIPLE_REQUEST.size)[0]
+        self.data_to_be_written = array('H')
+
+        self.data_to_be_written.fromstring(self.data_bytes)
+
+        if BYTE_SWAP:
+            self.data_to_be_written.byteswap()
+
+    # [read_pdu_for_fc22] ----------------------------------------------------------------------------------------------
+
+    def read_pdu_for_fc22(self, data, offset):
+        self.start_reference, self.and_mask, self.or_mask = codec.MASK_WRITE_REQUEST.unpack_from(data, offset)
+
+    # [read_pdu_for_fc23] ----------------------------------------------------------------------------------------------
+
+    def read_pdu_for_fc23(self, data, offset):
+        self.start_reference, self.register_count, self.write_reference, self.write_count, self.byte_count = \
+            codec.READ_WRITE_REQUEST.unpack_from(data, offset)
+
+        if self.register_count < 1 or self.register_count > MAX_READ_REGISTERS or self.write_count < 1 or \
+                self.write_count > MAX_READ_WRITE_WRITES or self.byte_count != self.write_count * 2 or \
+                self.message_length != READ_WRITE_OVERHEAD + self.byte_count:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
+            return
+
+        if self.start_reference + self.register_count > ADDRESS_SPACE or \
+                self.write_reference + self.write_count > ADDRESS_SPACE:
+            self.exception_code = g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS
+            return
+
+        self.data_bytes = codec.byte_string(self.byte_count).unpack_from(
+            data, offset + codec.READ_WRITE_REQUEST.size)[0]
+
+    # [read_pdu_for_fc43] ----------------------------------------------------------------------------------------------
+
+    def read_pdu_for_fc43(self, data, offset):
+        self.mei_type, self.device_id_code, self.object_id = codec.DEVICE_ID_REQUEST.unpack_from(data, offset)
+
+        if self.mei_type != g.MEI_14_READ_DEVICE_IDENTIFICATION:
+            self.exception_code = g.EXCEPTION_01_ILLEGAL_FUNCTION
+        elif self.device_id_code < g.DEVICE_ID_01_BASIC or self.device_id_code > g.DEVICE_ID_04_SPECIFIC:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
+
+    # [check_write_multiple] -------------------------------------------------------------------------------------------
+
+    def check_write_multiple(self, max_count, byte_count):
+
+        """
+        Validates quantity, byte count and frame length of fc15 / fc16, flags an exception instead of raising.
+        """
+
+        if self.register_count < 1 or self.register_count > max_count or self.byte_count != byte_count or \
+                self.message_length != WRITE_MULTIPLE_OVERHEAD + byte_count:
+            self.exception_code = g.EXCEPTION_03_ILLEGAL_DATA_VALUE
+        elif self.start_reference + self.register_count > ADDRESS_SPACE:
+            self.exception_code = g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS
 
-        for i in range(self.byte_count / 2):
-            value = byte_utils.to_u16(data_bytes[13 + (i * 2):15 + (i * 2)])
-            self.data_to_be_written.append(value)
\ No newline at end of file
+        return self.exception_code is None
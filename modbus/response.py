@@ -3,7 +3,7 @@
 
 # [dependencies] #######################################################################################################
 
-import byte_utils
+import codec
 import globals as g
 
 
@@ -13,44 +13,86 @@ class Response:
 
     # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-    def __init__(self, request, tables):
+    def __init__(self, request, store, exception_code=None, diagnostics=None, identification=None):
 
-        self.request = request
-        self.tables  = tables
-        self.bytes   = []
+        """
+        `diagnostics` provides the fc08 counters, see metrics.Metrics. `identification` maps the fc43 object ids to
+        their values.
+        """
 
-        self.create_mbap_header()
+        self.request        = request
+        self.store          = store
+        self.diagnostics    = diagnostics
+        self.identification = identification if identification is not None else {}
+        self.buffer         = None
 
-        if request.function_code == g.FUNC_01_READ_COIL_STATUS:
-            self.create_pdu_fc01()
-        elif request.function_code == g.FUNC_02_READ_INPUT_STATUS:
-            self.create_pdu_fc02()
+        if exception_code is None:
+            exception_code = request.exception_code
+
+        if exception_code is not None:
+            self.create_exception_pdu(exception_code)
         elif request.function_code == g.FUNC_03_READ_HOLDING_REGISTERS:
             self.create_pdu_fc03()
         elif request.function_code == g.FUNC_04_READ_INPUT_REGISTERS:
             self.create_pdu_fc04()
+        elif request.function_code == g.FUNC_01_READ_COIL_STATUS:
+            self.create_pdu_fc01()
+        elif request.function_code == g.FUNC_02_READ_INPUT_STATUS:
+            self.create_pdu_fc02()
+        elif request.function_code == g.FUNC_06_WRITE_SINGLE_REGISTER:
+            self.create_pdu_fc06()
+        elif request.function_code == g.FUNC_16_WRITE_MULTIPLE_REGISTERS:
+            self.create_pdu_fc16()
+        elif request.function_code == g.FUNC_05_WRITE_SINGLE_COIL:
+            self.create_pdu_fc05()
+        elif request.function_code == g.FUNC_15_WRITE_MULTIPLE_COILS:
+            self.create_pdu_fc15()
+        elif request.function_code == g.FUNC_08_DIAGNOSTICS:
+            self.create_pdu_fc08()
+        elif request.function_code == g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS:
+            self.create_pdu_fc23()
+        elif request.function_code == g.FUNC_22_MASK_WRITE_REGISTER:
+            self.create_pdu_fc22()
+        elif request.function_code == g.FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT:
+            self.create_pdu_fc43()
+        else:
+            self.create_mbap_header(0)
 
     # [create_mbap_header] ---------------------------------------------------------------------------------------------
 
-    def create_mbap_header(self):
+    def create_mbap_header(self, pdu_size):
 
-        # transaction id
-        ti_hi, ti_lo = byte_utils.from_u16(self.request.transaction_id)
-        self.bytes.append(ti_hi)
-        self.bytes.append(ti_lo)
+        """
+        Allocates the whole response at once and writes the MBAP header, the PDU is packed right behind it.
+        """
 
-        # protocol identifier
-        pi_hi, pi_lo = byte_utils.from_u16(self.request.protocol_identifier)
-        self.bytes.append(pi_hi)
-        self.bytes.append(pi_lo)
+        self.buffer = bytearray(codec.MBAP_HEADER_SIZE + pdu_size)
 
-        # message length
-        ml_hi, ml_lo = byte_utils.from_u16(0)
-        self.bytes.append(ml_hi)
-        self.bytes.append(ml_lo)
+        codec.MBAP_HEADER.pack_into(self.buffer, 0, self.request.transaction_id, self.request.protocol_identifier,
+                                    pdu_size + 1, self.request.unit_id)
 
-        # unit id
-        self.bytes.append(byte_utils.from_u8(self.request.unit_id))
+    # [create_exception_pdu] -------------------------------------------------------------------------------------------
+
+    def create_exception_pdu(self, exception_code):
+
+        """
+        Sample "Gateway Target Device Failed To Respond" Exception Response to a fc03 Request:
+        00:68 00:00 00:03 2A 83 0B
+
+        MBAP (MODBUS Application Header) Header:
+            00:68 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:03 : Message Length
+            2A    : Unit ID
+        PDU (Protocol Data Unit):
+            83    : Function Code + 0x80
+            0B    : Exception Code
+        """
+
+        self.create_mbap_header(codec.EXCEPTION_RESPONSE.size)
+
+        codec.EXCEPTION_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET,
+                                           self.request.function_code | codec.EXCEPTION_BIT, exception_code)
 
     # [create_pdu_fc01] ------------------------------------------------------------------------------------------------
 
@@ -90,35 +132,18 @@ class Response:
             1F    : 0 0 0 1 1 1 1 1 @ 1540
         """
 
-        table_id   = 0
-        byte_count = (self.request.register_count / 8 + 1)
-
-        # function code
-        self.bytes.append(byte_utils.from_u8(self.request.function_code))
-
-        # data size
-        self.bytes.append(byte_utils.from_u8(byte_count))
-
-        # read data from config
-        counter = 0
-        bits    = ''
-
-        for i in range(self.request.start_reference, self.request.register_count):
-
-            if counter == 8:
-                self.bytes.append(byte_utils.from_u8(int(bits, 2)))
+        table_id   = g.TABLE_DISCRETE_OUTPUT_COILS
+        byte_count = (self.request.register_count + 7) / 8
 
-                counter = 0
-                bits    = ''
+        self.create_mbap_header(codec.READ_RESPONSE.size + byte_count)
 
-            bits = str(self.tables[table_id][i]) + bits
-            counter += 1
+        # function code, data size
+        codec.READ_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, byte_count)
 
-        print bits
-        self.bytes.append(byte_utils.from_u8(int(bits, 2)))
-
-        # update message length
-        self.bytes[4], self.bytes[5] = byte_utils.from_u16(len(self.bytes) - 6)
+        # read data from config - already packed by the store
+        self.buffer[codec.PDU_OFFSET + codec.READ_RESPONSE.size:] = self.store.get_packed_bits(
+            table_id, self.request.start_reference, self.request.register_count
+        )
 
     # [create_pdu_fc02] ------------------------------------------------------------------------------------------------
 
@@ -157,35 +182,18 @@ class Response:
             01    : 0 0 0 0 0 0 0 1 @ 2358
         """
 
-        table_id   = 1
-        byte_count = (self.request.register_count / 8 + 1)
-
-        # function code
-        self.bytes.append(byte_utils.from_u8(self.request.function_code))
-
-        # data size
-        self.bytes.append(byte_utils.from_u8(byte_count))
-
-        # read data from config
-        counter = 0
-        bits    = ''
-
-        for i in range(self.request.start_reference, self.request.register_count):
-
-            if counter == 8:
-                self.bytes.append(byte_utils.from_u8(int(bits, 2)))
-
-                counter = 0
-                bits    = ''
+        table_id   = g.TABLE_DISCRETE_INPUT_CONTACTS
+        byte_count = (self.request.register_count + 7) / 8
 
-            bits = str(self.tables[table_id][i]) + bits
-            counter += 1
+        self.create_mbap_header(codec.READ_RESPONSE.size + byte_count)
 
-        print bits
-        self.bytes.append(byte_utils.from_u8(int(bits, 2)))
+        # function code, data size
+        codec.READ_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, byte_count)
 
-        # update message length
-        self.bytes[4], self.bytes[5] = byte_utils.from_u16(len(self.bytes) - 6)
+        # read data from config - already packed by the store
+        self.buffer[codec.PDU_OFFSET + codec.READ_RESPONSE.size:] = self.store.get_packed_bits(
+            table_id, self.request.start_reference, self.request.register_count
+        )
 
     # [create_pdu_fc02] ------------------------------------------------------------------------------------------------
 
@@ -230,22 +238,18 @@ class Response:
             00 11 : Data 10 @ 36A9
         """
 
-        table_id = 2
+        table_id   = g.TABLE_ANALOG_OUTPUT_REGISTERS
+        byte_count = self.request.register_count * 2
 
-        # function code
-        self.bytes.append(byte_utils.from_u8(self.request.function_code))
+        self.create_mbap_header(codec.READ_RESPONSE.size + byte_count)
 
-        # data size
-        self.bytes.append(byte_utils.from_u8(self.request.register_count * 2))
+        # function code, data size
+        codec.READ_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, byte_count)
 
-        # read data from config
-        for i in range(self.request.start_reference, self.request.register_count):
-            dv_hi, dv_lo = byte_utils.from_u16(self.tables[table_id][i])
-            self.bytes.append(dv_hi)
-            self.bytes.append(dv_lo)
-
-        # update message length
-        self.bytes[4], self.bytes[5] = byte_utils.from_u16(len(self.bytes) - 6)
+        # read data from config - registers are stored in wire order, a slice copied between two writes
+        self.buffer[codec.PDU_OFFSET + codec.READ_RESPONSE.size:] = self.store.register_bytes(
+            table_id, self.request.start_reference, self.request.register_count
+        )
 
     # [create_pdu_fc02] ------------------------------------------------------------------------------------------------
 
@@ -288,24 +292,417 @@ class Response:
             00 C3 : Data 08 @ 2119
         """
 
-        table_id = 3
+        table_id   = g.TABLE_ANALOG_INPUT_REGISTERS
+        byte_count = self.request.register_count * 2
+
+        self.create_mbap_header(codec.READ_RESPONSE.size + byte_count)
+
+        # function code, data size
+        codec.READ_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, byte_count)
+
+        # read data from config - registers are stored in wire order, a slice copied between two writes
+        self.buffer[codec.PDU_OFFSET + codec.READ_RESPONSE.size:] = self.store.register_bytes(
+            table_id, self.request.start_reference, self.request.register_count
+        )
+
+    # [create_pdu_fc05] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc05(self):
+
+        """
+        Sample "Write Single Coil (fc05)" Request:
+        00:09 00:00 00:06 01 05 0B:B8 FF:00
+
+        MBAP (MODBUS Application Header) Header:
+            00:09 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            05    : Function Code
+            0B B8 : Reference
+            FF 00 : Data To Be Written (0xFF00: 1, 0x0000: 0)
+
+        ----------------
+
+        Sample "Write Single Coil (fc05)" Response - an echo of the request:
+        00:09 00:00 00:06 01 05 0B:B8 FF:00
+        """
+
+        value = self.request.data_to_be_written[0]
+
+        self.store.set_bits(g.TABLE_DISCRETE_OUTPUT_COILS, self.request.start_reference, [value])
+
+        self.create_mbap_header(codec.WRITE_SINGLE_RESPONSE.size)
+
+        codec.WRITE_SINGLE_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code,
+                                              self.request.start_reference, 0xFF00 if value else 0x0000)
+
+    # [create_pdu_fc06] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc06(self):
+
+        """
+        Sample "Write Single Register (fc06)" Request:
+        00:15 00:00 00:06 01 06 0F:A0 11:94
+
+        MBAP (MODBUS Application Header) Header:
+            00:15 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            06    : Function Code
+            0F A0 : Reference
+            11 94 : Data To Be Written
+
+        ----------------
+
+        Sample "Write Single Register (fc06)" Response - an echo of the request:
+        00:15 00:00 00:06 01 06 0F:A0 11:94
+        """
+
+        value = self.request.data_to_be_written[0]
+
+        self.store.set_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, self.request.start_reference, [value])
+
+        self.create_mbap_header(codec.WRITE_SINGLE_RESPONSE.size)
+
+        codec.WRITE_SINGLE_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code,
+                                              self.request.start_reference, value)
+
+    # [create_pdu_fc08] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc08(self):
+
+        """
+        Sample "Diagnostics - Return Bus Message Count (fc08)" Request:
+        00:31 00:00 00:06 01 08 00:0B 00:00
+
+        MBAP (MODBUS Application Header) Header:
+            00:31 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            08    : Function Code
+            00 0B : Sub-function
+            00 00 : Data
+
+        ----------------
+
+        Sample "Diagnostics - Return Bus Message Count (fc08)" Response:
+        00:31 00:00 00:06 01 08 00:0B 01:2C
+
+        MBAP (MODBUS Application Header) Header:
+            00:31 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            08    : Function Code
+            00 0B : Sub-function
+            01 2C : Counter Value
+
+        Return Query Data (00) and Clear Counters (0A) are echoes of the request.
+        """
+
+        sub_function = self.request.sub_function
+        data         = self.request.data_bytes
+
+        if sub_function != g.DIAG_00_RETURN_QUERY_DATA:
+            if self.diagnostics is None:
+                # counters are kept by the server, there are none to report without it
+                self.create_exception_pdu(g.EXCEPTION_01_ILLEGAL_FUNCTION)
+                return
+
+            if sub_function == g.DIAG_10_CLEAR_COUNTERS:
+                self.diagnostics.clear()
+            else:
+                counter = self.diagnostics.diagnostic_counter(sub_function, self.request.unit_id)
+                data    = codec.register_values(1).pack(counter)
+
+        self.create_mbap_header(codec.DIAGNOSTIC_RESPONSE.size + len(data))
+
+        codec.DIAGNOSTIC_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, sub_function)
+
+        self.buffer[codec.PDU_OFFSET + codec.DIAGNOSTIC_RESPONSE.size:] = data
+
+    # [create_pdu_fc15] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc15(self):
+
+        """
+        Sample "Write Multiple Coils (fc15)" Request:
+        00:19 00:00 00:08 01 0F 0F:A0 00:03 01 05
+
+        MBAP (MODBUS Application Header) Header:
+            00:19 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:08 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            0F    : Function Code
+            0F A0 : Start Reference
+            00 03 : Coil Count
+            01    : Byte Count
+            05    : Data To Be Written - 1 0 1 @ 0FA0
+
+        ----------------
+
+        Sample "Write Multiple Coils (fc15)" Response:
+        00:19 00:00 00:06 01 0F 0F:A0 00:03
+
+        MBAP (MODBUS Application Header) Header:
+            00:19 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            0F    : Function Code
+            0F A0 : Start Reference
+            00 03 : Coil Count
+        """
+
+        # bits were unpacked byte-wise while parsing, the store packs them back byte-wise
+        self.store.set_bits(g.TABLE_DISCRETE_OUTPUT_COILS, self.request.start_reference,
+                            self.request.data_to_be_written)
+
+        self.create_mbap_header(codec.WRITE_MULTIPLE_RESPONSE.size)
+
+        codec.WRITE_MULTIPLE_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code,
+                                                self.request.start_reference, self.request.register_count)
+
+    # [create_pdu_fc16] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc16(self):
+
+        """
+        Sample "Write Multiple Registers (fc16)" Request:
+        00:21 00:00 00:0B 01 10 0F:A0 00:02 04 01:F4 03:E8
+
+        MBAP (MODBUS Application Header) Header:
+            00:21 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:0B : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            10    : Function Code
+            0F A0 : Start Reference
+            00 02 : Register Count
+            04    : Byte Count
+            01 F4 : Data 01
+            03 E8 : Data 02
+
+        ----------------
+
+        Sample "Write Multiple Registers (fc16)" Response:
+        00:21 00:00 00:06 01 10 0F:A0 00:02
+
+        MBAP (MODBUS Application Header) Header:
+            00:21 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:06 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            10    : Function Code
+            0F A0 : Start Reference
+            00 02 : Register Count
+        """
+
+        # the data field is already in the byte order of the store, a single slice copy
+        self.store.set_register_bytes(g.TABLE_ANALOG_OUTPUT_REGISTERS, self.request.start_reference,
+                                      self.request.data_bytes)
+
+        self.create_mbap_header(codec.WRITE_MULTIPLE_RESPONSE.size)
+
+        codec.WRITE_MULTIPLE_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code,
+                                                self.request.start_reference, self.request.register_count)
+
+    # [create_pdu_fc22] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc22(self):
+
+        """
+        Sample "Mask Write Register (fc22)" Request:
+        00:23 00:00 00:08 01 16 00:04 00:F2 00:25
+
+        MBAP (MODBUS Application Header) Header:
+            00:23 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:08 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            16    : Function Code
+            00 04 : Reference
+            00 F2 : And Mask
+            00 25 : Or Mask
+
+        ----------------
+
+        Sample "Mask Write Register (fc22)" Response - an echo of the request:
+        00:23 00:00 00:08 01 16 00:04 00:F2 00:25
+
+        The register becomes (current AND And Mask) OR (Or Mask AND NOT And Mask): 0x12 -> 0x17 here.
+        """
+
+        self.store.mask_register(g.TABLE_ANALOG_OUTPUT_REGISTERS, self.request.start_reference,
+                                 self.request.and_mask, self.request.or_mask)
+
+        self.create_mbap_header(codec.MASK_WRITE_RESPONSE.size)
+
+        codec.MASK_WRITE_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code,
+                                            self.request.start_reference, self.request.and_mask, self.request.or_mask)
+
+    # [create_pdu_fc23] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc23(self):
+
+        """
+        Sample "Read/Write Multiple Registers (fc23)" Request:
+        00:24 00:00 00:0F 01 17 00:03 00:06 00:0E 00:02 04 00:FF 00:FF
+
+        MBAP (MODBUS Application Header) Header:
+            00:24 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:0F : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            17    : Function Code
+            00 03 : Read Start Reference
+            00 06 : Read Register Count
+            00 0E : Write Start Reference
+            00 02 : Write Register Count
+            04    : Byte Count
+            00 FF : Data 01
+            00 FF : Data 02
+
+        ----------------
+
+        Sample "Read/Write Multiple Registers (fc23)" Response:
+        00:24 00:00 00:0F 01 17 0C 00:FE 0A:CD 00:01 00:03 00:0D 00:FF
+
+        MBAP (MODBUS Application Header) Header:
+            00:24 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:0F : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            17    : Function Code
+            0C    : Data Size
+            00 FE : Data 01 @ 0003
+            ...
+            00 FF : Data 06 @ 0008
+
+        The write is performed before the read, both on the holding registers as one operation of the store.
+        """
+
+        byte_count = self.request.register_count * 2
+        data       = self.store.write_read_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, self.request.write_reference,
+                                                     self.request.data_bytes, self.request.start_reference,
+                                                     self.request.register_count)
+
+        self.create_mbap_header(codec.READ_RESPONSE.size + byte_count)
+
+        codec.READ_RESPONSE.pack_into(self.buffer, codec.PDU_OFFSET, self.request.function_code, byte_count)
+
+        self.buffer[codec.PDU_OFFSET + codec.READ_RESPONSE.size:] = data
+
+    # [create_pdu_fc43] ------------------------------------------------------------------------------------------------
+
+    def create_pdu_fc43(self):
+
+        """
+        Sample "Read Device Identification (fc43 / 0x0E)" Request:
+        00:25 00:00 00:05 01 2B 0E 01 00
+
+        MBAP (MODBUS Application Header) Header:
+            00:25 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:05 : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            2B    : Function Code
+            0E    : MEI Type
+            01    : Read Device ID Code
+            00    : Object ID
+
+        ----------------
+
+        Sample "Read Device Identification (fc43 / 0x0E)" Response:
+        00:25 00:00 00:1D 01 2B 0E 01 81 00 00 03 00 06 6D 6F 64 65 6D 75 01 06 4D 4F 44 45 4D 55 02 03 31 2E 30
+
+        MBAP (MODBUS Application Header) Header:
+            00:25 : Transaction ID - Master increases with on every request
+            00:00 : Protocol Identifier - 0 for MODBUS Standard Protocol
+            00:1D : Message Length
+            01    : Unit ID
+        PDU (Protocol Data Unit):
+            2B    : Function Code
+            0E    : MEI Type
+            01    : Read Device ID Code
+            81    : Conformity Level - basic, stream and individual access
+            00    : More Follows - FF when the objects did not fit, the Master asks again from Next Object ID
+            00    : Next Object ID
+            03    : Number Of Objects
+            00 06 : Object 00 (Vendor Name), 6 bytes: modemu
+            ...
+            02 03 : Object 02 (Major Minor Revision), 3 bytes: 1.0
+        """
+
+        objects   = self.identification
+        code      = self.request.device_id_code
+        object_id = self.request.object_id
+
+        if code == g.DEVICE_ID_04_SPECIFIC:
+            if object_id not in objects:
+                self.create_exception_pdu(g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS)
+                return
+
+            selected = [object_id]
+        else:
+            last      = {g.DEVICE_ID_01_BASIC  : g.OBJECT_02_MAJOR_MINOR_REVISION,
+                         g.DEVICE_ID_02_REGULAR: g.OBJECT_80_FIRST_EXTENDED - 1}.get(code, 0xFF)
+            available = [candidate for candidate in sorted(objects) if candidate <= last]
+
+            # an unknown object id restarts the stream from its beginning
+            selected = [candidate for candidate in available if candidate >= object_id] \
+                if object_id in available else available
+
+        # values too long for a response of their own are truncated, the first object always fits
+        values = [objects[candidate][:codec.MAX_DEVICE_ID_OBJECT_SIZE] for candidate in selected]
+        size   = codec.DEVICE_ID_RESPONSE.size
+        count  = 0
+
+        for value in values:
+            size += codec.DEVICE_ID_OBJECT.size + len(value)
+
+            if size > codec.MAX_PDU_SIZE:
+                break
+
+            count += 1
+
+        more_follows = 0xFF if count < len(selected) else 0x00
+        next_object  = selected[count] if count < len(selected) else 0x00
+
+        if any(candidate >= g.OBJECT_80_FIRST_EXTENDED for candidate in objects):
+            conformity = 0x83
+        elif any(candidate > g.OBJECT_02_MAJOR_MINOR_REVISION for candidate in objects):
+            conformity = 0x82
+        else:
+            conformity = 0x81
 
-        # function code
-        self.bytes.append(byte_utils.from_u8(self.request.function_code))
+        pdu = bytearray(codec.DEVICE_ID_RESPONSE.pack(self.request.function_code, self.request.mei_type, code,
+                                                      conformity, more_follows, next_object, count))
 
-        # data size
-        self.bytes.append(byte_utils.from_u8(self.request.register_count * 2))
+        for candidate, value in zip(selected, values)[:count]:
+            pdu += codec.DEVICE_ID_OBJECT.pack(candidate, len(value)) + value
 
-        # read data from config
-        for i in range(self.request.start_reference, self.request.register_count):
-            dv_hi, dv_lo = byte_utils.from_u16(self.tables[table_id][i])
-            self.bytes.append(dv_hi)
-            self.bytes.append(dv_lo)
+        self.create_mbap_header(len(pdu))
 
-        # update message length
-        self.bytes[4], self.bytes[5] = byte_utils.from_u16(len(self.bytes) - 6)
+        self.buffer[codec.PDU_OFFSET:] = pdu
 
     # [out] ------------------------------------------------------------------------------------------------------------
 
     def out(self):
-        return ''.join(x for x in self.bytes)
+        return self.buffer
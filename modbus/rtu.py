@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+
+import codec
+import globals as g
+
+from framer import FramingError
+
+
+# [globals] ############################################################################################################
+
+MAX_ADU_SIZE = 256     # unit id + 253 bytes of PDU + crc
+MIN_ADU_SIZE = 4       # unit id, function code, crc
+CRC          = struct.Struct('<H')  # the only little endian field of MODBUS
+BUFFER_SIZE  = 4096
+
+BROADCAST_UNIT_ID = 0
+
+# request sizes known from the function code alone: unit id, pdu and crc
+REQUEST_SIZES = {
+    g.FUNC_01_READ_COIL_STATUS                : 8,
+    g.FUNC_02_READ_INPUT_STATUS               : 8,
+    g.FUNC_03_READ_HOLDING_REGISTERS          : 8,
+    g.FUNC_04_READ_INPUT_REGISTERS            : 8,
+    g.FUNC_05_WRITE_SINGLE_COIL               : 8,
+    g.FUNC_06_WRITE_SINGLE_REGISTER           : 8,
+    g.FUNC_08_DIAGNOSTICS                     : 8,  # two data bytes, longer query data only frames by the gap
+    g.FUNC_22_MASK_WRITE_REGISTER             : 10,
+    g.FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT: 7   # mei type, read device id code, object id
+}
+
+# requests carrying a byte count: its offset, the size is offset + 1 + byte count + crc
+BYTE_COUNT_OFFSETS = {
+    g.FUNC_15_WRITE_MULTIPLE_COILS         : 6,
+    g.FUNC_16_WRITE_MULTIPLE_REGISTERS     : 6,
+    g.FUNC_23_READ_WRITE_MULTIPLE_REGISTERS: 10
+}
+
+
+# [create_crc_table] ###################################################################################################
+
+def create_crc_table():
+
+    table = []
+
+    for byte in range(256):
+        crc = byte
+
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+
+        table.append(crc)
+
+    return table
+
+
+# [crc16] ##############################################################################################################
+
+def crc16(data):
+
+    """
+    MODBUS CRC16 (reflected 0x8005, initial 0xFFFF) of a whole buffer, one table lookup per byte. The crc of a frame
+    including its own crc is 0.
+    """
+
+    crc   = 0xFFFF
+    table = CRC_TABLE
+
+    for byte in bytearray(data):
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+
+    return crc
+
+
+# [to_mbap] ############################################################################################################
+
+def to_mbap(frame):
+
+    """
+    RTU frame (crc already checked) to a MBAP framed ADU with transaction id 0, the codecs only speak MBAP.
+    """
+
+    return bytearray(codec.MBAP_HEADER.pack(0, 0, len(frame) - 2, frame[0])) + frame[1:-2]
+
+
+# [to_rtu] #############################################################################################################
+
+def to_rtu(adu):
+
+    """
+    MBAP framed ADU to a RTU frame: the unit id and the PDU, followed by their crc.
+    """
+
+    frame = adu[codec.MBAP_HEADER_SIZE - 1:]
+
+    return frame + CRC.pack(crc16(frame))
+
+
+# [request_size] #######################################################################################################
+
+def request_size(buffer):
+
+    """
+    Size of the RTU request at the front of `buffer`, None while too few bytes are there to tell. Raises FramingError
+    for a function code whose size is not known.
+    """
+
+    if len(buffer) < 2:
+        return None
+
+    function_code = buffer[1]
+    size          = REQUEST_SIZES.get(function_code)
+
+    if size is not None:
+        return size
+
+    offset = BYTE_COUNT_OFFSETS.get(function_code)
+
+    if offset is None:
+        raise FramingError('Unknown RTU request size')
+
+    if len(buffer) <= offset:
+        return None
+
+    return offset + 1 + buffer[offset] + CRC.size
+
+
+# [RtuFramer] ##########################################################################################################
+
+class RtuFramer:
+
+    """
+        Incremental MODBUS RTU framer, used in place of framer.Framer.
+
+        RTU frames carry no length. On a byte stream (RTU over TCP) a request is cut by the size its function code
+        implies. On a serial line the silence after a frame delimits it as well, `gap_delimited` framers are told about
+        it through `end_of_frame` and also take requests of unknown sizes.
+
+        Frames are checked against their crc and returned converted to MBAP, so the codecs, the cache and the metrics
+        stay unaware of the framing. Responses go back through to_rtu.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, gap_delimited=False):
+
+        self.buffer        = bytearray()
+        self.gap_delimited = gap_delimited
+        self.crc_errors    = 0
+
+    # [recv_into] ------------------------------------------------------------------------------------------------------
+
+    def recv_into(self, client):
+
+        """
+        Receives as much as the buffer has room for. Raises FramingError when it is full: the frames in it are to be
+        taken out first, a buffer still full after that holds no frame at all.
+        """
+
+        room = BUFFER_SIZE - len(self.buffer)
+
+        if room <= 0:
+            raise FramingError('Receive buffer overflow')
+
+        data         = client.recv(room)
+        self.buffer += data
+
+        return len(data)
+
+    # [feed] -----------------------------------------------------------------------------------------------------------
+
+    def feed(self, data):
+
+        self.buffer += data
+
+        if len(self.buffer) > BUFFER_SIZE:
+            raise FramingError('Receive buffer overflow')
+
+    # [pending] --------------------------------------------------------------------------------------------------------
+
+    def pending(self):
+
+        return len(self.buffer)
+
+    # [next_frame] -----------------------------------------------------------------------------------------------------
+
+    def next_frame(self):
+
+        try:
+            size = request_size(self.buffer)
+        except FramingError:
+            if self.gap_delimited:
+                return None  # the gap will tell
+            raise
+
+        if size is None or len(self.buffer) < size:
+            return None
+
+        if self.gap_delimited and crc16(self.buffer[:size]) != 0:
+            return None  # longer than its function code implies, the gap will tell
+
+        return self.take(size)
+
+    # [end_of_frame] ---------------------------------------------------------------------------------------------------
+
+    def end_of_frame(self):
+
+        """
+        The line went silent: everything received is one frame.
+        """
+
+        return self.take(len(self.buffer)) if self.buffer else None
+
+    # [take] -----------------------------------------------------------------------------------------------------------
+
+    def take(self, size):
+
+        frame = self.buffer[:size]
+
+        del self.buffer[:size]
+
+        if size < MIN_ADU_SIZE or size > MAX_ADU_SIZE or crc16(frame) != 0:
+            self.crc_errors += 1
+            del self.buffer[:]  # whatever follows a broken frame can not be trusted either
+            raise FramingError('RTU frame crc mismatch')
+
+        return to_mbap(frame)
+
+
+# [CRC_TABLE] ##########################################################################################################
+
+CRC_TABLE = create_crc_table()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import errno
+import os
+import termios
+import time
+import tty
+
+import framer
+import rtu
+import server
+
+
+# [globals] ############################################################################################################
+
+PARITIES = {
+    'N': 0,
+    'E': termios.PARENB,
+    'O': termios.PARENB | termios.PARODD
+}
+
+FAST_BAUD_RATE = 19200    # above it the silent interval is fixed
+FAST_GAP       = 0.00175  # seconds
+
+
+# [frame_gap] ##########################################################################################################
+
+def frame_gap(baud_rate):
+
+    """
+    The silent interval of 3.5 characters ending a RTU frame, a character being 11 bits on the line.
+    """
+
+    if baud_rate > FAST_BAUD_RATE:
+        return FAST_GAP
+
+    return 3.5 * 11 / baud_rate
+
+
+# [SerialServer] #######################################################################################################
+
+class SerialServer(server.Server):
+
+    """
+        MODBUS RTU slave on a serial line - a tty device, or the slave side of a pty for testing.
+
+        Frames end either when the size implied by their function code has arrived or when the line stays silent for
+        3.5 characters. The silence is detected by polling with the gap as timeout while a frame is pending, the loop
+        sleeps in the poller otherwise. Only units of the registry answer, broadcasts are never answered.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, device, registry, baud_rate=19200, parity='E', stop_bits=1, **options):
+
+        server.Server.__init__(self, None, None, registry, **options)
+
+        if parity not in PARITIES:
+            raise Exception('Parity should be one of N, E, O')
+
+        self.device    = device
+        self.baud_rate = baud_rate
+        self.parity    = parity
+        self.stop_bits = stop_bits
+        self.gap       = frame_gap(baud_rate)
+        self.fd        = None
+        self.framer    = rtu.RtuFramer(gap_delimited=True)
+        self.received  = 0.0  # time of the last read
+
+    # [listen] ---------------------------------------------------------------------------------------------------------
+
+    def listen(self):
+
+        self.fd = os.open(self.device, os.O_RDWR | os.O_NOCTTY)
+
+        tty.setraw(self.fd)
+
+        attributes = termios.tcgetattr(self.fd)
+        speed      = getattr(termios, 'B%d' % self.baud_rate)
+
+        attributes[2] &= ~(termios.PARENB | termios.PARODD | termios.CSTOPB)
+        attributes[2] |= PARITIES[self.parity] | (termios.CSTOPB if self.stop_bits == 2 else 0)
+        attributes[4]  = speed
+        attributes[5]  = speed
+
+        # reads return whatever has arrived without waiting
+        attributes[6][termios.VMIN]  = 0
+        attributes[6][termios.VTIME] = 0
+
+        termios.tcsetattr(self.fd, termios.TCSANOW, attributes)
+
+        self.poller.register(self.fd, server.EVENT_READ)
+        self.listen_stats()
+        self.listen_reload()
+
+    # [serve_forever] --------------------------------------------------------------------------------------------------
+
+    def serve_forever(self):
+
+        if self.fd is None:
+            self.listen()
+
+        stats_fd  = self.socket_stats.fileno() if self.socket_stats is not None else None
+        next_dump = time.time() + self.stats_interval if self.stats_interval else None
+
+        while self.running:
+            timeout = None
+
+            if self.framer.pending():
+                timeout = max(0.0, self.received + self.gap - time.time())
+
+            for timer in (next_dump, self.next_tick()):
+                if timer is not None:
+                    until   = max(0.0, timer - time.time())
+                    timeout = until if timeout is None else min(timeout, until)
+
+            for fd, events in self.poller.poll(timeout):
+                if fd == self.fd:
+                    self.handle_read()
+                elif fd == stats_fd:
+                    self.serve_stats()
+                else:
+                    self.handle_event(fd, events)
+
+            self.tick(time.time())
+
+            if self.framer.pending() and time.time() - self.received >= self.gap:
+                # the line went silent
+                self.handle_frame(self.framer.end_of_frame)
+
+            if next_dump is not None and time.time() >= next_dump:
+                self.dump_stats()
+                next_dump = time.time() + self.stats_interval
+
+    # [shutdown] -------------------------------------------------------------------------------------------------------
+
+    def shutdown(self):
+
+        server.Server.shutdown(self)
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # [handle_read] ----------------------------------------------------------------------------------------------------
+
+    def handle_read(self):
+
+        try:
+            data = os.read(self.fd, rtu.BUFFER_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+
+        self.received = time.time()
+
+        try:
+            self.framer.feed(data)
+        except framer.FramingError:
+            self.metrics.framing_errors += 1
+            self.framer.buffer = bytearray()
+            return
+
+        while self.framer.pending() and self.handle_frame(self.framer.next_frame):
+            pass
+
+    # [handle_frame] ---------------------------------------------------------------------------------------------------
+
+    def handle_frame(self, next_frame):
+
+        """
+        Serves the frame `next_frame` returns, if any. Returns whether there was one.
+        """
+
+        try:
+            frame = next_frame()
+        except framer.FramingError:
+            self.metrics.framing_errors += 1
+            return False
+
+        if frame is None:
+            return False
+
+        req, out = self.process(0, frame)
+
+        if req.unit_id != rtu.BROADCAST_UNIT_ID and self.registry.get(req.unit_id) is not None:
+            out = rtu.to_rtu(out)
+
+            while out:
+                out = out[os.write(self.fd, out):]
+
+        return True
@@ -0,0 +1,799 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import errno
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+import cache
+import codec
+import framer
+import globals as g
+import limits
+import metrics
+import request
+import response
+import rtu
+import wirelog
+
+
+# [globals] ############################################################################################################
+
+EVENT_READ  = 1
+EVENT_WRITE = 2
+EVENT_ERROR = 4
+
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)  # not exported by python 2, 15 on linux
+
+FRAMING_TCP = 'tcp'
+FRAMING_RTU = 'rtu'  # rtu over tcp
+
+STATS_HOST    = '127.0.0.1'
+STATS_TIMEOUT = 1.0  # seconds to hand a snapshot over to a stats client
+
+# fc43 objects answered when none are configured, the basic ones are mandatory
+DEVICE_IDENTIFICATION = {
+    g.OBJECT_00_VENDOR_NAME         : 'modemu',
+    g.OBJECT_01_PRODUCT_CODE        : 'MODEMU',
+    g.OBJECT_02_MAJOR_MINOR_REVISION: '1.0'
+}
+
+
+# [Poller] #############################################################################################################
+
+class Poller:
+
+    """
+        Thin readiness notification wrapper. epoll is used where the platform provides it, select() otherwise.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self):
+
+        self.epoll   = None
+        self.readers = set()
+        self.writers = set()
+
+        if hasattr(select, 'epoll'):
+            self.epoll = select.epoll()
+
+    # [register] -------------------------------------------------------------------------------------------------------
+
+    def register(self, fd, events):
+
+        if self.epoll is not None:
+            self.epoll.register(fd, self.to_epoll_mask(events))
+        else:
+            self.modify_sets(fd, events)
+
+    # [modify] ---------------------------------------------------------------------------------------------------------
+
+    def modify(self, fd, events):
+
+        if self.epoll is not None:
+            self.epoll.modify(fd, self.to_epoll_mask(events))
+        else:
+            self.modify_sets(fd, events)
+
+    # [unregister] -----------------------------------------------------------------------------------------------------
+
+    def unregister(self, fd):
+
+        if self.epoll is not None:
+            self.epoll.unregister(fd)
+        else:
+            self.readers.discard(fd)
+            self.writers.discard(fd)
+
+    # [poll] -----------------------------------------------------------------------------------------------------------
+
+    def poll(self, timeout=None):
+
+        """
+        Returns (fd, events) pairs, none when interrupted by a signal.
+        """
+
+        try:
+            return self.wait(timeout)
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+    # [close] ----------------------------------------------------------------------------------------------------------
+
+    def close(self):
+
+        if self.epoll is not None:
+            self.epoll.close()
+
+    # [wait] -----------------------------------------------------------------------------------------------------------
+
+    def wait(self, timeout):
+
+        if self.epoll is not None:
+            events = []
+
+            for fd, mask in self.epoll.poll(-1 if timeout is None else timeout):
+                ready = 0
+
+                if mask & select.EPOLLIN:
+                    ready |= EVENT_READ
+                if mask & select.EPOLLOUT:
+                    ready |= EVENT_WRITE
+                if mask & (select.EPOLLERR | select.EPOLLHUP):
+                    ready |= EVENT_ERROR | EVENT_READ
+
+                events.append((fd, ready))
+
+            return events
+
+        readable, writable, _ = select.select(self.readers, self.writers, [], timeout)
+        ready                 = {}
+
+        for fd in readable:
+            ready[fd] = EVENT_READ
+        for fd in writable:
+            ready[fd] = ready.get(fd, 0) | EVENT_WRITE
+
+        return ready.items()
+
+    # [modify_sets] ----------------------------------------------------------------------------------------------------
+
+    def modify_sets(self, fd, events):
+
+        if events & EVENT_READ:
+            self.readers.add(fd)
+        else:
+            self.readers.discard(fd)
+
+        if events & EVENT_WRITE:
+            self.writers.add(fd)
+        else:
+            self.writers.discard(fd)
+
+    # [to_epoll_mask] --------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def to_epoll_mask(events):
+
+        mask = 0
+
+        if events & EVENT_READ:
+            mask |= select.EPOLLIN
+        if events & EVENT_WRITE:
+            mask |= select.EPOLLOUT
+
+        return mask
+
+
+# [Connection] #########################################################################################################
+
+class Connection:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, client, address, connection_id, framing=FRAMING_TCP):
+
+        self.socket        = client
+        self.address       = address
+        self.ip            = address[0]
+        self.id            = connection_id
+        self.fd            = client.fileno()
+        self.rtu           = framing == FRAMING_RTU
+        self.framer        = rtu.RtuFramer() if self.rtu else framer.Framer()
+        self.out_buffer    = bytearray()
+        self.writing       = False
+        self.paused        = False        # held back by the request rate, not read from
+        self.last_activity = time.time()  # of the last read
+        self.frame_started = None         # time the partial frame in the framer, if any, began to arrive
+
+
+# [Server] #############################################################################################################
+
+class Server:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, host, port, registry, backlog=5, reuse_port=False, cache_size=0, stats_port=None,
+                 stats_interval=0, stats_file=None, timing_sample=16, wire_log=None, framing=FRAMING_TCP,
+                 identification=None, connection_limits=None, reloader=None):
+
+        """
+        A snapshot of the metrics is served as json to every connection on `stats_port` (localhost only) and, every
+        `stats_interval` seconds, appended as one json line to `stats_file` (stderr when not given). One request out of
+        `timing_sample` has its stages timed, 0 turns timing off. `wire_log` are the keyword arguments of a
+        wirelog.WireLog, None leaves wire logging off. `framing` is FRAMING_TCP or FRAMING_RTU (rtu over tcp).
+        `identification` maps fc43 object ids to their values, DEVICE_IDENTIFICATION by default.
+        `connection_limits` are the keyword arguments of a limits.Limits, no limits by default. `reloader` is a
+        hotreload.Reloader applying config reloads to `registry`.
+        """
+
+        if framing not in (FRAMING_TCP, FRAMING_RTU):
+            raise Exception('Unknown framing: %s' % framing)
+
+        self.host           = host
+        self.port           = port
+        self.registry       = registry
+        self.backlog        = backlog
+        self.reuse_port     = reuse_port
+        self.poller         = Poller()
+        self.connections    = {}
+        self.socket_server  = None
+        self.cache          = cache.ResponseCache(cache_size) if cache_size > 0 else None
+        self.metrics        = metrics.Metrics(timing_sample)
+        self.stats_port     = stats_port
+        self.stats_interval = stats_interval
+        self.stats_file     = stats_file
+        self.socket_stats   = None
+        self.wire_log       = wirelog.WireLog(**wire_log) if wire_log is not None else None
+        self.framing        = framing
+        self.identification = identification if identification is not None else DEVICE_IDENTIFICATION
+        self.limits         = limits.Limits(**(connection_limits or {}))
+        self.paused         = {}  # fd -> time the paused connection may be read from again
+        self.reloader       = reloader
+        self.connection_ids = 0
+        self.running        = True  # serve_forever returns once cleared
+
+    # [listen] ---------------------------------------------------------------------------------------------------------
+
+    def listen(self):
+
+        self.socket_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if self.reuse_port:
+            self.socket_server.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        self.socket_server.bind((self.host, self.port))
+        self.socket_server.listen(self.backlog)
+        self.socket_server.setblocking(0)
+
+        self.poller.register(self.socket_server.fileno(), EVENT_READ)
+
+        self.listen_stats()
+        self.listen_reload()
+
+    # [listen_stats] ---------------------------------------------------------------------------------------------------
+
+    def listen_stats(self):
+
+        if self.stats_port is not None:
+            self.socket_stats = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket_stats.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket_stats.bind((STATS_HOST, self.stats_port))
+            self.socket_stats.listen(self.backlog)
+            self.socket_stats.setblocking(0)
+
+            self.poller.register(self.socket_stats.fileno(), EVENT_READ)
+
+    # [listen_reload] --------------------------------------------------------------------------------------------------
+
+    def listen_reload(self):
+
+        if self.reloader is not None:
+            self.poller.register(self.reloader.read_fd, EVENT_READ)
+
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.reloader.request())
+
+    # [serve_forever] --------------------------------------------------------------------------------------------------
+
+    def serve_forever(self):
+
+        if self.socket_server is None:
+            self.listen()
+
+        listen_fd  = self.socket_server.fileno()
+        stats_fd   = self.socket_stats.fileno() if self.socket_stats is not None else None
+        next_dump  = None
+        next_check = None
+
+        if self.stats_interval:
+            next_dump = time.time() + self.stats_interval
+
+        if self.limits.check_interval is not None:
+            next_check = time.time() + self.limits.check_interval
+
+        while self.running:
+            timers  = [timer for timer in [next_dump, next_check, self.next_tick()] + self.paused.values()
+                       if timer is not None]
+            timeout = max(0.0, min(timers) - time.time()) if timers else None
+
+            for fd, events in self.poller.poll(timeout):
+
+                if fd == listen_fd:
+                    self.accept()
+                    continue
+
+                if fd == stats_fd:
+                    self.serve_stats()
+                    continue
+
+                connection = self.connections.get(fd)
+
+                if connection is None:
+                    self.handle_event(fd, events)
+                    continue
+
+                # a paused connection is not read from, unless the peer is gone
+                if events & EVENT_READ and (not connection.paused or events & EVENT_ERROR):
+                    self.handle_read(connection)
+
+                if events & EVENT_WRITE and fd in self.connections:
+                    self.handle_write(connection)
+
+            now = time.time()
+
+            self.tick(now)
+
+            if self.paused:
+                self.resume_due(now)
+
+            if next_check is not None and now >= next_check:
+                self.close_expired(now)
+                next_check = now + self.limits.check_interval
+
+            if next_dump is not None and now >= next_dump:
+                self.dump_stats()
+                next_dump = time.time() + self.stats_interval
+
+    # [accept] ---------------------------------------------------------------------------------------------------------
+
+    def accept(self):
+
+        while True:
+            try:
+                client, address = self.socket_server.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                raise
+
+            if not self.limits.admit(address[0], len(self.connections)):
+                client.close()
+                continue
+
+            client.setblocking(0)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            self.connection_ids += 1
+
+            connection = Connection(client, address, self.connection_ids, self.framing)
+
+            self.connections[connection.fd] = connection
+            self.poller.register(connection.fd, EVENT_READ)
+            self.metrics.connection_opened()
+
+    # [handle_read] ----------------------------------------------------------------------------------------------------
+
+    def handle_read(self, connection):
+
+        pending = connection.framer.pending()
+
+        try:
+            received = connection.framer.recv_into(connection.socket)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+
+            received = 0
+        except framer.FramingError:
+            # a full receive buffer is an error only once the complete frames waiting in it are served
+            if not self.serve_frames(connection) and connection.fd in self.connections:
+                self.metrics.framing_errors += 1
+                self.close(connection)
+            return
+
+        if not received:
+            self.close(connection)
+            return
+
+        now                      = time.time()
+        connection.last_activity = now
+
+        if not pending:
+            connection.frame_started = now
+
+        if connection.paused:
+            return
+
+        if self.serve_frames(connection):
+            # whatever is left is a frame that started in this read at the earliest
+            connection.frame_started = now
+
+    # [serve_frames] ---------------------------------------------------------------------------------------------------
+
+    def serve_frames(self, connection):
+
+        """
+        Serves the complete frames received on `connection`, until its client runs out of requests for now. Returns the
+        number of frames served.
+        """
+
+        served = 0
+
+        while True:
+            try:
+                frame = connection.framer.next_frame()
+            except framer.FramingError:
+                # the stream can not be resynchronized once a header is broken
+                self.metrics.framing_errors += 1
+                self.close(connection)
+                return served
+
+            if frame is None:
+                break
+
+            self.respond(connection, frame)
+            served += 1
+
+            if self.limits.request_rate:
+                wait = self.limits.take(connection.ip, time.time())
+
+                if wait:
+                    self.pause(connection, wait)
+                    break
+
+        if connection.out_buffer:
+            self.handle_write(connection)
+
+        return served
+
+    # [respond] --------------------------------------------------------------------------------------------------------
+
+    def respond(self, connection, frame):
+
+        req, out = self.process(connection.id, frame)
+
+        if not connection.rtu:
+            connection.out_buffer += out
+        elif req.unit_id != rtu.BROADCAST_UNIT_ID:  # broadcasts are never answered
+            connection.out_buffer += rtu.to_rtu(out)
+
+    # [pause] ----------------------------------------------------------------------------------------------------------
+
+    def pause(self, connection, wait):
+
+        connection.paused          = True
+        self.paused[connection.fd] = time.time() + wait
+
+        self.poller.modify(connection.fd, self.interest(connection))
+
+    # [resume_due] -----------------------------------------------------------------------------------------------------
+
+    def resume_due(self, now):
+
+        for fd, due in self.paused.items():
+            connection = self.connections.get(fd)
+
+            if due > now or connection is None:
+                continue
+
+            del self.paused[fd]
+
+            connection.paused = False
+
+            self.poller.modify(fd, self.interest(connection))
+
+            # frames that arrived meanwhile are already buffered
+            if self.serve_frames(connection) and fd in self.connections:
+                connection.frame_started = now
+
+    # [close_expired] --------------------------------------------------------------------------------------------------
+
+    def close_expired(self, now):
+
+        for connection in self.connections.values():
+            if self.limits.expired(connection, now):
+                self.close(connection)
+
+    # [handle_event] ---------------------------------------------------------------------------------------------------
+
+    def handle_event(self, fd, events):
+
+        """
+        Events of the descriptors no connection is behind: a reload ready to be applied, or those registered by
+        subclasses, see proxy.ProxyServer.
+        """
+
+        if self.reloader is not None and fd == self.reloader.read_fd:
+            self.reloader.apply()
+
+    # [tick] -----------------------------------------------------------------------------------------------------------
+
+    def tick(self, now):
+
+        """
+        Called after every poll, once the events are handled.
+        """
+
+        if self.reloader is not None:
+            self.reloader.tick(now)
+
+    # [next_tick] ------------------------------------------------------------------------------------------------------
+
+    def next_tick(self):
+
+        """
+        Time by which tick has to run at the latest, None when nothing is due.
+        """
+
+        return self.reloader.next_watch if self.reloader is not None else None
+
+    # [interest] -------------------------------------------------------------------------------------------------------
+
+    def interest(self, connection):
+
+        return (EVENT_WRITE if connection.writing else 0) | (0 if connection.paused else EVENT_READ)
+
+    # [process] --------------------------------------------------------------------------------------------------------
+
+    def process(self, connection_id, frame):
+
+        """
+        Serves one MBAP framed request, returns it parsed along with the encoded response.
+        """
+
+        if self.metrics.timed():
+            req, out = self.handle_frame_timed(frame)
+        else:
+            req = request.Request(frame)
+            out = self.encode(req, self.registry.get(req.unit_id))
+
+        self.metrics.count(req.unit_id, req.function_code, len(frame), len(out),
+                           len(out) > codec.PDU_OFFSET and out[codec.PDU_OFFSET] & codec.EXCEPTION_BIT)
+
+        if self.wire_log is not None:
+            self.wire_log.log(connection_id, req, frame, out)
+
+        return req, out
+
+    # [handle_frame_timed] ---------------------------------------------------------------------------------------------
+
+    def handle_frame_timed(self, frame):
+
+        started    = time.time()
+        req        = request.Request(frame)
+        parsed     = time.time()
+        data_store = self.registry.get(req.unit_id)
+        dispatched = time.time()
+        out        = self.encode(req, data_store)
+
+        self.metrics.record_stages(parsed - started, dispatched - parsed, time.time() - dispatched)
+
+        return req, out
+
+    # [encode] ---------------------------------------------------------------------------------------------------------
+
+    def encode(self, req, data_store):
+
+        """
+        Requests refused by parsing or by the address map of their unit are answered from an exception template, the
+        store and the cache are not looked at. A failure in the store is answered with exception 04, the server goes on.
+        """
+
+        if data_store is None:
+            return codec.exception_response(req, g.EXCEPTION_11_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND)
+
+        if req.exception_code is not None:
+            return codec.exception_response(req, req.exception_code)
+
+        if data_store.address_map is not None:
+            exception_code = data_store.address_map.check(req)
+
+            if exception_code is not None:
+                return codec.exception_response(req, exception_code)
+
+        try:
+            if self.cache is not None and req.function_code in cache.READ_TABLES:
+                return self.cache.response(req, data_store)
+
+            return response.Response(req, data_store, diagnostics=self.metrics,
+                                     identification=self.identification).out()
+        except Exception:
+            return codec.exception_response(req, g.EXCEPTION_04_SLAVE_DEVICE_FAILURE)
+
+    # [handle_write] ---------------------------------------------------------------------------------------------------
+
+    def handle_write(self, connection):
+
+        try:
+            sent = connection.socket.send(connection.out_buffer)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                sent = 0
+            else:
+                self.close(connection)
+                return
+
+        del connection.out_buffer[:sent]
+
+        writing = len(connection.out_buffer) > 0
+
+        # only touch the poller when the write interest actually changes
+        if writing != connection.writing:
+            connection.writing = writing
+            self.poller.modify(connection.fd, self.interest(connection))
+
+    # [close] ----------------------------------------------------------------------------------------------------------
+
+    def close(self, connection):
+
+        if self.connections.pop(connection.fd, None) is not None:
+            self.metrics.connection_closed()
+            self.limits.release(connection.ip, time.time())
+
+        self.paused.pop(connection.fd, None)
+
+        try:
+            self.poller.unregister(connection.fd)
+        except (IOError, OSError, ValueError):
+            pass
+
+        connection.socket.close()
+
+    # [shutdown] -------------------------------------------------------------------------------------------------------
+
+    def shutdown(self):
+
+        """
+        Closes every connection and the listening sockets, once serve_forever has returned.
+        """
+
+        for connection in self.connections.values():
+            self.close(connection)
+
+        for listening in (self.socket_server, self.socket_stats):
+            if listening is not None:
+                listening.close()
+
+        self.poller.close()
+
+        if self.wire_log is not None:
+            self.wire_log.close()
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        snapshot           = self.metrics.snapshot()
+        snapshot['limits'] = self.limits.stats()
+
+        if self.cache is not None:
+            snapshot['cache'] = self.cache.stats()
+
+        if self.wire_log is not None:
+            snapshot['wire_log'] = self.wire_log.stats()
+
+        if self.reloader is not None:
+            snapshot['reload'] = self.reloader.stats()
+
+        return snapshot
+
+    # [serve_stats] ----------------------------------------------------------------------------------------------------
+
+    def serve_stats(self):
+
+        while True:
+            try:
+                client, _ = self.socket_stats.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                raise
+
+            try:
+                client.settimeout(STATS_TIMEOUT)
+                client.sendall(json.dumps(self.stats(), sort_keys=True) + '\n')
+            except socket.error:
+                pass
+            finally:
+                client.close()
+
+    # [dump_stats] -----------------------------------------------------------------------------------------------------
+
+    def dump_stats(self):
+
+        line = json.dumps(self.stats(), sort_keys=True) + '\n'
+
+        if self.stats_file is None:
+            sys.stderr.write(line)
+            return
+
+        with open(self.stats_file, 'a') as stats_file:
+            stats_file.write(line)
+
+
+# [serve_forked] #######################################################################################################
+
+def serve_forked(host, port, registry, backlog=5, workers=2, reloader=None, **options):
+
+    """
+    Runs `workers` server processes accepting on the same port (SO_REUSEPORT, the kernel spreads connections over them)
+    on top of one shared memory image of every slave. Writes handled by one worker are visible to all the others.
+    `options` are passed on to every worker's Server, every worker serves its own stats on the next port up from
+    `stats_port` and writes its wire log to a file of its own, suffixed with the worker number.
+
+    A `forked` hotreload.Reloader is run by the parent, on SIGHUP and on the watch interval, straight into the shared
+    images - workers ignore SIGHUP then. Its signal handlers only flag the reload, the parent runs it from its wait
+    loop: every signal wakes the loop up through the reloader's pipe (signal.set_wakeup_fd).
+    """
+
+    registry.share()
+
+    children = []
+
+    for worker in range(workers):
+        pid = os.fork()
+
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+            if reloader is not None:
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+            if options.get('stats_port'):
+                options['stats_port'] += worker
+
+            if options.get('wire_log') and options['wire_log'].get('path'):
+                options['wire_log'] = dict(options['wire_log'], path='%s.%d' % (options['wire_log']['path'], worker))
+
+            try:
+                Server(host, port, registry, backlog, reuse_port=True, **options).serve_forever()
+            finally:
+                os._exit(1)
+
+        children.append(pid)
+
+    def terminate(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    if reloader is not None:
+        signal.set_wakeup_fd(reloader.write_fd)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)  # signals without a handler do not wake up
+        signal.signal(signal.SIGHUP, lambda signum, frame: reloader.request())
+
+        # the parent sleeps in wait, the watch runs off a timer
+        if reloader.next_watch is not None:
+            signal.signal(signal.SIGALRM, lambda signum, frame: reloader.tick(time.time()))
+            signal.setitimer(signal.ITIMER_REAL, reloader.watch_interval, reloader.watch_interval)
+
+    while children:
+        if reloader is not None:
+            reloader.reload_requested()
+
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG if reloader is not None else 0)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+
+        if pid:
+            children.remove(pid)
+            continue
+
+        # nothing to do until the next signal, a child exiting included
+        try:
+            select.select([reloader.read_fd], [], [])
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+
+        os.read(reloader.read_fd, 4096)
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import ctypes
+import math
+import mmap
+import multiprocessing
+import sys
+import time
+
+from array import array
+
+import globals as g
+import store
+
+
+# [globals] ############################################################################################################
+
+MASK_64     = 0xFFFFFFFFFFFFFFFF
+EXACT_STEPS = 16    # random walk steps taken one by one, longer gaps are bridged by a single gaussian step
+
+BYTE_SWAP = sys.byteorder == 'little'
+
+
+# [noise] ##############################################################################################################
+
+def noise(seed, address, tick):
+
+    """
+    Uniform in [0, 1), a pure function of its arguments (splitmix64 finalizer) so any tick can be evaluated directly.
+    """
+
+    x  = (seed * 0x9E3779B97F4A7C15 + address * 0xBF58476D1CE4E5B9 + tick * 0x94D049BB133111EB) & MASK_64
+    x  = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    x  = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK_64
+    x ^= x >> 31
+
+    return x / 18446744073709551616.0
+
+
+# [Constant] ###########################################################################################################
+
+class Constant:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, value):
+
+        self.value = value
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        return [self.value] * count
+
+
+# [Ramp] ###############################################################################################################
+
+class Ramp:
+
+    """
+        Sawtooth from `low` to `high` every `period` seconds, each address `phase_step` seconds ahead of the previous.
+        Phases count from `first`, the first address of the range, whatever window is read.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, low, high, period, phase_step=0.0, first=0):
+
+        self.low        = low
+        self.high       = high
+        self.period     = float(period)
+        self.phase_step = phase_step
+        self.first      = first
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        low, span, period, phase_step = self.low, self.high - self.low, self.period, self.phase_step
+        offset                        = first - self.first
+
+        return [low + span * (((t + phase_step * (offset + i)) / period) % 1.0) for i in range(count)]
+
+
+# [Sine] ###############################################################################################################
+
+class Sine:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, amplitude, offset, period, phase_step=0.0, first=0):
+
+        self.amplitude  = amplitude
+        self.offset     = offset
+        self.omega      = 2 * math.pi / period
+        self.phase_step = phase_step
+        self.first      = first
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        amplitude, offset, omega, phase_step = self.amplitude, self.offset, self.omega, self.phase_step
+        sin                                  = math.sin
+        index                                = first - self.first
+
+        return [offset + amplitude * sin(omega * (t + phase_step * (index + i))) for i in range(count)]
+
+
+# [Counter] ############################################################################################################
+
+class Counter:
+
+    """
+        Counts `rate` per second from `start` and wraps at `modulo`.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, start, rate, modulo=65536, phase_step=0.0, first=0):
+
+        self.start      = start
+        self.rate       = rate
+        self.modulo     = modulo
+        self.phase_step = phase_step
+        self.first      = first
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        start, rate, modulo, phase_step = self.start, self.rate, self.modulo, self.phase_step
+        offset                          = first - self.first
+
+        return [(start + int(rate * (t + phase_step * (offset + i)))) % modulo for i in range(count)]
+
+
+# [Toggle] #############################################################################################################
+
+class Toggle:
+
+    """
+        1 for the first `duty` fraction of every `period` seconds, 0 for the rest.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, period, duty=0.5, phase_step=0.0, first=0):
+
+        self.period     = float(period)
+        self.on         = duty * period
+        self.phase_step = phase_step
+        self.first      = first
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        period, on, phase_step = self.period, self.on, self.phase_step
+        offset                 = first - self.first
+
+        return [1 if (t + phase_step * (offset + i)) % period < on else 0 for i in range(count)]
+
+
+# [Noise] ##############################################################################################################
+
+class Noise:
+
+    """
+        Uniform in [-amplitude, amplitude], redrawn every `interval` seconds.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, amplitude, interval=1.0, seed=0):
+
+        self.amplitude = amplitude
+        self.interval  = float(interval)
+        self.seed      = seed
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        amplitude, seed, tick = self.amplitude, self.seed, int(t / self.interval)
+
+        return [amplitude * (2 * noise(seed, address, tick) - 1) for address in range(first, first + count)]
+
+
+# [RandomWalk] #########################################################################################################
+
+class RandomWalk:
+
+    """
+        Moves every address by up to `step` every `interval` seconds, kept within [low, high].
+
+        Addresses only advance when they are read: the steps since the last read are replayed from the noise function,
+        a gap of more than EXACT_STEPS steps is bridged by one gaussian step of the same variance. The walk of a given
+        seed is reproducible for a given sequence of reads.
+
+        The position of every address is state: `share` moves it into shared memory before serve_forked workers are
+        forked, they all advance the one walk - under a process shared lock - instead of one walk each.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, first, last, step, low, high, start=None, interval=1.0, seed=0):
+
+        self.first    = first
+        self.step     = step
+        self.low      = low
+        self.high     = high
+        self.interval = float(interval)
+        self.seed     = seed
+        self.current  = array('d', [float(start if start is not None else (low + high) / 2.0)]) * (last - first + 1)
+        self.ticks    = array('l', [0]) * (last - first + 1)
+        self.lock     = None
+
+    # [share] ----------------------------------------------------------------------------------------------------------
+
+    def share(self):
+
+        """
+        Moves the position of every address into shared memory, must be called before worker processes are forked.
+        """
+
+        if self.lock is not None:
+            return
+
+        count        = len(self.current)
+        current_type = ctypes.c_double * count
+        ticks_type   = ctypes.c_long * count
+        segment      = mmap.mmap(-1, ctypes.sizeof(current_type) + ctypes.sizeof(ticks_type))
+        current      = current_type.from_buffer(segment)
+        ticks        = ticks_type.from_buffer(segment, ctypes.sizeof(current_type))
+
+        current[:]   = self.current.tolist()
+        ticks[:]     = self.ticks.tolist()
+        self.current = current
+        self.ticks   = ticks
+        self.lock    = multiprocessing.Lock()
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        if self.lock is None:
+            return self.walk(t, first, count)
+
+        with self.lock:
+            return self.walk(t, first, count)
+
+    # [walk] -----------------------------------------------------------------------------------------------------------
+
+    def walk(self, t, first, count):
+
+        tick   = int(t / self.interval)
+        seed   = self.seed
+        step   = self.step
+        result = []
+
+        for address in range(first, first + count):
+            index = address - self.first
+            value = self.current[index]
+            steps = tick - self.ticks[index]
+
+            if 0 < steps <= EXACT_STEPS:
+                for past in range(tick - steps + 1, tick + 1):
+                    value += step * (2 * noise(seed, address, past) - 1)
+            elif steps > 0:
+                # box muller, a uniform step in [-step, step] has a variance of step^2 / 3
+                u1     = max(noise(seed, address, tick), 1e-12)
+                u2     = noise(seed + 1, address, tick)
+                value += step * math.sqrt(steps / 3.0) * math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+
+            value               = min(max(value, self.low), self.high)
+            self.current[index] = value
+            self.ticks[index]   = tick
+
+            result.append(value)
+
+        return result
+
+
+# [Sum] ################################################################################################################
+
+class Sum:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, generators):
+
+        self.generators = generators
+
+    # [values] ---------------------------------------------------------------------------------------------------------
+
+    def values(self, t, first, count):
+
+        return [sum(values) for values in zip(*[generator.values(t, first, count) for generator in self.generators])]
+
+    # [share] ----------------------------------------------------------------------------------------------------------
+
+    def share(self):
+
+        for generator in self.generators:
+            if hasattr(generator, 'share'):
+                generator.share()
+
+
+# [create_generator] ###################################################################################################
+
+def create_generator(spec, first, last, seed):
+
+    """
+    Builds a generator out of its config entry, e.g. {"type": "sine", "amplitude": 100, "offset": 500, "period": 60}.
+    "sum" entries combine the generators listed under "generators". `seed` is used unless the entry has its own.
+    """
+
+    kind       = spec["type"]
+    seed       = spec.get("seed", seed)
+    phase_step = spec.get("phaseStep", 0.0)
+
+    if kind == "constant":
+        return Constant(spec["value"])
+    if kind == "ramp":
+        return Ramp(spec.get("low", 0), spec.get("high", 65535), spec["period"], phase_step, first)
+    if kind == "sine":
+        return Sine(spec["amplitude"], spec.get("offset", 0), spec["period"], phase_step, first)
+    if kind == "counter":
+        return Counter(spec.get("start", 0), spec.get("rate", 1), spec.get("modulo", 65536), phase_step, first)
+    if kind == "toggle":
+        return Toggle(spec["period"], spec.get("duty", 0.5), phase_step, first)
+    if kind == "noise":
+        return Noise(spec["amplitude"], spec.get("interval", 1.0), seed)
+    if kind == "randomWalk":
+        return RandomWalk(first, last, spec.get("step", 1), spec.get("low", 0), spec.get("high", 65535),
+                          spec.get("start"), spec.get("interval", 1.0), seed)
+    if kind == "sum":
+        return Sum([create_generator(item, first, last, seed + index)
+                    for index, item in enumerate(spec["generators"])])
+
+    raise Exception('Unknown generator type: %s' % kind)
+
+
+# [SimulatedRange] #####################################################################################################
+
+class SimulatedRange:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, first, last, generator, point_type=None):
+
+        self.first      = first
+        self.last       = last
+        self.generator  = generator
+        self.point_type = point_type  # points.PointType the values are encoded as, plain registers when None
+        self.computed   = None        # (tick, first, last) of the window written last
+
+
+# [Simulation] #########################################################################################################
+
+class Simulation:
+
+    """
+        Generators attached to address ranges of one slave.
+
+        Nothing runs in the background. A read of a store calls `update` first, which evaluates the generators of the
+        ranges overlapping the requested window for the current tick - the whole window at once - and writes the
+        values into the store. The read itself stays a plain copy out of the store, and a window already written in
+        the current tick is not evaluated again. Writes of masters to a simulated address are overwritten by the next
+        read of it.
+
+        Time is quantized to `resolution` seconds from `epoch`, so every read within one tick sees the same values.
+
+        A register range may hold typed points: the window is widened to whole points, the generator is evaluated once
+        per point and all of them are encoded by a single points.PointType call.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, resolution=0.1, epoch=None, clock=time.time):
+
+        self.resolution = resolution
+        self.clock      = clock
+        self.epoch      = epoch if epoch is not None else clock()
+        self.ranges     = [[] for _ in range(store.TABLE_COUNT)]
+
+    # [add] ------------------------------------------------------------------------------------------------------------
+
+    def add(self, table_id, first, last, generator, point_type=None):
+
+        store.check_range(first, last - first + 1)
+
+        if point_type is not None and (last - first + 1) % point_type.registers:
+            raise Exception('Simulated range should hold whole %s points' % point_type.data_type)
+
+        self.ranges[table_id].append(SimulatedRange(first, last, generator, point_type))
+
+    # [share] ----------------------------------------------------------------------------------------------------------
+
+    def share(self):
+
+        """
+        Moves the state of the generators keeping any into shared memory, see RandomWalk.share.
+        """
+
+        for ranges in self.ranges:
+            for simulated in ranges:
+                if hasattr(simulated.generator, 'share'):
+                    simulated.generator.share()
+
+    # [update] ---------------------------------------------------------------------------------------------------------
+
+    def update(self, data_store, table_id, start, count):
+
+        ranges = self.ranges[table_id]
+
+        if not ranges:
+            return
+
+        tick = int((self.clock() - self.epoch) / self.resolution)
+        last = start + count - 1
+
+        for simulated in ranges:
+            first_address = max(start, simulated.first)
+            last_address  = min(last, simulated.last)
+
+            if first_address > last_address:
+                continue
+
+            point_type = simulated.point_type
+
+            if point_type is not None:
+                # whole points only, a generator value per point
+                size          = point_type.registers
+                first_address = simulated.first + (first_address - simulated.first) / size * size
+                last_address  = simulated.first + ((last_address - simulated.first) / size + 1) * size - 1
+
+            computed = simulated.computed
+
+            if computed is not None and computed[0] == tick and computed[1] <= first_address and \
+                    last_address <= computed[2]:
+                continue
+
+            if point_type is not None:
+                # point n of the range is evaluated as address first + n, whichever window it is read in
+                size   = point_type.registers
+                values = simulated.generator.values(tick * self.resolution,
+                                                    simulated.first + (first_address - simulated.first) / size,
+                                                    (last_address - first_address + 1) / size)
+
+                data_store.set_register_bytes(table_id, first_address, point_type.encode(values))
+            else:
+                values = simulated.generator.values(tick * self.resolution, first_address,
+                                                    last_address - first_address + 1)
+
+                if table_id in (g.TABLE_DISCRETE_OUTPUT_COILS, g.TABLE_DISCRETE_INPUT_CONTACTS):
+                    data_store.set_bits(table_id, first_address,
+                                        bytearray(1 if value > 0 else 0 for value in values))
+                else:
+                    registers = array('H', [min(max(int(round(value)), 0), 65535) for value in values])
+
+                    if BYTE_SWAP:
+                        registers.byteswap()
+
+                    data_store.set_register_bytes(table_id, first_address, registers.tostring())
+
+            simulated.computed = (tick, first_address, last_address)
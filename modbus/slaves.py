@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import store
+
+
+# [globals] ############################################################################################################
+
+UNIT_ID_COUNT = 256  # MBAP unit id is a single byte
+
+
+# [SlaveRegistry] ######################################################################################################
+
+class SlaveRegistry:
+
+    """
+        Virtual slaves behind one listen address, keyed by MBAP unit id.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self):
+
+        self.stores = [None] * UNIT_ID_COUNT
+
+    # [add] ------------------------------------------------------------------------------------------------------------
+
+    def add(self, unit_id, data_store):
+
+        if unit_id < 0 or unit_id >= UNIT_ID_COUNT:
+            raise Exception('Unit id should be between 0 and 255')
+
+        self.stores[unit_id] = data_store
+
+    # [get] ------------------------------------------------------------------------------------------------------------
+
+    def get(self, unit_id):
+
+        return self.stores[unit_id]
+
+    # [share] ----------------------------------------------------------------------------------------------------------
+
+    def share(self):
+
+        """
+        Moves every slave image into shared memory, along with the state of its simulation, must be called before worker
+        processes are forked.
+        """
+
+        unit_ids = self.unit_ids()
+
+        for unit_id, shared in zip(unit_ids, store.create_shared_stores(len(unit_ids))):
+            shared.view[:]       = self.stores[unit_id].view.tobytes()
+            shared.simulation    = self.stores[unit_id].simulation
+            shared.address_map   = self.stores[unit_id].address_map
+            self.stores[unit_id] = shared
+
+            if shared.simulation is not None:
+                shared.simulation.share()
+
+    # [unit_ids] -------------------------------------------------------------------------------------------------------
+
+    def unit_ids(self):
+
+        return [unit_id for unit_id in range(UNIT_ID_COUNT) if self.stores[unit_id] is not None]
+
+
+# [parse_unit_ids] #####################################################################################################
+
+def parse_unit_ids(value):
+
+    """
+    Expands a unit id definition of the config file: 5, "1-200" or a list of both forms.
+    """
+
+    if isinstance(value, list):
+        unit_ids = []
+
+        for item in value:
+            unit_ids.extend(parse_unit_ids(item))
+
+        return unit_ids
+
+    if isinstance(value, basestring) and '-' in value:
+        first, last = value.split('-')
+
+        return range(int(first), int(last) + 1)
+
+    return [int(value)]
+
+
+# [parse_addresses] ####################################################################################################
+
+def parse_addresses(value):
+
+    """
+    Expands an address definition of the config file: 100, "0-9000" or a list of both forms, into (first, last) ranges.
+    """
+
+    if isinstance(value, list):
+        return [address_range for item in value for address_range in parse_addresses(item)]
+
+    if isinstance(value, basestring) and '-' in value:
+        first, last = value.split('-')
+
+        return [(int(first), int(last))]
+
+    return [(int(value), int(value))]
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import binascii
+import ctypes
+import mmap
+import multiprocessing
+import struct
+import sys
+import time
+
+from array import array
+
+import byte_utils
+
+
+# [globals] ############################################################################################################
+
+TABLE_SIZE           = 65536           # 0000 to FFFF
+BIT_TABLE_BYTES      = TABLE_SIZE / 8  # 8192 bytes - coils and discrete inputs are packed 8 per byte, LSB first
+REGISTER_TABLE_BYTES = TABLE_SIZE * 2  # 131072 bytes - registers are kept big endian, exactly as they go on the wire
+STORE_SIZE           = 2 * BIT_TABLE_BYTES + 2 * REGISTER_TABLE_BYTES
+TABLE_COUNT          = 4
+
+TABLE_OFFSETS = [
+    0,                                           # discreteOutputCoils
+    BIT_TABLE_BYTES,                             # discreteInputContacts
+    2 * BIT_TABLE_BYTES,                         # analogOutputRegisters
+    2 * BIT_TABLE_BYTES + REGISTER_TABLE_BYTES   # analogInputRegisters
+]
+
+BYTE_SWAP = sys.byteorder == 'little'
+REGISTER  = struct.Struct('>H')
+
+# count & 7 -> mask of the valid bits in the last packed byte, unused high bits of a response must be zero
+LAST_BYTE_MASK = [0xFF, 0x01, 0x03, 0x07, 0x0F, 0x1F, 0x3F, 0x7F]
+
+
+# [DataStore] ##########################################################################################################
+
+class DataStore:
+
+    """
+        Register image of a single slave.
+
+        All four tables live in one contiguous buffer, a bytearray by default or any writable buffer such as a shared
+        memory segment. Coils and discrete inputs take one bit each, registers are stored in network byte order so a
+        read request is served by copying a slice of the buffer.
+
+        A store created without a buffer is copy-on-write: it reads through the image of its template (all zeros by
+        default) and allocates its own buffer on the first write, so idle slaves cost next to nothing.
+
+        Stores shared between worker processes carry a process shared lock. Every write - a whole FC15/FC16 range
+        included - is applied under that lock as a single copy, so writes are atomic and totally ordered with respect
+        to each other.
+
+        Every table has a write generation, a seqlock: odd while a write to the table is in progress, bumped to the
+        next even value once it has landed. Reads stay lock free, they copy the range and take it again when the
+        generation was odd or moved meanwhile - a read never sees part of a write, a float32 is never half old and half
+        new. Anything derived from a table (an encoded response for instance) stays valid for as long as the
+        generation it was read at.
+
+        A store may carry a simulation.Simulation, which writes the simulated values of a window before it is read, and
+        an addressmap.AddressMap of the windows the unit exposes, checked by the server before the store is accessed.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, buffer=None, template=None, lock=None, generations=None):
+
+        self.buffer      = buffer
+        self.template    = None
+        self.lock        = lock
+        self.generations = generations if generations is not None else [0] * TABLE_COUNT
+        self.simulation  = None
+        self.address_map = None
+
+        if buffer is not None:
+            self.view = memoryview(buffer)
+        else:
+            self.template = template if template is not None else ZERO_STORE
+            self.view     = self.template.view
+
+    # [get_bits] -------------------------------------------------------------------------------------------------------
+
+    def get_bits(self, table_id, start, count):
+
+        check_range(start, count)
+
+        if self.simulation is not None:
+            self.simulation.update(self, table_id, start, count)
+
+        offset     = TABLE_OFFSETS[table_id]
+        first_byte = start >> 3
+        last_byte  = (start + count - 1) >> 3
+        shift      = start & 7
+        unpacked   = byte_utils.unpack_bits(self.snapshot(table_id, offset + first_byte, offset + last_byte + 1))
+
+        return bytearray(unpacked[shift:shift + count])
+
+    # [get_packed_bits] ------------------------------------------------------------------------------------------------
+
+    def get_packed_bits(self, table_id, start, count):
+
+        """
+        Returns `count` bits from `start` packed LSB first exactly as a fc01 / fc02 response carries them.
+
+        A byte aligned start is a plain slice copy. Otherwise the covered bytes are read as one little endian integer,
+        shifted down and written back - a handful of operations no matter how many bits are requested.
+        """
+
+        check_range(start, count)
+
+        if self.simulation is not None:
+            self.simulation.update(self, table_id, start, count)
+
+        offset     = TABLE_OFFSETS[table_id]
+        first_byte = offset + (start >> 3)
+        byte_count = (count + 7) >> 3
+        shift      = start & 7
+
+        if shift == 0:
+            packed = bytearray(self.snapshot(table_id, first_byte, first_byte + byte_count))
+        else:
+            last_byte = offset + ((start + count - 1) >> 3)
+            raw       = self.snapshot(table_id, first_byte, last_byte + 1)
+            value     = int(binascii.hexlify(raw[::-1]), 16) >> shift
+            packed    = bytearray(binascii.unhexlify('%0*x' % (byte_count * 2, value & ((1 << count) - 1)))[::-1])
+
+        packed[-1] &= LAST_BYTE_MASK[count & 7]
+
+        return packed
+
+    # [set_bits] -------------------------------------------------------------------------------------------------------
+
+    def set_bits(self, table_id, start, values):
+
+        if self.lock is None:
+            self.merge_bits(table_id, start, values)
+        else:
+            with self.lock:
+                self.merge_bits(table_id, start, values)
+
+    # [merge_bits] -----------------------------------------------------------------------------------------------------
+
+    def merge_bits(self, table_id, start, values):
+
+        count = len(values)
+
+        check_range(start, count)
+
+        if self.template is not None:
+            self.detach()
+
+        offset     = TABLE_OFFSETS[table_id]
+        first_byte = start >> 3
+        last_byte  = (start + count - 1) >> 3
+        shift      = start & 7
+        unpacked   = bytearray(byte_utils.unpack_bits(self.view[offset + first_byte:offset + last_byte + 1].tobytes()))
+
+        if not isinstance(values, bytearray):
+            values = bytearray(1 if value else 0 for value in values)
+
+        unpacked[shift:shift + count] = values
+        packed                        = byte_utils.pack_bits(unpacked)
+
+        self.generations[table_id] += 1
+        self.view[offset + first_byte:offset + last_byte + 1] = packed
+        self.generations[table_id] += 1
+
+    # [get_registers] --------------------------------------------------------------------------------------------------
+
+    def get_registers(self, table_id, start, count):
+
+        values = array('H')
+        values.fromstring(self.register_bytes(table_id, start, count))
+
+        if BYTE_SWAP:
+            values.byteswap()
+
+        return values
+
+    # [set_registers] --------------------------------------------------------------------------------------------------
+
+    def set_registers(self, table_id, start, values):
+
+        values = array('H', values)
+
+        if BYTE_SWAP:
+            values.byteswap()
+
+        self.set_register_bytes(table_id, start, values.tostring())
+
+    # [register_bytes] -------------------------------------------------------------------------------------------------
+
+    def register_bytes(self, table_id, start, count):
+
+        """
+        Returns a copy of the wire encoded registers, taken between two writes to the table.
+        """
+
+        check_range(start, count)
+
+        if self.simulation is not None:
+            self.simulation.update(self, table_id, start, count)
+
+        offset = TABLE_OFFSETS[table_id] + start * 2
+
+        return self.snapshot(table_id, offset, offset + count * 2)
+
+    # [set_register_bytes] ---------------------------------------------------------------------------------------------
+
+    def set_register_bytes(self, table_id, start, data):
+
+        check_range(start, len(data) / 2)
+
+        if self.template is not None:
+            self.detach()
+
+        offset = TABLE_OFFSETS[table_id] + start * 2
+
+        if self.lock is None:
+            self.generations[table_id] += 1
+            self.view[offset:offset + len(data)] = data
+            self.generations[table_id] += 1
+        else:
+            with self.lock:
+                self.generations[table_id] += 1
+                self.view[offset:offset + len(data)] = data
+                self.generations[table_id] += 1
+
+    # [mask_register] --------------------------------------------------------------------------------------------------
+
+    def mask_register(self, table_id, address, and_mask, or_mask):
+
+        """
+        fc22: (current AND and_mask) OR (or_mask AND NOT and_mask), read and written back as one operation.
+        """
+
+        check_range(address, 1)
+
+        if self.template is not None:
+            self.detach()
+
+        if self.lock is None:
+            self.merge_mask(table_id, address, and_mask, or_mask)
+        else:
+            with self.lock:
+                self.merge_mask(table_id, address, and_mask, or_mask)
+
+    # [merge_mask] -----------------------------------------------------------------------------------------------------
+
+    def merge_mask(self, table_id, address, and_mask, or_mask):
+
+        offset  = TABLE_OFFSETS[table_id] + address * 2
+        current = REGISTER.unpack(self.view[offset:offset + 2].tobytes())[0]
+
+        self.generations[table_id] += 1
+        self.view[offset:offset + 2] = REGISTER.pack((current & and_mask) | (or_mask & ~and_mask & 0xFFFF))
+        self.generations[table_id] += 1
+
+    # [write_read_registers] -------------------------------------------------------------------------------------------
+
+    def write_read_registers(self, table_id, write_start, data, read_start, read_count):
+
+        """
+        fc23: writes the wire encoded `data`, then returns a copy of the registers read - no other write lands in
+        between on a shared store.
+        """
+
+        check_range(write_start, len(data) / 2)
+        check_range(read_start, read_count)
+
+        # simulated values are written before the lock is taken, the lock is not reentrant
+        if self.simulation is not None:
+            self.simulation.update(self, table_id, read_start, read_count)
+
+        if self.template is not None:
+            self.detach()
+
+        if self.lock is None:
+            return self.exchange_registers(table_id, write_start, data, read_start, read_count)
+
+        with self.lock:
+            return self.exchange_registers(table_id, write_start, data, read_start, read_count)
+
+    # [exchange_registers] ---------------------------------------------------------------------------------------------
+
+    def exchange_registers(self, table_id, write_start, data, read_start, read_count):
+
+        write_offset = TABLE_OFFSETS[table_id] + write_start * 2
+        read_offset  = TABLE_OFFSETS[table_id] + read_start * 2
+
+        self.generations[table_id] += 1
+        self.view[write_offset:write_offset + len(data)] = data
+        self.generations[table_id] += 1
+
+        return self.view[read_offset:read_offset + read_count * 2].tobytes()
+
+    # [patch] ----------------------------------------------------------------------------------------------------------
+
+    def patch(self, patches):
+
+        """
+        Applies the changes of a config reload as one write, see hotreload.diff_images. A patch is (table id, start,
+        data, mask): register tables replace the registers from `start` on, bit tables only the bits set in `mask` of
+        the packed bytes from byte `start` on.
+        """
+
+        if self.template is not None:
+            self.detach()
+
+        if self.lock is None:
+            self.merge_patches(patches)
+        else:
+            with self.lock:
+                self.merge_patches(patches)
+
+    # [merge_patches] --------------------------------------------------------------------------------------------------
+
+    def merge_patches(self, patches):
+
+        # every table patched is odd for the whole reload, readers see all of its patches or none
+        table_ids = sorted(set(patch[0] for patch in patches))
+
+        for table_id in table_ids:
+            self.generations[table_id] += 1
+
+        for table_id, start, data, mask in patches:
+            if mask is None:
+                offset = TABLE_OFFSETS[table_id] + start * 2
+            else:
+                offset  = TABLE_OFFSETS[table_id] + start
+                current = bytearray(self.view[offset:offset + len(data)].tobytes())
+                data    = str(bytearray((value & ~bits | new & bits) & 0xFF
+                                        for value, new, bits in zip(current, bytearray(data), bytearray(mask))))
+
+            self.view[offset:offset + len(data)] = data
+
+        for table_id in table_ids:
+            self.generations[table_id] += 1
+
+    # [generation] -----------------------------------------------------------------------------------------------------
+
+    def generation(self, table_id):
+
+        """
+        Read it before reading the table: a write racing with the read then always leaves a newer generation behind.
+        """
+
+        if self.template is not None:
+            return self.template.generations[table_id]
+
+        return self.generations[table_id]
+
+    # [snapshot] -------------------------------------------------------------------------------------------------------
+
+    def snapshot(self, table_id, begin, end):
+
+        """
+        Copy of the buffer from `begin` to `end`, all of it from between two writes to `table_id`.
+        """
+
+        generations = self.template.generations if self.template is not None else self.generations
+        generation  = generations[table_id]
+        data        = self.view[begin:end].tobytes()
+
+        while generation & 1 or generations[table_id] != generation:
+            # a write is in progress: let the writer run, in this process it may be a thread waiting for the gil
+            time.sleep(0)
+
+            generation = generations[table_id]
+            data       = self.view[begin:end].tobytes()
+
+        return data
+
+    # [detach] ---------------------------------------------------------------------------------------------------------
+
+    def detach(self):
+
+        """
+        Gives the store a private copy of its template image.
+        """
+
+        self.buffer      = bytearray(self.template.view.tobytes())
+        self.view        = memoryview(self.buffer)
+        self.generations = list(self.template.generations)
+        self.template    = None
+
+    # [is_allocated] ---------------------------------------------------------------------------------------------------
+
+    def is_allocated(self):
+
+        return self.template is None
+
+
+# [create_shared_stores] ###############################################################################################
+
+def create_shared_stores(count):
+
+    """
+    Allocates `count` stores in one anonymous shared memory segment, they stay shared with every process forked later.
+    Write generations live in the segment too, after the images.
+    """
+
+    generations_type = ctypes.c_uint64 * TABLE_COUNT
+    segment          = mmap.mmap(-1, count * (STORE_SIZE + ctypes.sizeof(generations_type)))
+    stores           = []
+
+    for index in range(count):
+        buffer      = (ctypes.c_char * STORE_SIZE).from_buffer(segment, index * STORE_SIZE)
+        generations = generations_type.from_buffer(
+            segment, count * STORE_SIZE + index * ctypes.sizeof(generations_type))
+
+        stores.append(DataStore(buffer, lock=multiprocessing.Lock(), generations=generations))
+
+    return stores
+
+
+# [check_range] ########################################################################################################
+
+def check_range(start, count):
+
+    if start < 0 or count < 1 or start + count > TABLE_SIZE:
+        raise Exception('Address out of range')
+
+
+# [ZERO_STORE] #########################################################################################################
+
+ZERO_STORE = DataStore(bytearray(STORE_SIZE))  # shared, never written - backs every store that was not written yet
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import Queue
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+
+# [globals] ############################################################################################################
+
+FORMAT_BINARY = 'binary'
+FORMAT_HEX    = 'hex'
+
+FILE_HEADER = 'MBWL\x01\x00\x00\x00'     # magic, format version, padding
+RECORD      = struct.Struct('>dIHH')     # timestamp, connection id, request size, response size - then both adus
+
+QUEUE_SIZE = 8192  # exchanges waiting for the writer, further ones are dropped and counted
+BATCH_SIZE = 256   # exchanges written between two flushes at most
+
+
+# [WireLog] ############################################################################################################
+
+class WireLog:
+
+    """
+        Request / response logging off the request path.
+
+        The server hands every exchange to `log`, matching and sampled ones are copied and put on a bounded queue, a
+        background thread formats and writes them. When the writer falls behind, exchanges are dropped and counted
+        instead of slowing the server down.
+
+        Binary capture layout: FILE_HEADER, then one RECORD per exchange followed by the request and the response adu.
+        The hex format writes the two text lines the server used to print, prefixed by time and connection id.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, path=None, format=FORMAT_BINARY, sample_every=1, unit_ids=None, function_codes=None,
+                 addresses=None, queue_size=QUEUE_SIZE, lossless=False):
+
+        """
+        `path` None writes to stdout (hex only). `unit_ids` and `function_codes` are collections, `addresses` a list of
+        (first, last) ranges a request has to overlap. None matches everything. A `lossless` log waits for the writer
+        instead of dropping, for captures meant to be replayed.
+        """
+
+        if format not in (FORMAT_BINARY, FORMAT_HEX):
+            raise Exception('Unknown wire log format: %s' % format)
+
+        if format == FORMAT_BINARY and path is None:
+            raise Exception('Binary wire log needs a path')
+
+        self.path           = path
+        self.format         = format
+        self.sample_every   = max(1, sample_every)
+        self.countdown      = 1
+        self.unit_ids       = frozenset(unit_ids) if unit_ids is not None else None
+        self.function_codes = frozenset(function_codes) if function_codes is not None else None
+        self.addresses      = addresses
+        self.lossless       = lossless
+        self.queue          = Queue.Queue(queue_size)
+        self.logged         = 0
+        self.dropped        = 0
+        self.writer         = threading.Thread(target=self.write_all, name='wirelog')
+
+        self.writer.daemon = True
+        self.writer.start()
+
+    # [log] ------------------------------------------------------------------------------------------------------------
+
+    def log(self, connection_id, req, frame, out):
+
+        if not self.matches(req):
+            return
+
+        self.countdown -= 1
+
+        if self.countdown > 0:
+            return
+
+        self.countdown = self.sample_every
+
+        try:
+            self.queue.put((time.time(), connection_id, memoryview(frame).tobytes(), str(out)), self.lossless)
+            self.logged += 1
+        except Queue.Full:
+            self.dropped += 1
+
+    # [matches] --------------------------------------------------------------------------------------------------------
+
+    def matches(self, req):
+
+        if self.unit_ids is not None and req.unit_id not in self.unit_ids:
+            return False
+
+        if self.function_codes is not None and req.function_code not in self.function_codes:
+            return False
+
+        if self.addresses is not None:
+            if req.start_reference is None:
+                return False
+
+            first = req.start_reference
+            last  = first + (req.register_count or 1) - 1
+
+            return any(first <= range_last and last >= range_first for range_first, range_last in self.addresses)
+
+        return True
+
+    # [stats] ----------------------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        return {'logged': self.logged, 'dropped': self.dropped, 'queued': self.queue.qsize()}
+
+    # [close] ----------------------------------------------------------------------------------------------------------
+
+    def close(self):
+
+        """
+        Writes whatever is still queued and stops the writer.
+        """
+
+        self.queue.put(None)
+        self.writer.join()
+
+    # [write_all] ------------------------------------------------------------------------------------------------------
+
+    def write_all(self):
+
+        output = open(self.path, 'ab') if self.path is not None else sys.stdout
+
+        if self.format == FORMAT_BINARY and output.tell() == 0:
+            output.write(FILE_HEADER)
+            output.flush()
+
+        write = self.write_binary if self.format == FORMAT_BINARY else self.write_hex
+
+        while True:
+            batch = [self.queue.get()]
+
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+
+            for exchange in batch:
+                if exchange is None:
+                    output.flush()
+
+                    if output is not sys.stdout:
+                        output.close()
+                    return
+
+                write(output, exchange)
+
+            output.flush()
+
+    # [write_binary] ---------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def write_binary(output, exchange):
+
+        timestamp, connection_id, request_adu, response_adu = exchange
+
+        output.write(RECORD.pack(timestamp, connection_id, len(request_adu), len(response_adu)))
+        output.write(request_adu)
+        output.write(response_adu)
+
+    # [write_hex] ------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def write_hex(output, exchange):
+
+        timestamp, connection_id, request_adu, response_adu = exchange
+
+        output.write('%.6f %d request : %s\n%.6f %d response: %s\n' % (
+            timestamp, connection_id, to_hex(request_adu), timestamp, connection_id, to_hex(response_adu)))
+
+
+# [to_hex] #############################################################################################################
+
+def to_hex(adu):
+
+    hex_string = adu.encode('hex')
+
+    return ':'.join(hex_string[i:i + 2] for i in range(0, len(hex_string), 2))
+
+
+# [read_records] #######################################################################################################
+
+def read_records(path):
+
+    """
+    Iterates over the (timestamp, connection id, request adu, response adu) records of a binary capture.
+
+    The capture is memory mapped, only the records being looked at are paged in however large it is. A record cut short
+    by a writer that did not finish ends the iteration.
+    """
+
+    with open(path, 'rb') as capture:
+        size = os.fstat(capture.fileno()).st_size
+
+        if size < len(FILE_HEADER):
+            return
+
+        mapped = mmap.mmap(capture.fileno(), size, access=mmap.ACCESS_READ)
+
+    try:
+        if mapped[:4] != FILE_HEADER[:4]:
+            raise Exception('Not a wire log capture: %s' % path)
+
+        offset = len(FILE_HEADER)
+
+        while offset + RECORD.size <= size:
+            timestamp, connection_id, request_size, response_size = RECORD.unpack_from(mapped, offset)
+
+            request_start = offset + RECORD.size
+            record_end    = request_start + request_size + response_size
+
+            if record_end > size:
+                return
+
+            yield timestamp, connection_id, mapped[request_start:request_start + request_size], \
+                mapped[request_start + request_size:record_end]
+
+            offset = record_end
+    finally:
+        mapped.close()
@@ -4,90 +4,437 @@
 
 # [dependencies] #######################################################################################################
 
-import socket
+import argparse
 import json
+import os
+import sys
 
-from modbus import request, response
+from modbus import globals as g, addressmap, hotreload, image, points, proxy, serial_server, server, simulation, \
+    slaves, store, wirelog
 
 
 # [globals] ############################################################################################################
 
-tables  = [
-    [0] * 65536,   # discreteOutputCoils - 0000 to FFFF - 65536 bits
-    [0] * 65536,   # discreteInputContacts - 0000 to FFFF - 65536 bits
-    [0] * 65536,   # analogOutputRegisters - 0000 to FFFF - 65535 words
-    [0] * 65536    # analogInputRegisters - 0000 to FFFF - 65535 words
-]
+registry = slaves.SlaveRegistry()  # unit id -> store, discrete tables are 65536 bits, analog tables 65536 words
 
+CONFIG_TABLES = {
+    "discreteOutputCoils"  : g.TABLE_DISCRETE_OUTPUT_COILS,
+    "discreteInputContacts": g.TABLE_DISCRETE_INPUT_CONTACTS,
+    "analogOutputRegisters": g.TABLE_ANALOG_OUTPUT_REGISTERS,
+    "analogInputRegisters" : g.TABLE_ANALOG_INPUT_REGISTERS
+}
 
-# [inject_analog_table] ##############################################################################################
+CONFIG_OBJECTS = {
+    "vendorName"         : g.OBJECT_00_VENDOR_NAME,
+    "productCode"        : g.OBJECT_01_PRODUCT_CODE,
+    "majorMinorRevision" : g.OBJECT_02_MAJOR_MINOR_REVISION,
+    "vendorUrl"          : g.OBJECT_03_VENDOR_URL,
+    "productName"        : g.OBJECT_04_PRODUCT_NAME,
+    "modelName"          : g.OBJECT_05_MODEL_NAME,
+    "userApplicationName": g.OBJECT_06_USER_APPLICATION_NAME
+}
 
-def inject_analog_table(table_id, config_table):
 
-    for index in config_table:
-        reference = int(index)
+# [parse_table_entry] ##################################################################################################
 
-        if config_table[index] > 65535 or config_table[index] < 0:
-            tables[table_id][reference] = 0
+def parse_table_entry(key, value):
+
+    """
+    Expands an entry of a config table into its first address and its values. Besides a single address ("0100": 7),
+    a key may be a decimal range filled with a value ("0100-0199": 7) or with a repeated pattern ("0100-0199": [1, 0]),
+    and a single address may start a list of consecutive values ("0100": [1, 2, 3]).
+    """
+
+    if '-' in key:
+        first, last = key.split('-')
+        first, last = int(first), int(last)
+        count       = last - first + 1
+    else:
+        first = int(key)
+        count = len(value) if isinstance(value, list) else 1
+
+    if not isinstance(value, list):
+        return first, [value] * count
+
+    if not value:
+        raise Exception('Empty value list at %s' % key)
+
+    return first, (value * (count / len(value) + 1))[:count]
+
+
+# [table_runs] #########################################################################################################
+
+def table_runs(config_table):
+
+    """
+    Entries of a config table as runs of consecutive addresses, (first, values), so a table is written with one call
+    per run rather than one per address. Ranges come first, single addresses override the ranges covering them.
+    """
+
+    ranges  = []
+    singles = []
+    runs    = []
+
+    for key, value in config_table.iteritems():
+        if '-' in key or isinstance(value, list):
+            ranges.append(parse_table_entry(key, value))
+        else:
+            singles.append((int(key), value))
+
+    singles.sort()
+
+    for address, value in singles:
+        if runs and runs[-1][0] + len(runs[-1][1]) == address:
+            runs[-1][1].append(value)
         else:
-            tables[table_id][reference] = int(config_table[index])
+            runs.append((address, [value]))
+
+    return ranges + runs
+
+
+# [inject_analog_table] ################################################################################################
+
+def inject_analog_table(data_store, table_id, config_table):
+
+    for first, values in table_runs(config_table):
+        data_store.set_registers(table_id, first, [int(value) if 0 <= value <= 65535 else 0 for value in values])
 
 
 # [inject_discrete_table] ##############################################################################################
 
-def inject_discrete_table(table_id, config_table):
+def inject_discrete_table(data_store, table_id, config_table):
+
+    for first, values in table_runs(config_table):
+        data_store.set_bits(table_id, first, bytearray(1 if value > 0 else 0 for value in values))
+
+
+# [stream_tables] ######################################################################################################
+
+def stream_tables(path):
+
+    """
+    Reads a tables file one line at a time, only a line is held in memory. Every non blank line is a json object
+    holding a table name and some of its entries, e.g. {"table": "analogInputRegisters", "values": {"0000": 7}}.
+    """
+
+    with open(os.path.join(os.path.dirname(config_path), path)) as lines:
+        for line in lines:
+            if line.strip():
+                chunk = json.loads(line)
+
+                yield chunk["table"], chunk["values"]
 
-    for index in config_table:
-        reference = int(index)
 
-        if config_table[index] > 0:
-            tables[table_id][reference] = 1
+# [inject_tables] ######################################################################################################
+
+def inject_tables(data_store, config_tables):
+
+    """
+    `config_tables` is either an object of tables or the path of a tables file, relative to the config file.
+    """
+
+    chunks = stream_tables(config_tables) if isinstance(config_tables, basestring) else config_tables.iteritems()
+
+    for name, config_table in chunks:
+        table_id = CONFIG_TABLES[name]
+
+        if table_id in (g.TABLE_DISCRETE_OUTPUT_COILS, g.TABLE_DISCRETE_INPUT_CONTACTS):
+            inject_discrete_table(data_store, table_id, config_table)
         else:
-            tables[table_id][reference] = 0
+            inject_analog_table(data_store, table_id, config_table)
+
+
+# [inject_points] ######################################################################################################
+
+def inject_points(data_store, config_points):
+
+    """
+    Sets the typed points of a "points" entry, e.g. {"table": "analogOutputRegisters", "address": 100,
+    "dataType": "float32", "wordOrder": "little", "values": [21.5, 22.0]} - "value" for a single point.
+    """
+
+    for config_point in config_points:
+        table_id   = CONFIG_TABLES[config_point["table"]]
+        point_type = points.create_point_type(config_point)
+        values     = config_point["values"] if "values" in config_point else [config_point["value"]]
+
+        if table_id in (g.TABLE_DISCRETE_OUTPUT_COILS, g.TABLE_DISCRETE_INPUT_CONTACTS):
+            raise Exception('Typed points should be in register tables')
+
+        if point_type is None:
+            raise Exception('Typed points should have a dataType')
+
+        points.set_points(data_store, table_id, config_point["address"], point_type, values)
+
+
+# [create_simulation] ##################################################################################################
+
+def create_simulation(config_simulation, unit_id):
+
+    """
+    Builds the simulation of a unit out of a "simulation" entry of the config, None when there is nothing to simulate.
+    The seed is offset by the unit id so units of one "slaves" entry do not move in lockstep.
+    """
+
+    if not config_simulation:
+        return None
+
+    seed            = config_simulation.get("seed", 0) + unit_id
+    unit_simulation = simulation.Simulation(config_simulation.get("resolution", 0.1))
+
+    for index, config_range in enumerate(config_simulation.get("ranges", [])):
+        table_id = CONFIG_TABLES[config_range["table"]]
+
+        for first, last in slaves.parse_addresses(config_range["addresses"]):
+            generator = simulation.create_generator(config_range["generator"], first, last, seed + index)
+            unit_simulation.add(table_id, first, last, generator, points.create_point_type(config_range))
+
+    return unit_simulation
+
+
+# [create_address_map] #################################################################################################
+
+def create_address_map(config_address_map):
+
+    """
+    Builds the address map of an "addressMap" entry of the config, e.g. {"analogOutputRegisters": ["0000-0099", 200]},
+    None when every address is mapped. Tables the entry does not name stay mapped whole.
+    """
+
+    if not config_address_map:
+        return None
+
+    address_map = addressmap.AddressMap()
+
+    for name, addresses in config_address_map.iteritems():
+        for first, last in slaves.parse_addresses(addresses):
+            address_map.add(CONFIG_TABLES[name], first, last)
+
+    return address_map
+
+
+# [config_entries] #####################################################################################################
+
+def config_entries(config):
+
+    """
+    (entry, unit ids) of the main unit and of every "slaves" entry of the config.
+    """
+
+    entries = [(config, [config["slaveId"]])]
+    entries.extend((slave, slaves.parse_unit_ids(slave["unitIds"])) for slave in config.get("slaves", []))
+
+    return entries
 
 
 # [inject_config] ######################################################################################################
 
-def inject_config():
+def inject_config(registry, config, image_path=None):
 
-    inject_discrete_table(0, config["tables"]["discreteOutputCoils"])
-    inject_discrete_table(1, config["tables"]["discreteInputContacts"])
-    inject_analog_table(2, config["tables"]["analogOutputRegisters"])
-    inject_analog_table(3, config["tables"]["analogInputRegisters"])
+    """
+    Fills `registry` from the tables of `config`, or from `image_path`, a register image compiled from it - the
+    tables are not read at all then. Simulations and address maps are not part of images, they always come from the
+    config.
+    """
 
+    if image_path is not None:
+        image.load(image_path, registry)
+    else:
+        data_store = store.DataStore()
+        inject_tables(data_store, config["tables"])
+        inject_points(data_store, config.get("points", []))
+        registry.add(config["slaveId"], data_store)
 
-# [main block] #########################################################################################################
+        # every unit of a "slaves" entry shares the entry's image until it is written to
+        for slave in config.get("slaves", []):
+            template = store.DataStore()
+            inject_tables(template, slave.get("tables", {}))
+            inject_points(template, slave.get("points", []))
 
-if __name__ == "__main__":
+            for unit_id in slaves.parse_unit_ids(slave["unitIds"]):
+                registry.add(unit_id, store.DataStore(template=template))
+
+    for entry, unit_ids in config_entries(config):
+        address_map = create_address_map(entry.get("addressMap"))
+
+        for unit_id in unit_ids:
+            data_store = registry.get(unit_id)
+
+            if data_store is not None:
+                data_store.simulation  = create_simulation(entry.get("simulation"), unit_id)
+                data_store.address_map = address_map
+
+
+# [reload_config] ######################################################################################################
+
+def reload_config():
+
+    """
+    Reads the config file again for a hotreload.Reloader: returns the images of its units and the simulations of the
+    units whose "simulation" entry changed.
+    """
+
+    global config
+
+    new_config  = json.load(open(config_path))
+    images      = slaves.SlaveRegistry()
+    simulations = {}
+
+    inject_config(images, new_config)
+
+    old_entries = dict((unit_id, entry.get("simulation")) for entry, unit_ids in config_entries(config)
+                       for unit_id in unit_ids)
+
+    for entry, unit_ids in config_entries(new_config):
+        for unit_id in unit_ids:
+            if entry.get("simulation") != old_entries.get(unit_id):
+                simulations[unit_id] = images.get(unit_id).simulation
+
+    config = new_config
 
-    config  = json.load(open('modemu.json'))
-    host    = config["listenAddress"]
-    port    = config["listenPort"]
-    backlog = 5
-    size    = 1024
+    return images, simulations
 
-    inject_config()
 
-    socket_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socket_server.bind((host, port))
-    socket_server.listen(backlog)
+# [create_reloader] ####################################################################################################
 
-    while True:
-        client, address = socket_server.accept()
-        data            = client.recv(size)
+def create_reloader(config_reload, forked=False):
 
-        # print "connected"
+    """
+    hotreload.Reloader of the "reload" entry of the config, None when reloading is disabled.
+    """
 
-        if data:
-            req = request.Request(data)
-            res = response.Response(req, tables)
-            out = res.out()
+    if not config_reload.get("enabled", False):
+        return None
 
-            print "request : ", ':'.join(x.encode('hex') for x in data)
-            print "response: ", ':'.join(x.encode('hex') for x in out)
+    return hotreload.Reloader(reload_config, registry, config_path, config_reload.get("watchInterval", 0), forked)
 
-            client.send(out)
 
-        client.close()
+# [wire_log_options] ###################################################################################################
 
+def wire_log_options(config_wire_log):
+
+    """
+    Keyword arguments of a wirelog.WireLog out of the "wireLog" entry of the config, None when logging is disabled.
+    """
+
+    if not config_wire_log.get("enabled", False):
+        return None
+
+    unit_ids       = config_wire_log.get("unitIds")
+    function_codes = config_wire_log.get("functionCodes")
+    addresses      = config_wire_log.get("addresses")
+
+    return {
+        "path"          : config_wire_log.get("path"),
+        "format"        : config_wire_log.get("format", wirelog.FORMAT_BINARY),
+        "sample_every"  : config_wire_log.get("sampleEvery", 1),
+        "lossless"      : config_wire_log.get("lossless", False),
+        "unit_ids"      : slaves.parse_unit_ids(unit_ids) if unit_ids is not None else None,
+        "function_codes": function_codes,
+        "addresses"     : slaves.parse_addresses(addresses) if addresses is not None else None
+    }
+
+
+# [limits_options] #####################################################################################################
+
+def limits_options(config_limits):
+
+    """
+    Keyword arguments of a limits.Limits out of the "limits" entry of the config, 0 or a missing key disables a limit.
+    """
+
+    return {
+        "max_connections"       : config_limits.get("maxConnections", 0),
+        "max_connections_per_ip": config_limits.get("maxConnectionsPerIp", 0),
+        "idle_timeout"          : config_limits.get("idleTimeout", 0),
+        "read_deadline"         : config_limits.get("readDeadline", 0),
+        "request_rate"          : config_limits.get("requestRate", 0),
+        "request_burst"         : config_limits.get("requestBurst", 0)
+    }
+
+
+# [proxy_options] ######################################################################################################
+
+def proxy_options(config_proxy):
+
+    """
+    Keyword arguments of a proxy.ProxyServer out of the "proxy" entry of the config.
+    """
+
+    return {
+        "upstream_host": config_proxy["host"],
+        "upstream_port": config_proxy.get("port", 502),
+        "connections"  : config_proxy.get("connections", proxy.DEFAULT_CONNECTIONS),
+        "ttl"          : config_proxy.get("ttl", proxy.DEFAULT_TTL),
+        "timeout"      : config_proxy.get("timeout", proxy.DEFAULT_TIMEOUT)
+    }
+
+
+# [identification_objects] #############################################################################################
+
+def identification_objects(config_identification):
+
+    """
+    fc43 objects out of the "deviceIdentification" entry of the config, None for the defaults of the server. Extended
+    objects are given by their id, e.g. "128": "line 3".
+    """
+
+    if not config_identification:
+        return None
+
+    return dict((CONFIG_OBJECTS[name] if name in CONFIG_OBJECTS else int(name), value.encode('utf-8'))
+                for name, value in config_identification.iteritems())
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description='MODBUS/TCP slave emulator')
+    parser.add_argument('config', nargs='?', default='modemu.json', help='config file, modemu.json by default')
+    parser.add_argument('--image', help='register image to serve instead of the tables of the config')
+    parser.add_argument('--compile', metavar='IMAGE', help='compile the tables of the config into a register image')
+
+    arguments   = parser.parse_args()
+    config_path = arguments.config
+    config      = json.load(open(config_path))
+    host     = config["listenAddress"]
+    port     = config["listenPort"]
+    backlog  = config.get("backlog", 5)
+    workers  = config.get("workers", 1)
+    serial   = config.get("serial", {})
+    upstream = config.get("proxy", {})
+    reloads  = config.get("reload", {}) if arguments.image is None else {}  # images are compiled again, not reloaded
+    options  = {
+        "framing"          : config.get("framing", server.FRAMING_TCP),
+        "cache_size"       : config.get("responseCacheSize", 0),
+        "stats_port"       : config.get("statsPort") or None,
+        "stats_interval"   : config.get("statsInterval", 0),
+        "stats_file"       : config.get("statsFile"),
+        "wire_log"         : wire_log_options(config.get("wireLog", {})),
+        "identification"   : identification_objects(config.get("deviceIdentification")),
+        "connection_limits": limits_options(config.get("limits", {}))
+    }
+
+    inject_config(registry, config, arguments.image)
+
+    if arguments.compile:
+        image.save(registry, arguments.compile)
+        print 'register image of %d units written to %s' % (len(registry.unit_ids()), arguments.compile)
+        sys.exit(0)
+
+    if upstream.get("enabled", False):
+        # the tables of the config are not served, every request goes to the upstream slave or its cache
+        modbus_server = proxy.ProxyServer(host, port, backlog=backlog, **dict(options, **proxy_options(upstream)))
+        modbus_server.serve_forever()
+    elif serial.get("enabled", False):
+        modbus_server = serial_server.SerialServer(serial["device"], registry, serial.get("baudRate", 19200),
+                                                   serial.get("parity", "E"), serial.get("stopBits", 1),
+                                                   reloader=create_reloader(reloads), **options)
+        modbus_server.serve_forever()
+    elif workers > 1:
+        server.serve_forked(host, port, registry, backlog, workers, reloader=create_reloader(reloads, forked=True),
+                            **options)
+    else:
+        modbus_server = server.Server(host, port, registry, backlog, reloader=create_reloader(reloads), **options)
+        modbus_server.serve_forever()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Replays a binary wire log capture against a MODBUS/TCP server and diffs every response with the recorded one.
+
+    Every captured connection gets a connection of its own and its requests are sent in their original order, either
+    at the original timing (scaled by --speed) or as fast as the server answers (--fast). Records are streamed out of
+    the memory mapped capture and at most --window requests are in flight per connection, so memory stays bounded
+    whatever the size of the capture. Replay against a server started from the same config as the captured one, writes
+    in the capture change its state exactly as they did then.
+
+    A first pass over the capture finds the last record of every captured connection, its replay connection is closed
+    as soon as the response to that record is in - and before any further connection is opened. Only the connections
+    the capture had open at a time are open at once, however many it holds in total: a server limits the connections
+    per client (maxConnectionsPerIp).
+
+    A request still unanswered after RESPONSE_TIMEOUT seconds is counted missing and its connection closed, as are the
+    requests outstanding on a connection the server closes. The records left of such a connection go out on a new one.
+
+    usage: replay.py CAPTURE [--host HOST] [--port PORT] [--speed FACTOR | --fast] [--window N] [--show N]
+                     [--json RESULT_FILE]
+"""
+
+
+# [dependencies] #######################################################################################################
+
+import argparse
+import collections
+import errno
+import json
+import socket
+import sys
+import time
+
+from modbus import framer, server, wirelog
+
+
+# [globals] ############################################################################################################
+
+RESPONSE_TIMEOUT = 5.0  # seconds to wait for outstanding responses before they are counted missing
+
+
+# [ReplayConnection] ###################################################################################################
+
+class ReplayConnection:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, connection_id, host, port):
+
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(0)
+
+        self.id         = connection_id  # captured
+        self.fd         = self.socket.fileno()
+        self.framer     = framer.Framer()
+        self.expected   = collections.deque()  # (request, recorded response) in sending order
+        self.out_buffer = bytearray()
+        self.writing    = False
+        self.last       = False  # the last record of the captured connection was sent
+
+
+# [Replay] #############################################################################################################
+
+class Replay:
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, options):
+
+        self.options     = options
+        self.poller      = server.Poller()
+        self.connections = {}  # captured connection id -> open ReplayConnection
+        self.by_fd       = {}
+        self.opened      = 0
+        self.closing     = 0  # open connections whose last record was sent
+        self.sent        = 0
+        self.matched     = 0
+        self.mismatched  = 0
+        self.unexpected  = 0
+        self.missing     = 0  # requests of the connections given up on
+        self.diffs       = []
+
+    # [run] ------------------------------------------------------------------------------------------------------------
+
+    def run(self):
+
+        last_records = self.last_records()
+        started      = time.time()
+        first_at     = None
+
+        records = wirelog.read_records(self.options.capture)
+
+        for index, (timestamp, connection_id, request_adu, response_adu) in enumerate(records):
+            if first_at is None:
+                first_at = timestamp
+
+            if not self.options.fast:
+                due = started + (timestamp - first_at) / self.options.speed
+
+                while time.time() < due:
+                    self.poll(due - time.time())
+
+            connection = self.connections.get(connection_id)
+
+            if connection is not None and not self.wait(lambda: len(connection.expected) >= self.options.window):
+                self.abandon(connection)
+
+            connection = self.connection(connection_id)
+            self.send(connection, request_adu, response_adu)
+
+            # a connection given up on while sending has nothing left to close
+            if index == last_records[connection_id] and self.connections.get(connection_id) is connection:
+                connection.last  = True
+                self.closing    += 1
+                self.close_when_done(connection)
+
+        self.wait(self.outstanding)
+
+        elapsed = time.time() - started
+        missing = self.missing + self.outstanding()
+
+        for connection in self.connections.values():
+            self.close(connection)
+
+        return {
+            'connections'   : self.opened,
+            'sent'          : self.sent,
+            'matched'       : self.matched,
+            'mismatched'    : self.mismatched,
+            'unexpected'    : self.unexpected,
+            'missing'       : missing,
+            'duration'      : elapsed,
+            'requests_per_s': self.sent / elapsed if elapsed else 0.0,
+            'diffs'         : self.diffs
+        }
+
+    # [last_records] ---------------------------------------------------------------------------------------------------
+
+    def last_records(self):
+
+        """
+        Captured connection id -> index of its last record.
+        """
+
+        last_records = {}
+
+        for index, (_, connection_id, _, _) in enumerate(wirelog.read_records(self.options.capture)):
+            last_records[connection_id] = index
+
+        return last_records
+
+    # [connection] -----------------------------------------------------------------------------------------------------
+
+    def connection(self, connection_id):
+
+        connection = self.connections.get(connection_id)
+
+        if connection is None:
+            # the connections the capture is done with are closed first, the server counts open ones against its limits
+            if not self.wait(lambda: self.closing):
+                for closing in self.connections.values():
+                    if closing.last:
+                        self.abandon(closing)
+
+            connection = ReplayConnection(connection_id, self.options.host, self.options.port)
+
+            self.connections[connection_id] = connection
+            self.by_fd[connection.fd]       = connection
+            self.opened                    += 1
+            self.poller.register(connection.fd, server.EVENT_READ)
+
+        return connection
+
+    # [close_when_done] ------------------------------------------------------------------------------------------------
+
+    def close_when_done(self, connection):
+
+        if connection.last and not connection.expected:
+            self.close(connection)
+
+    # [close] ----------------------------------------------------------------------------------------------------------
+
+    def close(self, connection):
+
+        self.poller.unregister(connection.fd)
+        connection.socket.close()
+
+        del self.connections[connection.id]
+        del self.by_fd[connection.fd]
+
+        if connection.last:
+            self.closing -= 1
+
+    # [abandon] --------------------------------------------------------------------------------------------------------
+
+    def abandon(self, connection):
+
+        """
+        Gives up on a connection: the requests it has outstanding are counted missing and it is closed.
+        """
+
+        self.missing += len(connection.expected)
+        connection.expected.clear()
+
+        self.close(connection)
+
+    # [wait] -----------------------------------------------------------------------------------------------------------
+
+    def wait(self, busy):
+
+        """
+        Polls for responses as long as `busy` returns true, RESPONSE_TIMEOUT seconds at most. True when it is done.
+        """
+
+        deadline = time.time() + RESPONSE_TIMEOUT
+
+        while busy():
+            if time.time() >= deadline:
+                return False
+
+            self.poll(deadline - time.time())
+
+        return True
+
+    # [send] -----------------------------------------------------------------------------------------------------------
+
+    def send(self, connection, request_adu, response_adu):
+
+        connection.expected.append((request_adu, response_adu))
+        connection.out_buffer += request_adu
+        self.sent             += 1
+
+        self.write(connection)
+
+    # [poll] -----------------------------------------------------------------------------------------------------------
+
+    def poll(self, timeout):
+
+        for fd, events in self.poller.poll(max(0.0, timeout) if timeout is not None else None):
+            connection = self.by_fd[fd]
+
+            if events & server.EVENT_READ:
+                self.read(connection)
+
+            if events & server.EVENT_WRITE and connection.fd in self.by_fd:
+                self.write(connection)
+
+    # [read] -----------------------------------------------------------------------------------------------------------
+
+    def read(self, connection):
+
+        try:
+            received = connection.framer.recv_into(connection.socket)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+
+            received = 0
+
+        if received == 0:
+            self.abandon(connection)
+            return
+
+        while True:
+            try:
+                frame = connection.framer.next_frame()
+            except framer.FramingError:
+                self.abandon(connection)
+                return
+
+            if frame is None:
+                break
+
+            if not connection.expected:
+                self.unexpected += 1
+                continue
+
+            request_adu, response_adu = connection.expected.popleft()
+            actual                    = frame.tobytes()
+
+            if actual == response_adu:
+                self.matched += 1
+                continue
+
+            self.mismatched += 1
+
+            if len(self.diffs) < self.options.show:
+                self.diffs.append({
+                    'request' : wirelog.to_hex(request_adu),
+                    'recorded': wirelog.to_hex(response_adu),
+                    'replayed': wirelog.to_hex(actual)
+                })
+
+        self.close_when_done(connection)
+
+    # [write] ----------------------------------------------------------------------------------------------------------
+
+    def write(self, connection):
+
+        if connection.out_buffer:
+            try:
+                sent = connection.socket.send(connection.out_buffer)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    self.abandon(connection)
+                    return
+
+                sent = 0
+
+            del connection.out_buffer[:sent]
+
+        writing = len(connection.out_buffer) > 0
+
+        if writing != connection.writing:
+            connection.writing = writing
+            self.poller.modify(connection.fd, server.EVENT_READ | server.EVENT_WRITE if writing else server.EVENT_READ)
+
+    # [outstanding] ----------------------------------------------------------------------------------------------------
+
+    def outstanding(self):
+
+        return sum(len(connection.expected) for connection in self.connections.values())
+
+
+# [main block] #########################################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='MODBUS/TCP capture replay')
+    parser.add_argument('capture', help='binary wire log, see "wireLog" in modemu.json')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1502)
+    parser.add_argument('--speed', type=float, default=1.0, help='timing factor, 2 replays twice as fast')
+    parser.add_argument('--fast', action='store_true', help='ignore the timing, as fast as the server answers')
+    parser.add_argument('--window', type=int, default=16, help='requests in flight per connection at most')
+    parser.add_argument('--show', type=int, default=10, help='mismatching responses to print')
+    parser.add_argument('--json', help='write the result to this file as json')
+
+    options = parser.parse_args()
+    result  = Replay(options).run()
+
+    print 'connections: %d, %.1f s, %.0f requests/s' % (
+        result['connections'], result['duration'], result['requests_per_s'])
+    print 'requests   : %d sent, %d matched, %d mismatched, %d missing, %d unexpected' % (
+        result['sent'], result['matched'], result['mismatched'], result['missing'], result['unexpected'])
+
+    for diff in result['diffs']:
+        print 'request : %s\nrecorded: %s\nreplayed: %s\n' % (diff['request'], diff['recorded'], diff['replayed'])
+
+    if options.json:
+        json.dump(result, open(options.json, 'w'), indent=2, sort_keys=True)
+
+    if result['mismatched'] or result['missing']:
+        sys.exit(1)
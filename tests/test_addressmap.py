@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import addressmap, globals as g, request
+
+
+# [globals] ############################################################################################################
+
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [parse] ##############################################################################################################
+
+def parse(pdu):
+
+    return request.Request(struct.pack('>HHHB', 1, 0, len(pdu) + 1, 1) + pdu)
+
+
+# [AddressMapTest] #####################################################################################################
+
+class AddressMapTest(unittest.TestCase):
+
+    # [test_windows_are_merged] ----------------------------------------------------------------------------------------
+
+    def test_windows_are_merged(self):
+
+        address_map = addressmap.AddressMap()
+
+        for first, last in ((100, 199), (0, 9), (150, 250), (10, 19), (400, 400)):
+            address_map.add(REGISTERS, first, last)
+
+        # overlapping and adjacent windows become one
+        self.assertEqual(address_map.starts[REGISTERS], [0, 100, 400])
+        self.assertEqual(address_map.ends[REGISTERS], [20, 251, 401])
+
+    # [test_contains] --------------------------------------------------------------------------------------------------
+
+    def test_contains(self):
+
+        address_map = addressmap.AddressMap()
+        address_map.add(REGISTERS, 100, 199)
+        address_map.add(REGISTERS, 300, 399)
+
+        self.assertTrue(address_map.contains(REGISTERS, 100, 100))
+        self.assertTrue(address_map.contains(REGISTERS, 399, 1))
+        self.assertFalse(address_map.contains(REGISTERS, 99, 2))
+        self.assertFalse(address_map.contains(REGISTERS, 150, 200))  # across the gap
+        self.assertFalse(address_map.contains(REGISTERS, 200, 1))
+        self.assertFalse(address_map.contains(REGISTERS, 0, 1))
+
+        # a table without windows is mapped whole
+        self.assertTrue(address_map.contains(g.TABLE_DISCRETE_OUTPUT_COILS, 65535, 1))
+
+    # [test_check] -----------------------------------------------------------------------------------------------------
+
+    def test_check(self):
+
+        address_map = addressmap.AddressMap()
+        address_map.add(REGISTERS, 100, 109)
+
+        self.assertEqual(address_map.check(parse('\x03\x00\x64\x00\x0A')), None)
+        self.assertEqual(address_map.check(parse('\x03\x00\x64\x00\x0B')), g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS)
+        self.assertEqual(address_map.check(parse('\x06\x00\x6D\x00\x01')), None)
+        self.assertEqual(address_map.check(parse('\x06\x00\x6E\x00\x01')), g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS)
+
+        # fc23 reads and writes, both ranges have to be mapped
+        self.assertEqual(address_map.check(parse('\x17\x00\x64\x00\x01\x00\x6E\x00\x01\x02\x00\x07')),
+                         g.EXCEPTION_02_ILLEGAL_DATA_ADDRESS)
+
+        # input registers and diagnostics are not restricted
+        self.assertEqual(address_map.check(parse('\x04\x00\x00\x00\x0A')), None)
+        self.assertEqual(address_map.check(parse('\x08\x00\x00\x12\x34')), None)
+
+
+# [WrittenRangeTest] ###################################################################################################
+
+class WrittenRangeTest(unittest.TestCase):
+
+    # [test_written_range] ---------------------------------------------------------------------------------------------
+
+    def test_written_range(self):
+
+        self.assertEqual(addressmap.written_range(parse('\x03\x00\x00\x00\x0A')), None)
+        self.assertEqual(addressmap.written_range(parse('\x05\x00\x07\xFF\x00')),
+                         (g.TABLE_DISCRETE_OUTPUT_COILS, 7, 8))
+        self.assertEqual(addressmap.written_range(parse('\x06\x00\x07\x00\x01')), (REGISTERS, 7, 8))
+        self.assertEqual(addressmap.written_range(parse('\x0F\x00\x07\x00\x0A\x02\x00\x00')),
+                         (g.TABLE_DISCRETE_OUTPUT_COILS, 7, 17))
+        self.assertEqual(addressmap.written_range(parse('\x10\x00\x07\x00\x02\x04\x00\x01\x00\x02')),
+                         (REGISTERS, 7, 9))
+        self.assertEqual(addressmap.written_range(parse('\x16\x00\x07\x00\xFF\x00\x00')), (REGISTERS, 7, 8))
+        self.assertEqual(addressmap.written_range(parse('\x17\x00\x00\x00\x01\x00\x20\x00\x01\x02\x00\x07')),
+                         (REGISTERS, 32, 33))
+
+
+if __name__ == "__main__":
+    unittest.main()
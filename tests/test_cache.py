@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import cache, globals as g, request, simulation, store
+
+
+# [globals] ############################################################################################################
+
+TABLE = g.TABLE_ANALOG_INPUT_REGISTERS
+
+
+# [read_request] #######################################################################################################
+
+def read_request(transaction_id, start=0, count=4):
+
+    return request.Request(struct.pack('>HHHBBHH', transaction_id, 0, 6, 1, g.FUNC_04_READ_INPUT_REGISTERS, start,
+                                       count))
+
+
+# [registers] ##########################################################################################################
+
+def registers(out):
+
+    return list(struct.unpack('>%dH' % ((len(out) - 9) / 2), str(out[9:])))
+
+
+# [ResponseCacheTest] ##################################################################################################
+
+class ResponseCacheTest(unittest.TestCase):
+
+    # [test_hit_until_written] -----------------------------------------------------------------------------------------
+
+    def test_hit_until_written(self):
+
+        response_cache = cache.ResponseCache()
+        data_store     = store.DataStore()
+
+        data_store.set_registers(TABLE, 0, [1, 2, 3, 4])
+        response_cache.response(read_request(1), data_store)
+        out = response_cache.response(read_request(2), data_store)
+
+        self.assertEqual(struct.unpack_from('>H', out)[0], 2)
+        self.assertEqual(registers(out), [1, 2, 3, 4])
+
+        data_store.set_registers(TABLE, 2, [30])
+
+        self.assertEqual(registers(response_cache.response(read_request(3), data_store)), [1, 2, 30, 4])
+        self.assertEqual(response_cache.stats(), {'entries': 1, 'hits': 1, 'misses': 2})
+
+    # [test_simulated_unit_hits_within_a_tick] -------------------------------------------------------------------------
+
+    def test_simulated_unit_hits_within_a_tick(self):
+
+        now             = [5.0]
+        unit_simulation = simulation.Simulation(1.0, epoch=0.0, clock=lambda: now[0])
+        unit_simulation.add(TABLE, 0, 9, simulation.Counter(0, 1, phase_step=1))
+
+        data_store            = store.DataStore()
+        data_store.simulation = unit_simulation
+        response_cache        = cache.ResponseCache()
+
+        self.assertEqual(registers(response_cache.response(read_request(1), data_store)), [5, 6, 7, 8])
+
+        now[0] = 5.5
+        self.assertEqual(registers(response_cache.response(read_request(2), data_store)), [5, 6, 7, 8])
+        self.assertEqual(registers(response_cache.response(read_request(3), data_store)), [5, 6, 7, 8])
+
+        now[0] = 6.0
+        self.assertEqual(registers(response_cache.response(read_request(4), data_store)), [6, 7, 8, 9])
+        self.assertEqual(response_cache.stats(), {'entries': 1, 'hits': 2, 'misses': 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import embedded, globals as g
+
+
+# [globals] ############################################################################################################
+
+COILS     = g.TABLE_DISCRETE_OUTPUT_COILS
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [frame] ##############################################################################################################
+
+def frame(unit_id, pdu):
+
+    return struct.pack('>HHHB', 1, 0, len(pdu) + 1, unit_id) + pdu
+
+
+# [MergeRangesTest] ####################################################################################################
+
+class MergeRangesTest(unittest.TestCase):
+
+    # [test_merge_ranges] ----------------------------------------------------------------------------------------------
+
+    def test_merge_ranges(self):
+
+        self.assertEqual(embedded.merge_ranges([]), [])
+        self.assertEqual(embedded.merge_ranges([(10, 12), (0, 2), (2, 4), (11, 20), (30, 31)]),
+                         [[0, 4], [10, 20], [30, 31]])
+
+
+# [NotifierTest] #######################################################################################################
+
+class NotifierTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        # never started, writes go through process and batches are delivered by calling notify
+        self.server  = embedded.EmbeddedServer(unit_ids=(1, 2))
+        self.batches = []
+
+    # [tearDown] -------------------------------------------------------------------------------------------------------
+
+    def tearDown(self):
+
+        self.server.stop()
+
+    # [test_writes_are_merged_per_table] -------------------------------------------------------------------------------
+
+    def test_writes_are_merged_per_table(self):
+
+        self.server.subscribe(self.batches.append)
+
+        self.server.process(1, frame(1, '\x10\x00\x0A\x00\x02\x04\x00\x01\x00\x02'))
+        self.server.process(1, frame(1, '\x10\x00\x0C\x00\x01\x02\x00\x03'))
+        self.server.process(1, frame(1, '\x10\x00\x0B\x00\x01\x02\x00\x09'))
+        self.server.process(1, frame(1, '\x05\x00\x03\xFF\x00'))
+        self.server.process(1, frame(1, '\x03\x00\x00\x00\x01'))                # reads are not notified
+        self.server.process(1, frame(1, '\x05\x00\x07\x00\x01'))                # nor failed writes
+
+        self.server.notify()
+        self.server.notify()
+
+        # one batch, the latest values of each merged range
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual([(unit_id, table_id, start, list(values)) for unit_id, table_id, start, values
+                          in self.batches[0]], [(1, COILS, 3, [1]), (1, REGISTERS, 10, [1, 9, 3])])
+        self.assertEqual(self.server.stats()['embedded']['writes_notified'], 4)
+
+    # [test_subscriptions_select_units_and_tables] ---------------------------------------------------------------------
+
+    def test_subscriptions_select_units_and_tables(self):
+
+        coils = []
+
+        self.server.subscribe(self.batches.append, unit_ids=[2])
+        self.server.subscribe(coils.append, table_ids=[COILS])
+
+        self.server.process(1, frame(1, '\x06\x00\x00\x00\x01'))
+        self.server.process(1, frame(2, '\x06\x00\x00\x00\x02'))
+        self.server.process(1, frame(2, '\x0F\x00\x00\x00\x03\x01\x05'))
+
+        self.server.notify()
+
+        self.assertEqual([(unit_id, table_id, start) for unit_id, table_id, start, _ in self.batches[0]],
+                         [(2, COILS, 0), (2, REGISTERS, 0)])
+        self.assertEqual([list(values) for _, _, _, values in coils[0]], [[1, 0, 1]])
+
+    # [test_nothing_queued_without_subscriptions] ----------------------------------------------------------------------
+
+    def test_nothing_queued_without_subscriptions(self):
+
+        self.server.process(1, frame(1, '\x06\x00\x00\x00\x01'))
+
+        self.assertEqual(len(self.server.written), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import framer
+
+
+# [read_request] #######################################################################################################
+
+def read_request(transaction_id, start=0, count=1):
+
+    return struct.pack('>HHHBBHH', transaction_id, 0, 6, 1, 3, start, count)
+
+
+# [write_request] ######################################################################################################
+
+def write_request(transaction_id, values):
+
+    body = struct.pack('>BBHHB', 1, 16, 0, len(values), len(values) * 2) + struct.pack('>%dH' % len(values), *values)
+
+    return struct.pack('>HHH', transaction_id, 0, len(body)) + body
+
+
+# [frames] #############################################################################################################
+
+def frames(tcp_framer):
+
+    """
+    Every complete frame `tcp_framer` holds so far, as strings.
+    """
+
+    result = []
+
+    while True:
+        frame = tcp_framer.next_frame()
+
+        if frame is None:
+            return result
+
+        result.append(frame.tobytes())
+
+
+# [FramerTest] #########################################################################################################
+
+class FramerTest(unittest.TestCase):
+
+    # [test_frame_split_across_reads] ----------------------------------------------------------------------------------
+
+    def test_frame_split_across_reads(self):
+
+        request    = write_request(7, range(100))
+        tcp_framer = framer.Framer()
+
+        for index in range(len(request) - 1):
+            tcp_framer.feed(request[index])
+            self.assertEqual(frames(tcp_framer), [])
+
+        tcp_framer.feed(request[-1])
+
+        self.assertEqual(frames(tcp_framer), [request])
+        self.assertEqual(tcp_framer.pending(), 0)
+
+    # [test_pipelined_frames_in_one_read] ------------------------------------------------------------------------------
+
+    def test_pipelined_frames_in_one_read(self):
+
+        requests   = [read_request(1), write_request(2, [5, 6]), read_request(3, 100, 125)]
+        tcp_framer = framer.Framer()
+
+        tcp_framer.feed(''.join(requests) + requests[0][:4])
+
+        self.assertEqual(frames(tcp_framer), requests)
+        self.assertEqual(tcp_framer.pending(), 4)
+
+        tcp_framer.feed(requests[0][4:])
+
+        self.assertEqual(frames(tcp_framer), [requests[0]])
+
+    # [test_partial_frame_survives_compaction] -------------------------------------------------------------------------
+
+    def test_partial_frame_survives_compaction(self):
+
+        requests   = [write_request(transaction_id, range(120)) for transaction_id in range(40)]
+        stream     = ''.join(requests)
+        tcp_framer = framer.Framer(size=framer.MAX_ADU_SIZE * 2)
+        received   = []
+
+        # odd sized reads never line up with frames, the buffer is compacted with a frame cut in two
+        for offset in range(0, len(stream), 97):
+            tcp_framer.feed(stream[offset:offset + 97])
+            received.extend(frames(tcp_framer))
+
+        self.assertEqual(received, requests)
+
+    # [test_invalid_header] --------------------------------------------------------------------------------------------
+
+    def test_invalid_header(self):
+
+        for header in (struct.pack('>HHHB', 1, 1, 6, 1), struct.pack('>HHHB', 1, 0, 1, 1),
+                       struct.pack('>HHHB', 1, 0, framer.MAX_MESSAGE_LENGTH + 1, 1)):
+            tcp_framer = framer.Framer()
+            tcp_framer.feed(header)
+
+            self.assertRaises(framer.FramingError, tcp_framer.next_frame)
+
+    # [test_overflow] --------------------------------------------------------------------------------------------------
+
+    def test_overflow(self):
+
+        tcp_framer = framer.Framer(size=framer.MAX_ADU_SIZE)
+
+        self.assertRaises(framer.FramingError, tcp_framer.feed, '\x00' * (framer.MAX_ADU_SIZE + 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
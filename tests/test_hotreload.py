@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import StringIO
+import unittest
+
+from modbus import globals as g, hotreload, slaves, store
+
+
+# [globals] ############################################################################################################
+
+COILS     = g.TABLE_DISCRETE_OUTPUT_COILS
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [image] ##############################################################################################################
+
+def image(registers=(), coils=()):
+
+    """
+    A store holding `registers` [(start, values)] and `coils` [(start, bits)], zero everywhere else.
+    """
+
+    data_store = store.DataStore(bytearray(store.STORE_SIZE))
+
+    for start, values in registers:
+        data_store.set_registers(REGISTERS, start, values)
+
+    for start, bits in coils:
+        data_store.set_bits(COILS, start, bits)
+
+    return data_store
+
+
+# [DiffTest] ###########################################################################################################
+
+class DiffTest(unittest.TestCase):
+
+    # [test_patch_counts] ----------------------------------------------------------------------------------------------
+
+    def test_patch_counts(self):
+
+        old = image(registers=[(10, [1, 2, 3]), (127, [7, 7])], coils=[(0, [1, 1])])
+        new = image(registers=[(10, [1, 20, 30]), (127, [8, 8]), (500, [5])], coils=[(1, [0, 1, 1]), (9, [1])])
+
+        patches, registers, bits = hotreload.diff_images(old, new)
+
+        # registers 127 and 128 straddle two chunks, they still make one patch
+        self.assertEqual(patches, [
+            (COILS, 0, '\x0C\x02', '\x0F\x02'),
+            (REGISTERS, 11, '\x00\x14\x00\x1E', None),
+            (REGISTERS, 127, '\x00\x08\x00\x08', None),
+            (REGISTERS, 500, '\x00\x05', None)])
+        self.assertEqual((registers, bits), (5, 5))
+
+        old.patch(patches)
+
+        self.assertEqual(old.view.tobytes(), new.view.tobytes())
+
+    # [test_equal_images] ----------------------------------------------------------------------------------------------
+
+    def test_equal_images(self):
+
+        self.assertEqual(hotreload.diff_images(image([(10, [1])]), image([(10, [1])])), ([], 0, 0))
+
+    # [test_units_sharing_images_share_one_diff] -----------------------------------------------------------------------
+
+    def test_units_sharing_images_share_one_diff(self):
+
+        old_template, new_template = image(), image(registers=[(0, [1])])
+        baseline, images           = slaves.SlaveRegistry(), slaves.SlaveRegistry()
+
+        for unit_id in (1, 2):
+            baseline.add(unit_id, store.DataStore(template=old_template))
+            images.add(unit_id, store.DataStore(template=new_template))
+
+        baseline.add(3, image())
+        images.add(4, image())
+
+        changes = hotreload.diff(baseline, images)
+
+        self.assertEqual(sorted(changes['patches']), [1, 2])
+        self.assertIs(changes['patches'][1], changes['patches'][2])
+        self.assertEqual((changes['added'], changes['removed'], changes['registers']), ([4], [3], 2))
+
+
+# [ReloaderTest] #######################################################################################################
+
+class ReloaderTest(unittest.TestCase):
+
+    # [test_forked_request_only_flags_the_reload] ----------------------------------------------------------------------
+
+    def test_forked_request_only_flags_the_reload(self):
+
+        registry = slaves.SlaveRegistry()
+        loads    = []
+
+        registry.add(1, image(registers=[(0, [1])]))
+
+        def load():
+            loads.append(len(loads) + 2)
+            images = slaves.SlaveRegistry()
+            images.add(1, image(registers=[(0, loads[-1:])]))
+            return images, {}
+
+        reloader = hotreload.Reloader(load, registry, forked=True, log=StringIO.StringIO())
+
+        # requests made from signal handlers only flag the reload, the wait loop runs it once
+        reloader.request()
+        reloader.request()
+
+        self.assertEqual(loads, [])
+
+        reloader.reload_requested()
+        reloader.reload_requested()
+
+        self.assertEqual(loads, [2])
+        self.assertEqual(reloader.stats()['reloads'], 1)
+        self.assertEqual(registry.get(1).get_registers(REGISTERS, 0, 1)[0], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from modbus import globals as g, image, slaves, store
+
+
+# [globals] ############################################################################################################
+
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [ImageTest] ##########################################################################################################
+
+class ImageTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'units.img')
+
+    # [tearDown] -------------------------------------------------------------------------------------------------------
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    # [test_units_come_back_as_saved] ----------------------------------------------------------------------------------
+
+    def test_units_come_back_as_saved(self):
+
+        template = store.DataStore(bytearray(store.STORE_SIZE))
+        template.set_registers(REGISTERS, 0, [7, 8])
+
+        registry = slaves.SlaveRegistry()
+        registry.add(1, store.DataStore(bytearray(store.STORE_SIZE)))
+        registry.get(1).set_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 5, [1])
+
+        for unit_id in range(2, 5):
+            registry.add(unit_id, store.DataStore(template=template))
+
+        image.save(registry, self.path)
+
+        # one image per distinct store, the units of a template share theirs
+        self.assertEqual(os.path.getsize(self.path), image.images_offset() + 2 * store.STORE_SIZE)
+
+        loaded = slaves.SlaveRegistry()
+        image.load(self.path, loaded)
+
+        self.assertEqual(loaded.unit_ids(), [1, 2, 3, 4])
+        self.assertEqual(loaded.get(1).get_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 4, 3), bytearray([0, 1, 0]))
+        self.assertEqual(list(loaded.get(3).get_registers(REGISTERS, 0, 2)), [7, 8])
+        self.assertIs(loaded.get(2).template, loaded.get(4).template)
+        self.assertIs(loaded.get(1).template, None)
+
+    # [test_writes_stay_out_of_the_file] -------------------------------------------------------------------------------
+
+    def test_writes_stay_out_of_the_file(self):
+
+        registry = slaves.SlaveRegistry()
+        registry.add(1, store.DataStore(bytearray(store.STORE_SIZE)))
+        image.save(registry, self.path)
+
+        loaded = slaves.SlaveRegistry()
+        image.load(self.path, loaded)
+        loaded.get(1).set_registers(REGISTERS, 0, [1])
+
+        reloaded = slaves.SlaveRegistry()
+        image.load(self.path, reloaded)
+
+        self.assertEqual(list(loaded.get(1).get_registers(REGISTERS, 0, 1)), [1])
+        self.assertEqual(list(reloaded.get(1).get_registers(REGISTERS, 0, 1)), [0])
+
+    # [test_invalid_images] --------------------------------------------------------------------------------------------
+
+    def test_invalid_images(self):
+
+        registry = slaves.SlaveRegistry()
+        registry.add(1, store.DataStore(bytearray(store.STORE_SIZE)))
+        image.save(registry, self.path)
+
+        with open(self.path, 'r+b') as output:
+            output.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertRaises(Exception, image.load, self.path, slaves.SlaveRegistry())
+
+        with open(self.path, 'r+b') as output:
+            output.write('XXXX')
+
+        self.assertRaises(Exception, image.load, self.path, slaves.SlaveRegistry())
+
+
+if __name__ == "__main__":
+    unittest.main()
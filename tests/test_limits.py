@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import unittest
+
+from modbus import limits
+
+
+# [TokenBucketTest] ####################################################################################################
+
+class TokenBucketTest(unittest.TestCase):
+
+    # [test_burst_then_rate] -------------------------------------------------------------------------------------------
+
+    def test_burst_then_rate(self):
+
+        bucket = limits.TokenBucket(2, 3, 10.0)
+
+        self.assertEqual([bucket.take(10.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.take(10.0), 0.5)
+        self.assertEqual(bucket.take(10.0), 1.0)
+
+        # 1 s refills the 2 tokens taken beyond the burst, the next request waits for a token of its own
+        self.assertFalse(bucket.full(11.0))
+        self.assertEqual(bucket.take(11.0), 0.5)
+
+    # [test_refill_stops_at_the_burst] ---------------------------------------------------------------------------------
+
+    def test_refill_stops_at_the_burst(self):
+
+        bucket = limits.TokenBucket(2, 3, 10.0)
+        bucket.take(10.0)
+
+        self.assertFalse(bucket.full(10.25))
+        self.assertTrue(bucket.full(10.5))
+
+        # a long idle time saves up no more than the burst
+        self.assertEqual([bucket.take(100.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.take(100.0), 0.5)
+
+
+# [LimitsTest] #########################################################################################################
+
+class LimitsTest(unittest.TestCase):
+
+    # [test_connections_per_ip] ----------------------------------------------------------------------------------------
+
+    def test_connections_per_ip(self):
+
+        connection_limits = limits.Limits(max_connections=3, max_connections_per_ip=2)
+
+        self.assertEqual([connection_limits.admit('10.0.0.1', count) for count in range(3)], [True, True, False])
+        self.assertTrue(connection_limits.admit('10.0.0.2', 2))
+        self.assertFalse(connection_limits.admit('10.0.0.3', 3))
+
+        connection_limits.release('10.0.0.1', 0.0)
+
+        self.assertTrue(connection_limits.admit('10.0.0.1', 2))
+        self.assertEqual(connection_limits.rejected_connections, 1)
+        self.assertEqual(connection_limits.rejected_connections_per_ip, 1)
+
+    # [test_reconnecting_gets_no_fresh_burst] --------------------------------------------------------------------------
+
+    def test_reconnecting_gets_no_fresh_burst(self):
+
+        connection_limits = limits.Limits(request_rate=1, request_burst=2)
+
+        connection_limits.admit('10.0.0.1', 0)
+        connection_limits.take('10.0.0.1', 100.0)
+        connection_limits.take('10.0.0.1', 100.0)
+        connection_limits.release('10.0.0.1', 100.0)
+        connection_limits.admit('10.0.0.1', 0)
+
+        self.assertEqual(connection_limits.take('10.0.0.1', 100.0), 1.0)
+        self.assertEqual(connection_limits.throttled, 1)
+
+    # [test_buckets_of_clients_gone_are_evicted_once_full] -------------------------------------------------------------
+
+    def test_buckets_of_clients_gone_are_evicted_once_full(self):
+
+        connection_limits = limits.Limits(request_rate=1, request_burst=2)
+
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            connection_limits.admit(ip, 0)
+            connection_limits.take(ip, 100.0)
+
+        connection_limits.take('10.0.0.2', 100.0)
+        connection_limits.release('10.0.0.1', 100.0)
+        connection_limits.release('10.0.0.2', 100.0)
+
+        self.assertEqual(sorted(connection_limits.buckets), ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+        # 10.0.0.1 refilled to full, 10.0.0.2 is not yet and 10.0.0.3 is still connected
+        connection_limits.evict_at = 0
+        connection_limits.admit('10.0.0.4', 0)
+        connection_limits.release('10.0.0.4', 101.5)
+
+        self.assertEqual(sorted(connection_limits.buckets), ['10.0.0.2', '10.0.0.3'])
+
+        # the next scan is EVICT_INTERVAL away
+        connection_limits.admit('10.0.0.4', 0)
+        connection_limits.release('10.0.0.4', 102.0)
+
+        self.assertEqual(sorted(connection_limits.buckets), ['10.0.0.2', '10.0.0.3'])
+
+        connection_limits.evict(102.0)
+        self.assertEqual(sorted(connection_limits.buckets), ['10.0.0.3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
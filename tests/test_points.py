@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import unittest
+
+from modbus import globals as g, points, store
+
+
+# [globals] ############################################################################################################
+
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [PointTypeTest] ######################################################################################################
+
+class PointTypeTest(unittest.TestCase):
+
+    # [test_byte_and_word_orders] --------------------------------------------------------------------------------------
+
+    def test_byte_and_word_orders(self):
+
+        # 0x41AC0000 is 21.5
+        for byte_order, word_order, encoded in (("big", "big", '\x41\xAC\x00\x00'),
+                                                ("little", "big", '\xAC\x41\x00\x00'),
+                                                ("big", "little", '\x00\x00\x41\xAC'),
+                                                ("little", "little", '\x00\x00\xAC\x41')):
+            point_type = points.PointType("float32", byte_order, word_order)
+
+            self.assertEqual(str(point_type.encode([21.5])), encoded, (byte_order, word_order))
+            self.assertEqual(point_type.decode(encoded), [21.5])
+
+    # [test_every_point_is_reordered] ----------------------------------------------------------------------------------
+
+    def test_every_point_is_reordered(self):
+
+        point_type = points.PointType("int64", word_order="little")
+        encoded    = point_type.encode([0x0102030405060708, -2])
+
+        self.assertEqual(str(encoded), '\x07\x08\x05\x06\x03\x04\x01\x02' + '\xFF\xFE' + '\xFF\xFF' * 3)
+        self.assertEqual(point_type.decode(encoded), [0x0102030405060708, -2])
+
+    # [test_integers_are_rounded_and_clamped] --------------------------------------------------------------------------
+
+    def test_integers_are_rounded_and_clamped(self):
+
+        self.assertEqual(points.PointType("uint16").decode(points.PointType("uint16").encode([-5, 1.6, 70000])),
+                         [0, 2, 65535])
+        self.assertEqual(points.PointType("int32").decode(points.PointType("int32").encode([-1e12, 2.4])),
+                         [-(1 << 31), 2])
+
+    # [test_invalid_types] ---------------------------------------------------------------------------------------------
+
+    def test_invalid_types(self):
+
+        self.assertRaises(Exception, points.PointType, "int8")
+        self.assertRaises(Exception, points.PointType, "int32", "middle")
+        self.assertEqual(points.create_point_type({"value": 1}), None)
+
+
+# [StoreTest] ##########################################################################################################
+
+class StoreTest(unittest.TestCase):
+
+    # [test_scattered_points_are_set_per_run] --------------------------------------------------------------------------
+
+    def test_scattered_points_are_set_per_run(self):
+
+        data_store = store.DataStore()
+        point_type = points.PointType("int32")
+
+        points.set_scattered_points(data_store, REGISTERS, point_type, [(14, 3), (10, 1), (12, 2), (20, 4)])
+
+        self.assertEqual(points.get_points(data_store, REGISTERS, 10, point_type, 3), [1, 2, 3])
+        self.assertEqual(points.get_points(data_store, REGISTERS, 16, point_type, 3), [0, 0, 4])
+        self.assertEqual(data_store.generation(REGISTERS), 4)  # two runs, two writes
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import codec, globals as g, proxy, server
+
+
+# [read_request] #######################################################################################################
+
+def read_request(transaction_id, start, count, function_code=g.FUNC_03_READ_HOLDING_REGISTERS):
+
+    return struct.pack('>HHHBBHH', transaction_id, 0, 6, 1, function_code, start, count)
+
+
+# [read_answer] ########################################################################################################
+
+def read_answer(fetch):
+
+    """
+    The upstream answer to `fetch`, every register holding its own address.
+    """
+
+    count = fetch.end - fetch.start
+    frame = struct.pack('>HHHBBB', 0, 0, 3 + count * 2, 1, fetch.key[1], count * 2) + \
+        struct.pack('>%dH' % count, *range(fetch.start, fetch.end))
+
+    return memoryview(bytearray(frame))
+
+
+# [responses] ##########################################################################################################
+
+def responses(connection):
+
+    """
+    (transaction id, PDU) of every response queued on `connection` so far.
+    """
+
+    out    = connection.out_buffer
+    result = []
+
+    while out:
+        length = codec.MBAP_HEADER.unpack_from(out)[2]
+
+        result.append((codec.TRANSACTION_ID.unpack_from(out)[0], str(out[codec.PDU_OFFSET:6 + length])))
+        out = out[6 + length:]
+
+    connection.out_buffer = bytearray()
+
+    return result
+
+
+# [Client] #############################################################################################################
+
+class Client:
+
+    """
+        Stands in for the socket of a downstream connection, nothing is ever read from or written to it.
+    """
+
+    # [fileno] ---------------------------------------------------------------------------------------------------------
+
+    def fileno(self):
+
+        return 100
+
+
+# [Proxy] ##############################################################################################################
+
+class Proxy(proxy.ProxyServer):
+
+    """
+        A proxy without upstream connections, whatever it would send upstream is kept in `sent`.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self):
+
+        proxy.ProxyServer.__init__(self, '127.0.0.1', 0, '127.0.0.1')
+
+        self.sent = []
+
+    # [send] -----------------------------------------------------------------------------------------------------------
+
+    def send(self, exchange):
+
+        self.sent.append(exchange)
+
+    # [fetches] --------------------------------------------------------------------------------------------------------
+
+    def fetches(self):
+
+        self.fetch_waiting()
+
+        sent      = self.sent
+        self.sent = []
+
+        return sent
+
+
+# [ProxyTest] ##########################################################################################################
+
+class ProxyTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        self.proxy      = Proxy()
+        self.connection = server.Connection(Client(), ('127.0.0.1', 5020), 1)
+
+    # [test_misses_of_a_round_are_merged] ------------------------------------------------------------------------------
+
+    def test_misses_of_a_round_are_merged(self):
+
+        for transaction_id, start in enumerate((20, 0, 5)):
+            self.proxy.respond(self.connection, read_request(transaction_id, start, 10))
+
+        fetches = self.proxy.fetches()
+
+        self.assertEqual([(fetch.start, fetch.end) for fetch in fetches], [(0, 15), (20, 30)])
+
+        # responses keep the order of the requests, the first one waits for the second read
+        self.proxy.answer_fetch(fetches[0], read_answer(fetches[0]))
+        self.assertEqual(responses(self.connection), [])
+
+        self.proxy.answer_fetch(fetches[1], read_answer(fetches[1]))
+        self.assertEqual(responses(self.connection), [
+            (0, '\x03\x14' + struct.pack('>10H', *range(20, 30))),
+            (1, '\x03\x14' + struct.pack('>10H', *range(0, 10))),
+            (2, '\x03\x14' + struct.pack('>10H', *range(5, 15)))])
+
+        self.proxy.respond(self.connection, read_request(3, 8, 4))
+
+        self.assertEqual(self.proxy.fetches(), [])
+        self.assertEqual(responses(self.connection), [(3, '\x03\x08' + struct.pack('>4H', 8, 9, 10, 11))])
+        self.assertEqual((self.proxy.hits, self.proxy.misses, self.proxy.upstream_reads), (1, 3, 2))
+
+    # [test_refused_merged_read_is_retried_on_its_own] -----------------------------------------------------------------
+
+    def test_refused_merged_read_is_retried_on_its_own(self):
+
+        self.proxy.respond(self.connection, read_request(1, 0, 10))
+        self.proxy.respond(self.connection, read_request(2, 10, 10))
+
+        fetch = self.proxy.fetches()[0]
+        self.proxy.answer_fetch(fetch, memoryview(bytearray(struct.pack('>HHHBBB', 0, 0, 3, 1, 0x83, 2))))
+
+        self.assertEqual([(fetch.start, fetch.end) for fetch in self.proxy.fetches()], [(0, 10), (10, 20)])
+
+    # [test_short_answer_fails_the_fetch] ------------------------------------------------------------------------------
+
+    def test_short_answer_fails_the_fetch(self):
+
+        self.proxy.respond(self.connection, read_request(1, 0, 10))
+
+        fetch = self.proxy.fetches()[0]
+        self.proxy.answer_fetch(fetch, memoryview(bytearray(struct.pack('>HHHBB', 0, 0, 2, 1, 3))))
+
+        self.assertEqual(responses(self.connection), [(1, '\x83\x0B')])
+        self.assertEqual(self.proxy.in_flight[(1, 3)], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import codec, globals as g, request, response, store
+
+
+# [device_identification] ##############################################################################################
+
+def device_identification(objects, code=g.DEVICE_ID_03_EXTENDED, object_id=0):
+
+    """
+    The fc43 response PDU of a unit identifying itself with `objects`.
+    """
+
+    frame = struct.pack('>HHHBBBBB', 1, 0, 5, 1, g.FUNC_43_ENCAPSULATED_INTERFACE_TRANSPORT,
+                        g.MEI_14_READ_DEVICE_IDENTIFICATION, code, object_id)
+    out   = response.Response(request.Request(frame), store.DataStore(), identification=objects).out()
+
+    return out[codec.PDU_OFFSET:]
+
+
+# [parse_objects] ######################################################################################################
+
+def parse_objects(pdu):
+
+    """
+    (more follows, next object id, [(object id, value)]) of a fc43 response PDU.
+    """
+
+    _, _, _, _, more_follows, next_object, count = codec.DEVICE_ID_RESPONSE.unpack_from(pdu)
+    offset                                       = codec.DEVICE_ID_RESPONSE.size
+    objects                                      = []
+
+    for _ in range(count):
+        object_id, length = codec.DEVICE_ID_OBJECT.unpack_from(pdu, offset)
+        offset           += codec.DEVICE_ID_OBJECT.size
+
+        objects.append((object_id, str(pdu[offset:offset + length])))
+        offset += length
+
+    return more_follows, next_object, objects
+
+
+# [exchange] ###########################################################################################################
+
+def exchange(pdu, data_store):
+
+    """
+    The response PDU of `data_store` to the request PDU `pdu`, sent to unit 1.
+    """
+
+    frame = struct.pack('>HHHB', 1, 0, len(pdu) + 1, 1) + pdu
+    out   = response.Response(request.Request(frame), data_store).out()
+
+    return str(out[codec.PDU_OFFSET:])
+
+
+# [DeviceIdentificationTest] ###########################################################################################
+
+class DeviceIdentificationTest(unittest.TestCase):
+
+    # [test_objects_that_do_not_fit_follow] ----------------------------------------------------------------------------
+
+    def test_objects_that_do_not_fit_follow(self):
+
+        objects = {0x00: 'a' * 200, 0x01: 'b' * 100, 0x02: '1.0'}
+        pdu     = device_identification(objects)
+
+        self.assertLessEqual(len(pdu), codec.MAX_PDU_SIZE)
+        self.assertEqual(parse_objects(pdu), (0xFF, 0x01, [(0x00, 'a' * 200)]))
+
+        pdu = device_identification(objects, object_id=0x01)
+
+        self.assertEqual(parse_objects(pdu), (0x00, 0x00, [(0x01, 'b' * 100), (0x02, '1.0')]))
+
+    # [test_an_object_too_long_by_itself_is_truncated] -----------------------------------------------------------------
+
+    def test_an_object_too_long_by_itself_is_truncated(self):
+
+        objects = {0x00: 'a' * 250, 0x01: 'b', 0x02: '1.0'}
+        pdu     = device_identification(objects)
+
+        self.assertEqual(len(pdu), codec.MAX_PDU_SIZE)
+        self.assertEqual(parse_objects(pdu), (0xFF, 0x01, [(0x00, 'a' * codec.MAX_DEVICE_ID_OBJECT_SIZE)]))
+
+        pdu = device_identification(objects, g.DEVICE_ID_04_SPECIFIC, 0x00)
+
+        self.assertEqual(len(pdu), codec.MAX_PDU_SIZE)
+        self.assertEqual(parse_objects(pdu), (0x00, 0x00, [(0x00, 'a' * codec.MAX_DEVICE_ID_OBJECT_SIZE)]))
+
+
+
+# [WriteTest] ##########################################################################################################
+
+class WriteTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        self.data_store = store.DataStore()
+
+    # [test_write_single_coil] -----------------------------------------------------------------------------------------
+
+    def test_write_single_coil(self):
+
+        self.assertEqual(exchange('\x05\x0B\xB8\xFF\x00', self.data_store), '\x05\x0B\xB8\xFF\x00')
+        self.assertEqual(self.data_store.get_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 3000, 1), bytearray([1]))
+
+        self.assertEqual(exchange('\x05\x0B\xB8\x00\x00', self.data_store), '\x05\x0B\xB8\x00\x00')
+        self.assertEqual(self.data_store.get_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 3000, 1), bytearray([0]))
+
+        # only FF00 and 0000 are coil values, nothing is written
+        data_store = store.DataStore()
+
+        self.assertEqual(exchange('\x05\x0B\xB8\x00\x01', data_store), '\x85\x03')
+        self.assertFalse(data_store.is_allocated())
+
+    # [test_write_single_register] -------------------------------------------------------------------------------------
+
+    def test_write_single_register(self):
+
+        self.assertEqual(exchange('\x06\x0F\xA0\x11\x94', self.data_store), '\x06\x0F\xA0\x11\x94')
+        self.assertEqual(list(self.data_store.get_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, 4000, 1)), [0x1194])
+
+    # [test_write_multiple_coils] --------------------------------------------------------------------------------------
+
+    def test_write_multiple_coils(self):
+
+        self.data_store.set_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 0, [1] * 16)
+
+        # 10 coils from 3 on: 1 0 1 0 0 0 0 1 then 1 1, the coils around them are kept
+        self.assertEqual(exchange('\x0F\x00\x03\x00\x0A\x02\x85\x03', self.data_store), '\x0F\x00\x03\x00\x0A')
+        self.assertEqual(self.data_store.get_bits(g.TABLE_DISCRETE_OUTPUT_COILS, 0, 16),
+                         bytearray([1, 1, 1, 1, 0, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1]))
+
+    # [test_write_multiple_registers] ----------------------------------------------------------------------------------
+
+    def test_write_multiple_registers(self):
+
+        pdu = '\x10\x0F\xA0\x00\x02\x04\x01\xF4\x03\xE8'
+
+        self.assertEqual(exchange(pdu, self.data_store), '\x10\x0F\xA0\x00\x02')
+        self.assertEqual(list(self.data_store.get_registers(g.TABLE_ANALOG_OUTPUT_REGISTERS, 4000, 2)), [500, 1000])
+
+    # [test_invalid_multiple_writes] -----------------------------------------------------------------------------------
+
+    def test_invalid_multiple_writes(self):
+
+        # byte count not matching the count, no count at all, past the end of the address space
+        self.assertEqual(exchange('\x10\x00\x00\x00\x02\x02\x00\x01', self.data_store), '\x90\x03')
+        self.assertEqual(exchange('\x0F\x00\x00\x00\x00\x00', self.data_store), '\x8F\x03')
+        self.assertEqual(exchange('\x10\xFF\xFF\x00\x02\x04\x00\x01\x00\x02', self.data_store), '\x90\x02')
+        self.assertFalse(self.data_store.is_allocated())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import struct
+import unittest
+
+from modbus import codec, framer, rtu
+
+
+# [read_request] #######################################################################################################
+
+def read_request(start, unit_id=1):
+
+    frame = struct.pack('>BBHH', unit_id, 3, start, 10)
+
+    return frame + rtu.CRC.pack(rtu.crc16(frame))
+
+
+# [Client] #############################################################################################################
+
+class Client:
+
+    """
+        Stands in for a socket: hands out `data` as recv is asked for it, `size` bytes at most per call.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, data):
+
+        self.data = data
+
+    # [recv] -----------------------------------------------------------------------------------------------------------
+
+    def recv(self, size):
+
+        chunk     = self.data[:size]
+        self.data = self.data[size:]
+
+        return chunk
+
+
+# [RtuTest] ############################################################################################################
+
+class RtuTest(unittest.TestCase):
+
+    # [test_crc] -------------------------------------------------------------------------------------------------------
+
+    def test_crc(self):
+
+        self.assertEqual(rtu.crc16('\x01\x03\x00\x00\x00\x0A'), 0xCDC5)
+        self.assertEqual(read_request(0)[-2:], '\xC5\xCD')  # low byte first on the wire
+        self.assertEqual(rtu.crc16(read_request(0)), 0)
+
+    # [test_frame_split_across_reads] ----------------------------------------------------------------------------------
+
+    def test_frame_split_across_reads(self):
+
+        request    = read_request(100, unit_id=7)
+        rtu_framer = rtu.RtuFramer()
+
+        for byte in request[:-1]:
+            rtu_framer.feed(byte)
+            self.assertEqual(rtu_framer.next_frame(), None)
+
+        rtu_framer.feed(request[-1])
+        frame = rtu_framer.next_frame()
+
+        self.assertEqual(codec.MBAP_HEADER.unpack_from(frame), (0, 0, 6, 7))
+        self.assertEqual(str(frame[codec.PDU_OFFSET:]), request[1:-2])
+        self.assertEqual(rtu_framer.pending(), 0)
+
+    # [test_crc_mismatch] ----------------------------------------------------------------------------------------------
+
+    def test_crc_mismatch(self):
+
+        rtu_framer = rtu.RtuFramer()
+        rtu_framer.feed(read_request(0)[:-1] + '\x00' + read_request(1))
+
+        self.assertRaises(framer.FramingError, rtu_framer.next_frame)
+        self.assertEqual(rtu_framer.crc_errors, 1)
+        self.assertEqual(rtu_framer.pending(), 0)
+
+    # [test_recv_into_reads_only_the_room_left] ------------------------------------------------------------------------
+
+    def test_recv_into_reads_only_the_room_left(self):
+
+        client     = Client(''.join(read_request(start) for start in range(1000)))
+        rtu_framer = rtu.RtuFramer()
+
+        self.assertEqual(rtu_framer.recv_into(client), rtu.BUFFER_SIZE)
+
+        # full: nothing more is received until its frames are taken out
+        self.assertRaises(framer.FramingError, rtu_framer.recv_into, client)
+        self.assertEqual(len(list(iter(rtu_framer.next_frame, None))), rtu.BUFFER_SIZE / 8)
+
+        self.assertEqual(rtu_framer.recv_into(client), 8000 - rtu.BUFFER_SIZE)
+        self.assertEqual(len(list(iter(rtu_framer.next_frame, None))), 1000 - rtu.BUFFER_SIZE / 8)
+
+    # [test_conversions] -----------------------------------------------------------------------------------------------
+
+    def test_conversions(self):
+
+        adu = rtu.to_mbap(bytearray(read_request(5)))
+
+        self.assertEqual(str(rtu.to_rtu(adu)), read_request(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
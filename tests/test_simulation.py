@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import json
+import os
+import unittest
+
+from modbus import globals as g, points, simulation, store
+
+
+# [globals] ############################################################################################################
+
+TABLE = g.TABLE_ANALOG_INPUT_REGISTERS
+
+GENERATORS = [
+    {"type": "sine", "amplitude": 1000, "offset": 2000, "period": 60, "phaseStep": 0.5},
+    {"type": "ramp", "low": 0, "high": 1000, "period": 10, "phaseStep": 0.25},
+    {"type": "counter", "rate": 3, "phaseStep": 1.5},
+    {"type": "toggle", "period": 2, "phaseStep": 0.125},
+    {"type": "noise", "amplitude": 20},
+    {"type": "sum", "generators": [{"type": "sine", "amplitude": 10, "offset": 100, "period": 7, "phaseStep": 1},
+                                   {"type": "noise", "amplitude": 5}]}
+]
+
+
+# [simulated_store] ####################################################################################################
+
+def simulated_store(spec, first=1000, last=1009, point_type=None, now=123.45):
+
+    unit_simulation = simulation.Simulation(0.1, epoch=0.0, clock=lambda: now)
+    unit_simulation.add(TABLE, first, last, simulation.create_generator(spec, first, last, 1), point_type)
+
+    data_store            = store.DataStore()
+    data_store.simulation = unit_simulation
+
+    return data_store
+
+
+# [SimulationTest] #####################################################################################################
+
+class SimulationTest(unittest.TestCase):
+
+    # [test_value_does_not_depend_on_the_read_window] ------------------------------------------------------------------
+
+    def test_value_does_not_depend_on_the_read_window(self):
+
+        for spec in GENERATORS:
+            whole  = simulated_store(spec).get_registers(TABLE, 1000, 10)[5]
+            alone  = simulated_store(spec).get_registers(TABLE, 1005, 1)[0]
+            shared = simulated_store(spec).get_registers(TABLE, 1003, 4)[2]
+
+            self.assertEqual(whole, alone, spec["type"])
+            self.assertEqual(whole, shared, spec["type"])
+
+    # [test_phase_step_counts_from_the_range] --------------------------------------------------------------------------
+
+    def test_phase_step_counts_from_the_range(self):
+
+        spec   = {"type": "counter", "rate": 1, "phaseStep": 10}
+        values = simulated_store(spec, now=0.0).get_registers(TABLE, 1000, 4)
+
+        self.assertEqual(list(values), [0, 10, 20, 30])
+        self.assertEqual(simulated_store(spec, now=0.0).get_registers(TABLE, 1002, 1)[0], 20)
+
+    # [test_points_do_not_depend_on_the_read_window] -------------------------------------------------------------------
+
+    def test_points_do_not_depend_on_the_read_window(self):
+
+        spec       = {"type": "sine", "amplitude": 10.0, "offset": 20.0, "period": 30, "phaseStep": 0.5}
+        point_type = points.create_point_type({"dataType": "float32"})
+        whole      = simulated_store(spec, 1200, 1219, point_type).register_bytes(TABLE, 1200, 20)
+        alone      = simulated_store(spec, 1200, 1219, point_type).register_bytes(TABLE, 1206, 2)
+
+        self.assertEqual(whole[12:16], alone)
+
+    # [test_values_hold_within_a_tick] ---------------------------------------------------------------------------------
+
+    def test_values_hold_within_a_tick(self):
+
+        now             = [5.0]
+        unit_simulation = simulation.Simulation(1.0, epoch=0.0, clock=lambda: now[0])
+        unit_simulation.add(TABLE, 0, 0, simulation.Counter(0, 1))
+
+        data_store            = store.DataStore()
+        data_store.simulation = unit_simulation
+
+        self.assertEqual(data_store.get_registers(TABLE, 0, 1)[0], 5)
+
+        now[0] = 5.9
+        self.assertEqual(data_store.get_registers(TABLE, 0, 1)[0], 5)
+
+        now[0] = 6.0
+        self.assertEqual(data_store.get_registers(TABLE, 0, 1)[0], 6)
+
+
+    # [test_generator_values] ------------------------------------------------------------------------------------------
+
+    def test_generator_values(self):
+
+        ramp   = {"type": "ramp", "low": 100, "high": 200, "period": 10, "phaseStep": 2.5}
+        sine   = {"type": "sine", "amplitude": 1000, "offset": 2000, "period": 8, "phaseStep": 2}
+        toggle = {"type": "toggle", "period": 4, "duty": 0.25, "phaseStep": 1}
+
+        self.assertEqual(list(simulated_store(ramp, now=1.0).get_registers(TABLE, 1000, 4)), [110, 135, 160, 185])
+        self.assertEqual(list(simulated_store(sine, now=0.0).get_registers(TABLE, 1000, 4)), [2000, 3000, 2000, 1000])
+        self.assertEqual(list(simulated_store(toggle, now=0.0).get_registers(TABLE, 1000, 5)), [1, 0, 0, 0, 1])
+
+    # [test_values_are_clamped_to_registers] ---------------------------------------------------------------------------
+
+    def test_values_are_clamped_to_registers(self):
+
+        spec   = {"type": "sine", "amplitude": 40000, "offset": 30000, "period": 4, "phaseStep": 1}
+        values = simulated_store(spec, now=0.0).get_registers(TABLE, 1000, 4)
+
+        self.assertEqual(list(values), [30000, 65535, 30000, 0])
+
+    # [test_bits_are_simulated] ----------------------------------------------------------------------------------------
+
+    def test_bits_are_simulated(self):
+
+        unit_simulation = simulation.Simulation(0.1, epoch=0.0, clock=lambda: 0.0)
+        unit_simulation.add(g.TABLE_DISCRETE_INPUT_CONTACTS, 3, 10, simulation.Toggle(2, 0.5, 0.5, 3))
+
+        data_store            = store.DataStore()
+        data_store.simulation = unit_simulation
+
+        self.assertEqual(data_store.get_packed_bits(g.TABLE_DISCRETE_INPUT_CONTACTS, 3, 8), bytearray([0x33]))
+
+    # [test_random_walk_stays_within_its_bounds] -----------------------------------------------------------------------
+
+    def test_random_walk_stays_within_its_bounds(self):
+
+        spec = {"type": "randomWalk", "step": 50, "low": 900, "high": 1100, "start": 1000}
+        now  = [0.0]
+
+        def walk():
+
+            unit_simulation = simulation.Simulation(1.0, epoch=0.0, clock=lambda: now[0])
+            unit_simulation.add(TABLE, 0, 9, simulation.create_generator(spec, 0, 9, 7))
+
+            data_store            = store.DataStore()
+            data_store.simulation = unit_simulation
+
+            return data_store
+
+        first, second = walk(), walk()
+
+        for tick in (1, 2, 5, 30, 1000):
+            now[0] = tick
+            values = first.get_registers(TABLE, 0, 10)
+
+            self.assertEqual(values, second.get_registers(TABLE, 0, 10))
+            self.assertTrue(all(900 <= value <= 1100 for value in values), values)
+
+    # [test_shared_random_walk_is_one_walk_for_every_process] ----------------------------------------------------------
+
+    def test_shared_random_walk_is_one_walk_for_every_process(self):
+
+        # 20 steps at once are bridged by a gaussian step, 10 and 10 more are replayed one by one
+        walk, alone = [simulation.RandomWalk(0, 9, 50, 0, 2000, seed=7) for _ in range(2)]
+        walk.share()
+
+        read_fd, write_fd = os.pipe()
+        pid               = os.fork()
+
+        if pid == 0:
+            try:
+                walk.values(10.0, 0, 10)
+                os.write(write_fd, json.dumps(walk.values(20.0, 0, 10)))
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+        advanced = json.loads(os.read(read_fd, 4096))
+
+        os.close(read_fd)
+        os.close(write_fd)
+
+        self.assertEqual(walk.values(20.0, 0, 10), advanced)
+        self.assertNotEqual(alone.values(20.0, 0, 10), advanced)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import random
+import unittest
+
+from modbus import globals as g, store
+
+
+# [globals] ############################################################################################################
+
+COILS     = g.TABLE_DISCRETE_OUTPUT_COILS
+REGISTERS = g.TABLE_ANALOG_OUTPUT_REGISTERS
+
+
+# [pack] ###############################################################################################################
+
+def pack(bits):
+
+    """
+    Reference packing of a fc01 / fc02 response: 8 bits per byte, LSB first, unused high bits zero.
+    """
+
+    packed = bytearray((len(bits) + 7) / 8)
+
+    for index, bit in enumerate(bits):
+        if bit:
+            packed[index / 8] |= 1 << (index % 8)
+
+    return packed
+
+
+# [TornView] ###########################################################################################################
+
+class TornView:
+
+    """
+        Stands in for the view of a store: the first slice taken out of it is torn, half old and half new values, and
+        the write it was racing with lands right after - its generation moved on by `bump`.
+    """
+
+    # [constructor] ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    def __init__(self, data_store, table_id, torn, written, bump):
+
+        self.data_store = data_store
+        self.view       = data_store.view
+        self.table_id   = table_id
+        self.torn       = torn
+        self.written    = written
+        self.bump       = bump
+        self.slices     = 0
+
+    # [__getitem__] ----------------------------------------------------------------------------------------------------
+
+    def __getitem__(self, key):
+
+        self.slices += 1
+
+        if self.slices > 1:
+            return self.view[key]
+
+        self.view[key] = self.written
+        self.data_store.generations[self.table_id] += self.bump
+
+        return memoryview(self.torn)
+
+
+# [BitsTest] ###########################################################################################################
+
+class BitsTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        rng             = random.Random(1)
+        self.bits       = bytearray(rng.randint(0, 1) for _ in range(4096))
+        self.data_store = store.DataStore(bytearray(store.STORE_SIZE))
+
+        self.data_store.set_bits(COILS, 0, self.bits)
+
+    # [test_packed_bits_at_any_start] ----------------------------------------------------------------------------------
+
+    def test_packed_bits_at_any_start(self):
+
+        for start in range(0, 24):
+            for count in (1, 7, 8, 9, 15, 16, 17, 63, 64, 65, 2000):
+                expected = pack(self.bits[start:start + count])
+
+                self.assertEqual(self.data_store.get_packed_bits(COILS, start, count), expected, (start, count))
+
+    # [test_bits_at_any_start] -----------------------------------------------------------------------------------------
+
+    def test_bits_at_any_start(self):
+
+        for start in range(0, 24):
+            for count in (1, 7, 8, 9, 17, 2000):
+                self.assertEqual(self.data_store.get_bits(COILS, start, count), self.bits[start:start + count])
+
+    # [test_set_bits_keeps_the_neighbours] -----------------------------------------------------------------------------
+
+    def test_set_bits_keeps_the_neighbours(self):
+
+        self.data_store.set_bits(COILS, 13, [1, 0, 1])
+        self.bits[13:16] = bytearray([1, 0, 1])
+
+        self.assertEqual(self.data_store.get_bits(COILS, 0, 64), self.bits[:64])
+
+    # [test_last_byte_of_the_address_space] ----------------------------------------------------------------------------
+
+    def test_last_byte_of_the_address_space(self):
+
+        self.data_store.set_bits(COILS, store.TABLE_SIZE - 3, [1, 1, 1])
+
+        self.assertEqual(self.data_store.get_packed_bits(COILS, store.TABLE_SIZE - 3, 3), bytearray([0x07]))
+        self.assertRaises(Exception, self.data_store.get_packed_bits, COILS, store.TABLE_SIZE - 3, 4)
+
+
+# [CopyOnWriteTest] ####################################################################################################
+
+class CopyOnWriteTest(unittest.TestCase):
+
+    # [test_stores_share_their_template_until_written] -----------------------------------------------------------------
+
+    def test_stores_share_their_template_until_written(self):
+
+        template = store.DataStore(bytearray(store.STORE_SIZE))
+        template.set_registers(REGISTERS, 0, [1, 2, 3])
+
+        first  = store.DataStore(template=template)
+        second = store.DataStore(template=template)
+
+        self.assertFalse(first.is_allocated())
+        self.assertEqual(list(first.get_registers(REGISTERS, 0, 3)), [1, 2, 3])
+
+        first.set_registers(REGISTERS, 1, [20])
+        first.set_bits(COILS, 5, [1])
+
+        self.assertTrue(first.is_allocated())
+        self.assertFalse(second.is_allocated())
+        self.assertEqual(list(first.get_registers(REGISTERS, 0, 3)), [1, 20, 3])
+        self.assertEqual(list(second.get_registers(REGISTERS, 0, 3)), [1, 2, 3])
+        self.assertEqual(list(template.get_registers(REGISTERS, 0, 3)), [1, 2, 3])
+        self.assertEqual(second.get_bits(COILS, 5, 1), bytearray([0]))
+
+    # [test_template_writes_show_through_until_detached] ---------------------------------------------------------------
+
+    def test_template_writes_show_through_until_detached(self):
+
+        template = store.DataStore(bytearray(store.STORE_SIZE))
+        unit     = store.DataStore(template=template)
+
+        template.set_registers(REGISTERS, 0, [7])
+        self.assertEqual(unit.get_registers(REGISTERS, 0, 1)[0], 7)
+        self.assertEqual(unit.generation(REGISTERS), template.generation(REGISTERS))
+
+        unit.mask_register(REGISTERS, 1, 0xFFFF, 0)
+        template.set_registers(REGISTERS, 0, [8])
+
+        self.assertEqual(unit.get_registers(REGISTERS, 0, 1)[0], 7)
+
+    # [test_zero_store_is_never_written] -------------------------------------------------------------------------------
+
+    def test_zero_store_is_never_written(self):
+
+        unit = store.DataStore()
+        unit.set_registers(REGISTERS, 0, [0xFFFF])
+
+        self.assertEqual(store.DataStore().get_registers(REGISTERS, 0, 1)[0], 0)
+        self.assertEqual(store.ZERO_STORE.generations, [0] * store.TABLE_COUNT)
+
+
+# [SeqlockTest] ########################################################################################################
+
+class SeqlockTest(unittest.TestCase):
+
+    # [test_writes_keep_the_generation_even] ---------------------------------------------------------------------------
+
+    def test_writes_keep_the_generation_even(self):
+
+        data_store = store.DataStore(bytearray(store.STORE_SIZE))
+
+        data_store.set_registers(REGISTERS, 0, [1, 2])
+        data_store.set_bits(COILS, 3, [1])
+        data_store.mask_register(REGISTERS, 0, 0, 5)
+        data_store.write_read_registers(REGISTERS, 0, '\x00\x09', 0, 1)
+        data_store.patch([(REGISTERS, 0, '\x00\x01', None), (REGISTERS, 8, '\x00\x02', None)])
+
+        self.assertEqual(data_store.generation(REGISTERS), 8)
+        self.assertEqual(data_store.generation(COILS), 2)
+
+    # [test_read_racing_a_write_is_taken_again] ------------------------------------------------------------------------
+
+    def test_read_racing_a_write_is_taken_again(self):
+
+        data_store = store.DataStore(bytearray(store.STORE_SIZE))
+        data_store.set_registers(REGISTERS, 0, [1, 1])
+
+        offset          = store.TABLE_OFFSETS[REGISTERS]
+        data_store.view = TornView(data_store, REGISTERS, '\x00\x02\x00\x01', '\x00\x02\x00\x02', 2)
+
+        self.assertEqual(data_store.snapshot(REGISTERS, offset, offset + 4), '\x00\x02\x00\x02')
+        self.assertEqual(data_store.view.slices, 2)
+
+    # [test_read_waits_for_a_write_in_progress] ------------------------------------------------------------------------
+
+    def test_read_waits_for_a_write_in_progress(self):
+
+        data_store = store.DataStore(bytearray(store.STORE_SIZE))
+        data_store.set_registers(REGISTERS, 0, [1, 1])
+
+        offset                             = store.TABLE_OFFSETS[REGISTERS]
+        data_store.generations[REGISTERS] += 1  # a writer is half way through
+        data_store.view                    = TornView(data_store, REGISTERS, '\x00\x02\x00\x01', '\x00\x02\x00\x02', 1)
+
+        self.assertEqual(data_store.snapshot(REGISTERS, offset, offset + 4), '\x00\x02\x00\x02')
+        self.assertEqual(data_store.view.slices, 2)
+        self.assertEqual(data_store.generation(REGISTERS), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+# [dependencies] #######################################################################################################
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from modbus import request, wirelog
+
+
+# [read_request] #######################################################################################################
+
+def read_request(transaction_id, unit_id=1, function_code=3, start=0):
+
+    return struct.pack('>HHHBBHH', transaction_id, 0, 6, unit_id, function_code, start, 1)
+
+
+# [WireLogTest] ########################################################################################################
+
+class WireLogTest(unittest.TestCase):
+
+    # [setUp] ----------------------------------------------------------------------------------------------------------
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'capture.wire')
+
+    # [tearDown] -------------------------------------------------------------------------------------------------------
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    # [capture] --------------------------------------------------------------------------------------------------------
+
+    def capture(self, exchanges, **options):
+
+        wire_log = wirelog.WireLog(self.path, lossless=True, **options)
+
+        for connection_id, frame in exchanges:
+            wire_log.log(connection_id, request.Request(frame), frame, frame[:7] + '\x83\x02')
+
+        wire_log.close()
+
+        return [(connection_id, request_adu, response_adu)
+                for _, connection_id, request_adu, response_adu in wirelog.read_records(self.path)]
+
+    # [test_records_come_back_in_order] --------------------------------------------------------------------------------
+
+    def test_records_come_back_in_order(self):
+
+        frames = [(1, read_request(1)), (2, read_request(1)), (1, read_request(2))]
+
+        self.assertEqual(self.capture(frames), [(connection_id, frame, frame[:7] + '\x83\x02')
+                                                for connection_id, frame in frames])
+
+    # [test_filters_and_sampling] --------------------------------------------------------------------------------------
+
+    def test_filters_and_sampling(self):
+
+        frames = [(1, read_request(transaction_id, unit_id=transaction_id % 2 + 1, start=transaction_id * 10))
+                  for transaction_id in range(8)]
+
+        records = self.capture(frames, unit_ids=[1], addresses=[(0, 40)], sample_every=2)
+
+        # units 1 at 0, 20 and 40 match, every other one is logged
+        self.assertEqual([record[1] for record in records], [frames[0][1], frames[4][1]])
+
+    # [test_truncated_record_ends_the_capture] -------------------------------------------------------------------------
+
+    def test_truncated_record_ends_the_capture(self):
+
+        self.capture([(1, read_request(1)), (1, read_request(2))])
+
+        with open(self.path, 'r+b') as output:
+            output.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertEqual([record[2] for record in wirelog.read_records(self.path)], [read_request(1)])
+
+        with open(self.path, 'r+b') as output:
+            output.truncate(len(wirelog.FILE_HEADER) + wirelog.RECORD.size - 1)
+
+        self.assertEqual(list(wirelog.read_records(self.path)), [])
+
+    # [test_not_a_capture] ---------------------------------------------------------------------------------------------
+
+    def test_not_a_capture(self):
+
+        with open(self.path, 'wb') as output:
+            output.write('not a capture')
+
+        self.assertRaises(Exception, list, wirelog.read_records(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()